@@ -1,4 +1,8 @@
+import argparse
+import atexit
 import logging
+import logging.handlers
+import queue
 
 import calendar_control
 
@@ -6,36 +10,88 @@ fmt_str = "%(levelname)s:%(asctime)s::%(module)s:%(funcName)s: %(message)s"
 formatter = logging.Formatter(fmt_str)
 
 logger = logging.getLogger('main')
-logger.setLevel(logging.DEBUG)
+s_logger = logging.getLogger("smartsheet.smartsheet")
 
-d_file_handler = logging.FileHandler("api_and_calendar.log")
-d_file_handler.setLevel(logging.DEBUG)
-d_file_handler.setFormatter(formatter)
+_listener = None
 
-i_file_handler = logging.FileHandler("calendar.log")
-i_file_handler.setLevel(logging.INFO)
-i_file_handler.setFormatter(formatter)
 
-stream_handler = logging.StreamHandler()
-stream_handler.setLevel(logging.INFO)
-stream_handler.setFormatter(formatter)
+def setup_logging() -> None:
+    """Sends the pipelines' and the SDK's log records to the log files and the console
+    Pipeline loggers ('main.map', ...) get the levels in the logging
+    setting's pipeline_levels. With queue on, records are only put on a
+    queue by the logging thread; a background listener writes them.
+    Does nothing if logging is already set up.
+    """
+    global _listener
+    if logger.handlers:
+        return
+    from settings import get_settings
+    settings = get_settings()['logging']
+    logger.setLevel(logging.DEBUG)
+    s_logger.setLevel(logging.INFO)
+    for pipeline, level in (settings['pipeline_levels'] or {}).items():
+        logging.getLogger(f'main.{pipeline}').setLevel(level)
 
-logger.addHandler(i_file_handler)
-logger.addHandler(d_file_handler)
-logger.addHandler(stream_handler)
+    d_file_handler = logging.FileHandler("api_and_calendar.log")  # also gets the SDK's records
+    d_file_handler.setLevel(logging.DEBUG)
 
-s_file_handler = logging.FileHandler("api_and_calendar.log")
-s_file_handler.setLevel(logging.INFO)
-s_file_handler.setFormatter(formatter)
+    i_file_handler = logging.FileHandler("calendar.log")
+    i_file_handler.setLevel(logging.INFO)
+    i_file_handler.addFilter(logging.Filter('main'))
 
-s_logger = logging.getLogger("smartsheet.smartsheet")
-s_logger.addHandler(s_file_handler)
-s_logger.setLevel(logging.INFO)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.INFO)
+    stream_handler.addFilter(logging.Filter('main'))
+
+    handlers = [i_file_handler, d_file_handler, stream_handler]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if settings['queue']:
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # writes whatever is still queued
+        handlers = [logging.handlers.QueueHandler(log_queue)]
+    for handler in handlers:
+        logger.addHandler(handler)
+        s_logger.addHandler(handler)
 
 
-def run():
-    calendar_control.run()
+def run(pipelines: list = None, daemon: bool = False, plan: str = None, execute: str = None, force: bool = False,
+        serve_feeds: bool = False):
+    # only the modules of the pipelines (and the mode) that are used get imported
+    setup_logging()
+    pipelines = set(pipelines) if pipelines else None
+    if daemon:
+        import daemon as daemon_mode
+        daemon_mode.serve()
+    elif plan:
+        import planner
+        planner.make_plan(plan, pipelines)
+    elif execute:
+        import planner
+        planner.execute_plan(execute, force=force)
+    elif serve_feeds:
+        import feed
+        feed.serve()
+    else:
+        calendar_control.run(pipelines)
 
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(description="Builds the Smartsheet calendars from the sheets in sheet_id.yaml")
+    parser.add_argument('--pipeline', action='append', choices=list(calendar_control.PIPELINES), dest='pipelines',
+                        help="only run this pipeline (can be given more than once); by default all of them run")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--daemon', action='store_true',
+                      help="keep running and update the calendars when webhooks report changes")
+    mode.add_argument('--plan', metavar='PLAN_FILE',
+                      help="write nothing; save every write a run would make, with its estimated cost")
+    mode.add_argument('--execute', metavar='PLAN_FILE', help="send the writes saved by --plan")
+    mode.add_argument('--serve-feeds', action='store_true',
+                      help="serve the calendar feeds written by the runs over HTTP (see the feed setting)")
+    parser.add_argument('--force', action='store_true',
+                        help="with --execute, send the writes even if the sheets changed since the plan was made")
+    args = parser.parse_args()
+    run(args.pipelines, daemon=args.daemon, plan=args.plan, execute=args.execute, force=args.force,
+        serve_feeds=args.serve_feeds)
@@ -0,0 +1,66 @@
+"""Concurrent API calls over the shared, pooled Smartsheet client
+
+The SDK is built on a blocking requests session, so each call runs on a
+worker thread with asyncio.to_thread and the event loop only schedules
+them. Every request the shared client sends takes one of a process-wide
+set of slots, sized by the api_concurrency setting, while it is on the
+wire (see take_slots), so that many requests at most are in flight at
+once across every pipeline, however they were made; the shared client's
+connection pool has the same size, so each request in flight gets a
+kept-alive connection of its own.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+
+import smartsheet
+
+from settings import get_settings
+
+
+@lru_cache(maxsize=None)
+def api_slots() -> threading.BoundedSemaphore:
+    return threading.BoundedSemaphore(get_settings()['api_concurrency'])
+
+
+def take_slots(smart: smartsheet.Smartsheet) -> smartsheet.Smartsheet:
+    """Makes every request the client sends wait for a free api slot
+    The slot is only held while the request is sent, so a call can make
+    API calls of its own (or wait on other calls) without holding one.
+    """
+    session = smart._session
+    if getattr(session, 'slotted', False):
+        return smart
+    send = session.send
+
+    def slotted_send(request, **kwargs):
+        with api_slots():
+            return send(request, **kwargs)
+
+    session.send = slotted_send
+    session.slotted = True
+    return smart
+
+
+async def gather(calls: list) -> list:
+    return await asyncio.gather(*(asyncio.to_thread(func) for func in calls))
+
+
+def run_concurrently(calls: list) -> list:
+    """Runs independent calls at the same time and waits for all of them
+    calls is a list of zero-argument callables, usually functools.partial
+    objects wrapping an SDK method, or functions that make API calls of
+    their own. Returns their results in the same order; the first
+    exception raised by any call is re-raised.
+    """
+    if len(calls) <= 1:
+        return [func() for func in calls]
+    return asyncio.run(gather(calls))
+
+
+def run_in_order(calls: list) -> list:
+    """Runs calls that depend on each other one after another
+    A group of them can be one of the calls of run_concurrently.
+    Returns their results in the same order.
+    """
+    return [func() for func in calls]
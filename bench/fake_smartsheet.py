@@ -0,0 +1,519 @@
+"""Offline stand-in for the parts of the Smartsheet API this project uses
+
+Serves get_sheet, get_sheet_version, get_columns, add_rows, update_rows,
+delete_rows and copy_rows for sheets kept in memory, close enough to the real API
+that the SDK and the calendar pipelines can't tell the difference. Every
+call is counted per endpoint along with the bytes sent and received, so
+benchmarks can see exactly what a run costs.
+
+Run it on its own with
+    python -m bench.fake_smartsheet --port 8080
+and point the tool at it with SMARTSHEET_API_BASE=http://127.0.0.1:8080/2.0
+
+Admin endpoints (outside /2.0):
+    POST /_admin/generate   {"map": 500, "intake": 500, "request": 500} -> {SHEET NAME: SHEET ID}
+    GET  /_admin/stats      -> per-endpoint call counts and bytes
+    POST /_admin/reset      clears the stats
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/2.0'
+
+ERRORS = {  # {ERROR CODE: (HTTP STATUS, MESSAGE)}
+    1006: (404, 'Not Found'),
+    1008: (400, 'Unable to parse request.'),
+    1036: (400, 'The columnId {} is invalid.'),
+    1062: (400, 'Invalid row location.'),
+    4003: (429, 'Rate limit exceeded.'),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, *args):
+        self.code = code
+        self.status, message = ERRORS[code]
+        super().__init__(message.format(*args))
+
+    def to_dict(self) -> dict:
+        return {'errorCode': self.code, 'message': str(self), 'refId': 'fake'}
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeSmartsheet:
+    """In-memory sheets plus the API operations on them
+
+    A sheet is {'id', 'name', 'version', 'columns': [COLUMN DICTS],
+    'rows': [ROW DICTS in sheet order]}. A stored row is {'id',
+    'parentId', 'format', 'expanded', 'modifiedAt', 'cells': {COLUMN ID:
+    CELL DICT}}; row numbers and sibling ids are worked out when the
+    sheet is rendered, the same way the API reports them.
+    """
+
+    def __init__(self):
+        self.sheets = {}
+        self.ids = count(1_000_000_000_001, 7919)
+        self.lock = threading.RLock()
+
+    def new_id(self) -> int:
+        return next(self.ids)
+
+    def add_sheet(self, name: str, columns: list, rows: list = ()) -> int:
+        # columns are {'title', 'type', 'hidden'?}; rows are {'parent': INDEX?, 'format'?, 'cells': {TITLE: VALUE}},
+        # where a list value is stored as a multi-picklist
+        sheet_id = self.new_id()
+        columns = [{'id': self.new_id(), 'index': index, 'hidden': False, **column}
+                   for index, column in enumerate(columns)]
+        columns[0]['primary'] = True
+        by_title = {column['title']: column['id'] for column in columns}
+        stored_rows = []
+        for row in rows:
+            parent = row.get('parent')
+            stored_rows.append({
+                'id': self.new_id(),
+                'parentId': stored_rows[parent]['id'] if parent is not None else None,
+                'format': row.get('format'),
+                'expanded': True,
+                'modifiedAt': now(),
+                'cells': {by_title[title]: make_cell(None, {'values': value}) if isinstance(value, list)
+                          else make_cell(value) for title, value in row['cells'].items()},
+            })
+        self.sheets[sheet_id] = {'id': sheet_id, 'name': name, 'version': 1, 'columns': columns, 'rows': stored_rows}
+        return sheet_id
+
+    def sheet(self, sheet_id: int) -> dict:
+        if sheet_id not in self.sheets:
+            raise ApiError(1006)
+        return self.sheets[sheet_id]
+
+    # --- reads ---
+
+    def get_sheet(self, sheet_id: int, query: dict) -> dict:
+        sheet = self.sheet(sheet_id)
+        include = set(query.get('include', '').split(','))
+        level = int(query.get('level', 0) or 0)
+        columns = sheet['columns']
+        if column_ids := query.get('columnIds'):
+            wanted = {int(column_id) for column_id in column_ids.split(',')}
+            columns = [column for column in columns if column['id'] in wanted]
+
+        rows = self.render_rows(sheet, columns, include, level)
+        if since := query.get('rowsModifiedSince'):
+            rows = [row for row in rows if row['modifiedAt'] >= since]
+        if row_ids := query.get('rowIds'):
+            wanted = {int(row_id) for row_id in row_ids.split(',')}
+            rows = [row for row in rows if row['id'] in wanted]
+        # like the API, a rowsModifiedSince fetch still reports the whole sheet's row count
+        total = len(rows) if row_ids and not since else len(sheet['rows'])
+        if page_size := query.get('pageSize'):
+            page_size, page = int(page_size), int(query.get('page', 1))
+            rows = rows[(page - 1) * page_size:page * page_size]
+
+        return {'id': sheet['id'], 'name': sheet['name'], 'version': sheet['version'], 'totalRowCount': total,
+                'columns': [render_column(column, level) for column in columns], 'rows': rows}
+
+    def get_columns(self, sheet_id: int, query: dict) -> dict:
+        sheet = self.sheet(sheet_id)
+        level = int(query.get('level', 0) or 0)
+        columns = [render_column(column, level) for column in sheet['columns']]
+        return {'pageNumber': 1, 'pageSize': len(columns), 'totalPages': 1, 'totalCount': len(columns),
+                'data': columns}
+
+    def render_rows(self, sheet: dict, columns: list, include: set, level: int = 0) -> list:
+        rendered = []
+        last_child = {}
+        for number, row in enumerate(sheet['rows'], start=1):
+            rendered.append(render_row(row, number, last_child.get(row['parentId']), columns, include, level))
+            last_child[row['parentId']] = row['id']
+        return rendered
+
+    def render_result_rows(self, sheet: dict, row_ids: list) -> list:
+        wanted = set(row_ids)
+        rows = self.render_rows(sheet, sheet['columns'], {'format'})
+        by_id = {row['id']: row for row in rows if row['id'] in wanted}
+        return [by_id[row_id] for row_id in row_ids if row_id in by_id]
+
+    # --- writes ---
+
+    def add_rows(self, sheet_id: int, rows: list, partial: bool) -> dict:
+        sheet = self.sheet(sheet_id)
+        columns = {column['id'] for column in sheet['columns']}
+        added, failed = [], []
+        position = None
+        for index, row in enumerate(rows):
+            try:
+                validate_cells(row, columns)
+                if position is None:
+                    position, parent_id = self.locate(sheet, row)
+                new_row = {'id': self.new_id(), 'parentId': parent_id, 'format': row.get('format'),
+                           'expanded': row.get('expanded', True), 'modifiedAt': now(),
+                           'cells': {cell['columnId']: make_cell(cell.get('value'), cell.get('objectValue'))
+                                     for cell in row.get('cells') or ()}}
+            except ApiError as error:
+                if not partial:
+                    raise
+                failed.append({'index': index, 'error': error.to_dict()})
+                continue
+            sheet['rows'].insert(position, new_row)
+            position += 1
+            added.append(new_row['id'])
+        if added:
+            sheet['version'] += 1
+        return self.write_result(sheet, self.render_result_rows(sheet, added), failed, partial)
+
+    def update_rows(self, sheet_id: int, rows: list, partial: bool) -> dict:
+        sheet = self.sheet(sheet_id)
+        columns = {column['id'] for column in sheet['columns']}
+        updated, failed = [], []
+        for index, row in enumerate(rows):
+            try:
+                stored = self.find_row(sheet, row.get('id'))
+                validate_cells(row, columns)
+                if any(key in row for key in ('toTop', 'toBottom', 'parentId', 'siblingId')):
+                    self.move_row(sheet, stored, row)
+            except ApiError as error:
+                if not partial:
+                    raise
+                failed.append({'index': index, 'error': error.to_dict(), 'rowId': row.get('id')})
+                continue
+            for cell in row.get('cells') or ():
+                stored['cells'][cell['columnId']] = {
+                    **make_cell(cell.get('value'), cell.get('objectValue')),
+                    'format': cell.get('format', stored['cells'].get(cell['columnId'], {}).get('format')),
+                }
+            if 'format' in row:
+                stored['format'] = row['format']
+            if 'expanded' in row:
+                stored['expanded'] = row['expanded']
+            stored['modifiedAt'] = now()
+            updated.append(stored['id'])
+        if updated:
+            sheet['version'] += 1
+        return self.write_result(sheet, self.render_result_rows(sheet, updated), failed, partial)
+
+    def delete_rows(self, sheet_id: int, row_ids: list, ignore_not_found: bool) -> dict:
+        sheet = self.sheet(sheet_id)
+        existing = {row['id'] for row in sheet['rows']}
+        if not ignore_not_found and not set(row_ids) <= existing:
+            raise ApiError(1006)
+        doomed = set(row_ids)
+        for row in sheet['rows']:  # deleting a parent deletes its children; parents always come first
+            if row['parentId'] in doomed:
+                doomed.add(row['id'])
+        sheet['rows'] = [row for row in sheet['rows'] if row['id'] not in doomed]
+        sheet['version'] += 1
+        return {'message': 'SUCCESS', 'resultCode': 0, 'version': sheet['version'],
+                'result': [row_id for row_id in row_ids if row_id in existing]}
+
+    def copy_rows(self, sheet_id: int, directive: dict, ignore_not_found: bool) -> dict:
+        # copies to the bottom of the destination the cells of the columns with the same title and type there
+        source, destination = self.sheet(sheet_id), self.sheet(directive['to']['sheetId'])
+        targets = {(column['title'], column['type']): column['id'] for column in destination['columns']}
+        matching = {column['id']: targets[column['title'], column['type']] for column in source['columns']
+                    if (column['title'], column['type']) in targets}
+        existing = {row['id']: row for row in source['rows']}
+        if not ignore_not_found and not set(directive['rowIds']) <= set(existing):
+            raise ApiError(1006)
+        mappings = []
+        for row_id in directive['rowIds']:
+            if (row := existing.get(row_id)) is None:
+                continue
+            copy = {'id': self.new_id(), 'parentId': None, 'format': row.get('format'), 'expanded': True,
+                    'modifiedAt': now(), 'cells': {matching[column_id]: dict(cell)
+                                                   for column_id, cell in row['cells'].items()
+                                                   if column_id in matching}}
+            destination['rows'].append(copy)
+            mappings.append({'from': row_id, 'to': copy['id']})
+        if mappings:
+            destination['version'] += 1
+        return {'message': 'SUCCESS', 'resultCode': 0, 'destinationSheetId': destination['id'],
+                'rowMappings': mappings}
+
+    @staticmethod
+    def write_result(sheet: dict, rows: list, failed: list, partial: bool) -> dict:
+        result = {'message': 'SUCCESS', 'resultCode': 0, 'version': sheet['version'], 'result': rows}
+        if partial:
+            result['failedItems'] = failed
+            if failed:
+                result.update(message='PARTIAL_SUCCESS', resultCode=3)
+        return result
+
+    # --- row locations ---
+
+    @staticmethod
+    def find_row(sheet: dict, row_id: int) -> dict:
+        for row in sheet['rows']:
+            if row['id'] == row_id:
+                return row
+        raise ApiError(1006)
+
+    @staticmethod
+    def subtree_end(rows: list, index: int) -> int:
+        # index just past the last descendant of rows[index]
+        family = {rows[index]['id']}
+        end = index + 1
+        while end < len(rows) and rows[end]['parentId'] in family:
+            family.add(rows[end]['id'])
+            end += 1
+        return end
+
+    def locate(self, sheet: dict, row: dict) -> tuple:
+        # returns (INSERT POSITION, PARENT ID) for a row's location-specifier attributes
+        rows = sheet['rows']
+        index_of = {stored['id']: index for index, stored in enumerate(rows)}
+        if sibling_id := row.get('siblingId'):
+            if sibling_id not in index_of:
+                raise ApiError(1062)
+            index = index_of[sibling_id]
+            position = index if row.get('above') else self.subtree_end(rows, index)
+            return position, rows[index]['parentId']
+        if parent_id := row.get('parentId'):
+            if parent_id not in index_of:
+                raise ApiError(1062)
+            index = index_of[parent_id]
+            return (index + 1 if row.get('toTop') else self.subtree_end(rows, index)), parent_id
+        return (0 if row.get('toTop') else len(rows)), None
+
+    def move_row(self, sheet: dict, stored: dict, row: dict) -> None:
+        rows = sheet['rows']
+        start = rows.index(stored)
+        block = rows[start:self.subtree_end(rows, start)]
+        del rows[start:start + len(block)]
+        try:
+            position, stored['parentId'] = self.locate(sheet, row)
+        except ApiError:
+            rows[start:start] = block
+            raise
+        rows[position:position] = block
+
+
+def make_cell(value=None, object_value=None) -> dict:
+    if isinstance(object_value, dict) and object_value.get('values'):  # an empty multi-picklist is an empty cell
+        values = object_value['values']
+        return {'value': ', '.join(values), 'objectValue': {'objectType': 'MULTI_PICKLIST', 'values': values}}
+    if isinstance(value, str) and not value.strip():
+        value = None
+    return {'value': value}
+
+
+def validate_cells(row: dict, columns: set) -> None:
+    for cell in row.get('cells') or ():
+        if cell.get('columnId') not in columns:
+            raise ApiError(1036, cell.get('columnId'))
+
+
+def render_column(column: dict, level: int) -> dict:
+    rendered = {key: value for key, value in column.items() if key != 'options'}
+    if column['type'] == 'MULTI_PICKLIST' and level < 2:
+        rendered['type'] = 'TEXT_NUMBER'  # the API hides newer column types from older clients
+    return rendered
+
+
+def render_row(row: dict, number: int, sibling_id: int, columns: list, include: set, level: int) -> dict:
+    rendered = {'id': row['id'], 'rowNumber': number, 'expanded': row['expanded'], 'modifiedAt': row['modifiedAt']}
+    if row['parentId'] is not None:
+        rendered['parentId'] = row['parentId']
+    if sibling_id is not None:
+        rendered['siblingId'] = sibling_id
+    if 'format' in include and row.get('format'):
+        rendered['format'] = row['format']
+    cells = []
+    for column in columns:
+        stored = row['cells'].get(column['id'], {})
+        cell = {'columnId': column['id']}
+        if (value := stored.get('value')) is not None:
+            cell['value'] = value
+            cell['displayValue'] = str(value).lower() if isinstance(value, bool) else str(value)
+        if 'format' in include and stored.get('format'):
+            cell['format'] = stored['format']
+        if 'objectValue' in include and level >= 2 and stored.get('objectValue'):
+            cell['objectValue'] = stored['objectValue']
+        cells.append(cell)
+    rendered['cells'] = cells
+    return rendered
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.endpoints = defaultdict(lambda: {'calls': 0, 'bytes_in': 0, 'bytes_out': 0, 'errors': 0})
+
+    def record(self, endpoint: str, bytes_in: int, bytes_out: int, status: int) -> None:
+        with self.lock:
+            entry = self.endpoints[endpoint]
+            entry['calls'] += 1
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+            entry['errors'] += status >= 400
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {endpoint: dict(entry) for endpoint, entry in sorted(self.endpoints.items())}
+
+
+class RateLimiter:
+    # sliding one-minute window, like the API's per-token limit
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            cutoff = time.monotonic() - 60
+            while self.calls and self.calls[0] < cutoff:
+                self.calls.popleft()
+            if len(self.calls) >= self.per_minute:
+                return False
+            self.calls.append(time.monotonic())
+            return True
+
+
+ROUTES = [  # (METHOD, PATH PATTERN, ENDPOINT NAME)
+    ('GET', re.compile(r'/sheets/(\d+)'), 'get_sheet'),
+    ('GET', re.compile(r'/sheets/(\d+)/version'), 'get_sheet_version'),
+    ('GET', re.compile(r'/sheets/(\d+)/columns'), 'get_columns'),
+    ('POST', re.compile(r'/sheets/(\d+)/rows'), 'add_rows'),
+    ('PUT', re.compile(r'/sheets/(\d+)/rows'), 'update_rows'),
+    ('DELETE', re.compile(r'/sheets/(\d+)/rows'), 'delete_rows'),
+    ('POST', re.compile(r'/sheets/(\d+)/rows/copy'), 'copy_rows'),
+]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeSmartsheetServer'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.handle_call('GET')
+
+    def do_POST(self) -> None:
+        self.handle_call('POST')
+
+    def do_PUT(self) -> None:
+        self.handle_call('PUT')
+
+    def do_DELETE(self) -> None:
+        self.handle_call('DELETE')
+
+    def handle_call(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if url.path.startswith('/_admin/'):
+            return self.admin(method, url.path, body)
+
+        endpoint, status, payload = 'unknown', 404, ApiError(1006).to_dict()
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        for route_method, pattern, name in ROUTES:
+            if route_method == method and (matched := pattern.fullmatch(path)):
+                endpoint = name
+                status, payload = self.call(name, int(matched.group(1)), query, body)
+                break
+        response = self.send_json(status, payload)
+        self.server.stats.record(endpoint, len(body) + len(self.path), len(response), status)
+
+    def call(self, endpoint: str, sheet_id: int, query: dict, body: bytes) -> tuple:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.rate_limiter and not self.server.rate_limiter.allow():
+            return 429, ApiError(4003).to_dict()
+        api = self.server.api
+        partial = query.get('allowPartialSuccess') == 'true'
+        try:
+            data = json.loads(body) if body else None
+            if endpoint == 'copy_rows':
+                with api.lock:
+                    return 200, api.copy_rows(sheet_id, data, query.get('ignoreRowsNotFound') == 'true')
+            if isinstance(data, dict):
+                data = [data]
+            with api.lock:
+                if endpoint == 'get_sheet':
+                    return 200, api.get_sheet(sheet_id, query)
+                if endpoint == 'get_sheet_version':
+                    return 200, {'version': api.sheet(sheet_id)['version']}
+                if endpoint == 'get_columns':
+                    return 200, api.get_columns(sheet_id, query)
+                if endpoint == 'add_rows':
+                    return 200, api.add_rows(sheet_id, data or [], partial)
+                if endpoint == 'update_rows':
+                    return 200, api.update_rows(sheet_id, data or [], partial)
+                if endpoint == 'delete_rows':
+                    row_ids = [int(row_id) for row_id in query.get('ids', '').split(',') if row_id]
+                    return 200, api.delete_rows(sheet_id, row_ids, query.get('ignoreRowsNotFound') == 'true')
+        except ApiError as error:
+            return error.status, error.to_dict()
+        except (ValueError, KeyError, TypeError):
+            return 400, ApiError(1008).to_dict()
+
+    def admin(self, method: str, path: str, body: bytes) -> None:
+        if method == 'POST' and path == '/_admin/generate':
+            from bench.synthetic import generate_sheets
+            with self.server.api.lock:
+                self.send_json(200, generate_sheets(self.server.api, **json.loads(body or b'{}')))
+        elif method == 'GET' and path == '/_admin/stats':
+            self.send_json(200, self.server.stats.to_dict())
+        elif method == 'POST' and path == '/_admin/reset':
+            self.server.stats.reset()
+            self.send_json(200, {})
+        else:
+            self.send_json(404, ApiError(1006).to_dict())
+
+    def send_json(self, status: int, payload) -> bytes:
+        response = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+        return response
+
+
+class FakeSmartsheetServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, latency: float = 0.0, rate_limit: int = 0):
+        super().__init__(address, Handler)
+        self.api = FakeSmartsheet()
+        self.stats = Stats()
+        self.latency = latency
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API call')
+    parser.add_argument('--rate-limit', type=int, default=0, help='API calls allowed per minute (0 = unlimited)')
+    args = parser.parse_args()
+    server = FakeSmartsheetServer((args.host, args.port), args.latency, args.rate_limit)
+    print(f'serving fake Smartsheet API at {server.api_base}', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
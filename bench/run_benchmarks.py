@@ -0,0 +1,169 @@
+"""End-to-end benchmarks of the calendar pipelines against the fake Smartsheet server
+
+For each sheet size, generates a fresh set of synthetic sheets, runs every
+pipeline once in dependency order (a cold run: empty calendars, no sync
+state), then calendar_control.run once more (a warm run, where nothing
+changed in between) and once more after editing one intake row (an
+edited run, which only refetches the modified rows). Reports wall time, API calls per endpoint, bytes
+sent and received, and peak Python memory for each step.
+
+    python -m bench.run_benchmarks --sizes 500 5000 20000 --latency 0.05 --json bench_results.json
+
+--latency adds a fixed delay to every fake API call, which makes the wall
+times closer to what the real API would give. Peak memory is measured
+with tracemalloc, which slows Python code down noticeably; use
+--no-memory for wall times that can be compared with each other.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(latency: float, rate_limit: int) -> tuple:
+    # runs the fake server in its own process, so its work doesn't show up in our time and memory numbers
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'bench.fake_smartsheet', '--port', str(port),
+                               '--latency', str(latency), '--rate-limit', str(rate_limit)],
+                              cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()  # "serving fake Smartsheet API at ..."
+    return server, f'http://127.0.0.1:{port}'
+
+
+def admin(server_url: str, method: str, path: str, payload: dict = None) -> dict:
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = Request(server_url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urlopen(request) as response:
+        return json.load(response)
+
+
+def pipeline_order(dependencies: dict) -> list:
+    order, done = [], set()
+    while len(order) < len(dependencies):
+        ready = [name for name, depends_on in dependencies.items() if name not in done and depends_on <= done]
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+def measure(server_url: str, step, memory: bool) -> dict:
+    admin(server_url, 'POST', '/_admin/reset')
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    step()
+    wall_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else None
+    if memory:
+        tracemalloc.stop()
+    endpoints = admin(server_url, 'GET', '/_admin/stats')
+    return {
+        'wall_time': round(wall_time, 3),
+        'api_calls': sum(entry['calls'] for entry in endpoints.values()),
+        'bytes_in': sum(entry['bytes_in'] for entry in endpoints.values()),
+        'bytes_out': sum(entry['bytes_out'] for entry in endpoints.values()),
+        'peak_memory': peak,
+        'endpoints': endpoints,
+    }
+
+
+def edit_intake_row(sheet_id: int) -> None:
+    # renames the first event of the intake sheet through the API, like a user editing it would
+    import smartsheet
+
+    from client import shared_client
+
+    smart = shared_client()
+    sheet = smart.Sheets.get_sheet(sheet_id, page_size=2, page=1)
+    name_column = sheet.columns[0].id
+    smart.Sheets.update_rows(sheet_id, [smartsheet.models.Row({
+        'id': sheet.rows[1].id, 'cells': [{'columnId': name_column, 'value': 'Edited event'}]})])
+
+
+def bench_size(server_url: str, size: int, memory: bool) -> dict:
+    import calendar_control
+    from bench.synthetic import sheet_id_config
+    from settings import get_settings
+    from sheet_cache import clear_cache
+    from sheet_fetch import clear_columns
+
+    sheet_ids = sheet_id_config(admin(server_url, 'POST', '/_admin/generate',
+                                      {'map': size, 'intake': size, 'request': size}))
+    time.sleep(1)  # modifiedAt has whole seconds, so rows made in the cold run's second would all look modified
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        with open('sheet_id.yaml', 'w') as yaml_file:
+            yaml.safe_dump(sheet_ids, yaml_file)
+        get_settings.cache_clear()
+        clear_cache()
+        clear_columns()
+
+        for name in pipeline_order(calendar_control.find_dependencies(sheet_ids)):
+            results[f'cold {name}'] = measure(
+                server_url, lambda: calendar_control.run_pipeline(name, sheet_ids[name]), memory)
+        results['warm run'] = measure(server_url, calendar_control.run, memory)
+        edit_intake_row(sheet_ids['intake']['source'])
+        results['edited run'] = measure(server_url, calendar_control.run, memory)
+        os.chdir(REPO_ROOT)
+    return results
+
+
+def print_report(results: dict) -> None:
+    print(f"{'size':>6}  {'step':<22} {'wall s':>8} {'calls':>6} {'KB sent':>9} {'KB recv':>9} {'peak MB':>8}")
+    for size, steps in results.items():
+        for step, result in steps.items():
+            peak = f"{result['peak_memory'] / 2 ** 20:8.1f}" if result['peak_memory'] is not None else f"{'-':>8}"
+            print(f"{size:>6}  {step:<22} {result['wall_time']:8.2f} {result['api_calls']:6d} "
+                  f"{result['bytes_in'] / 1024:9.0f} {result['bytes_out'] / 1024:9.0f} {peak}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 20000], help='rows per source sheet')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API call')
+    parser.add_argument('--rate-limit', type=int, default=0, help='fake API calls allowed per minute')
+    parser.add_argument('--no-memory', action='store_true', help="don't trace peak memory")
+    parser.add_argument('--json', help='also write the full results, per endpoint, to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the pipelines\' INFO logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    server, server_url = start_server(args.latency, args.rate_limit)
+    os.environ['SMARTSHEET_API_BASE'] = server_url + '/2.0'
+    os.environ.setdefault('SMARTSHEET_ACCESS_TOKEN', 'fake-token')
+    sys.path.insert(0, str(REPO_ROOT))
+    import sync_state
+    sync_state.CLOCK_SKEW = timedelta(0)  # the fake runs on this machine's clock, and every row was just modified
+    try:
+        results = {size: bench_size(server_url, size, not args.no_memory) for size in args.sizes}
+    finally:
+        server.terminate()
+
+    print_report(results)
+    if args.json:
+        with open(REPO_ROOT / args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
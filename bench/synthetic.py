@@ -0,0 +1,158 @@
+"""Synthetic map, intake and request sheets for the fake Smartsheet server
+
+The sheets have the columns and shapes the pipelines expect: the map
+sheet is FY -> quarter -> event rows, the intake sheet has quarter
+separator rows and a spread of date columns (one of them hidden), and
+the request sheet has a share of Yellow rows waiting to be moved. The
+same seed always gives the same sheets.
+"""
+import random
+from datetime import date, timedelta
+
+from request_to_map.FY_Q_sort import calc_fy_q_hardcoded
+
+FIRST_DAY = date(2023, 7, 30)  # start of FY24
+LAST_DAY = date(2027, 7, 24)  # end of FY27
+
+REQUEST_COLUMNS = [
+    {'title': 'Event Name', 'type': 'TEXT_NUMBER'},
+    {'title': 'TechX Status', 'type': 'PICKLIST'},
+    {'title': 'Event Start Date', 'type': 'DATE'},
+    {'title': 'Event End Date', 'type': 'DATE'},
+    {'title': 'TechX Resource', 'type': 'TEXT_NUMBER'},
+    {'title': 'Services', 'type': 'MULTI_PICKLIST'},
+    {'title': 'Location', 'type': 'TEXT_NUMBER'},
+    {'title': 'Notes', 'type': 'TEXT_NUMBER'},
+]
+
+MAP_COLUMNS = [
+    *REQUEST_COLUMNS,
+    {'title': 'JLL Hand over date', 'type': 'DATE'},
+    {'title': 'Move In Date', 'type': 'DATE'},
+    {'title': 'TechX Service Request', 'type': 'CHECKBOX'},
+]
+
+INTAKE_DATE_COLUMNS = ['Cisco Live Registration Date', 'Partner Summit Date(s)', 'Content Due Date',
+                       'Setup Dates', 'Teardown Date (s)']
+
+INTAKE_COLUMNS = [
+    {'title': 'Event Name', 'type': 'TEXT_NUMBER'},
+    {'title': 'Event State & Type', 'type': 'PICKLIST'},
+    {'title': 'Event Start Date', 'type': 'DATE'},
+    {'title': 'Event End Date', 'type': 'DATE'},
+    *({'title': title, 'type': 'DATE'} for title in INTAKE_DATE_COLUMNS),
+    {'title': 'Internal Review Date', 'type': 'DATE', 'hidden': True},
+    {'title': 'Owner', 'type': 'TEXT_NUMBER'},
+    {'title': 'Budget', 'type': 'TEXT_NUMBER'},
+]
+
+CALENDAR_COLUMNS = [
+    {'title': 'Event Name', 'type': 'TEXT_NUMBER'},
+    {'title': 'Date', 'type': 'DATE'},
+    {'title': 'End Date', 'type': 'DATE'},
+]
+
+EVENT_NAMES = ['Cisco Live', 'Partner Summit', 'Cisco Connect', 'Impact', 'Customer Briefing', 'Roadshow',
+               'Executive Forum', 'Hackathon', 'Developer Days', 'Cisco Live Dates']
+STAFF = ['"Alex"', '"Sam"', '"Jordan"', '"Riley"', None]
+SERVICES = ['AV', 'Network', 'Demo', 'Staging', 'Wi-Fi']
+
+
+def random_day(rng: random.Random) -> date:
+    return FIRST_DAY + timedelta(days=rng.randrange((LAST_DAY - FIRST_DAY).days))
+
+
+def event_cells(rng: random.Random, number: int, status: str) -> dict:
+    start = random_day(rng)
+    return {
+        'Event Name': f'{rng.choice(EVENT_NAMES)} {number}',
+        'TechX Status': status,
+        'Event Start Date': start.isoformat(),
+        'Event End Date': (start + timedelta(days=rng.randrange(5))).isoformat(),
+        'TechX Resource': rng.choice(STAFF),
+        'Services': rng.sample(SERVICES, rng.randrange(1, 3)),
+        'Location': rng.choice(['San Jose', 'Las Vegas', 'Amsterdam', 'Melbourne']),
+        'Notes': 'synthetic row',
+    }
+
+
+def map_rows(rng: random.Random, size: int) -> list:
+    events = sorted((event_cells(rng, number, rng.choice(['Green', 'Green', 'Green', 'Yellow', 'Red']))
+                     for number in range(size)), key=lambda cells: cells['Event Start Date'])
+    by_quarter = {}
+    for cells in events:
+        by_quarter.setdefault(calc_fy_q_hardcoded(cells['Event Start Date']), []).append(cells)
+
+    rows = []
+    for fy in range(24, 28):
+        rows.append({'cells': {'Event Name': f'FY{fy}'}})
+        fy_index = len(rows) - 1
+        for quarter in range(1, 5):
+            rows.append({'parent': fy_index, 'cells': {'Event Name': f'Q{quarter}'}})
+            quarter_index = len(rows) - 1
+            for cells in by_quarter.get((fy, quarter), ()):
+                start = date.fromisoformat(cells['Event Start Date'])
+                rows.append({'parent': quarter_index, 'cells': {
+                    **cells,
+                    'JLL Hand over date': (start - timedelta(days=2)).isoformat(),
+                    'Move In Date': (start - timedelta(days=1)).isoformat(),
+                    'TechX Service Request': False,
+                }})
+    return rows
+
+
+def intake_rows(rng: random.Random, size: int) -> list:
+    rows = []
+    for number in range(size):
+        if number % 50 == 0:
+            rows.append({'cells': {'Event Name': f'Q{number // 50 % 4 + 1} FY{24 + number // 200 % 4}'}})
+            continue
+        start = random_day(rng)
+        cells = {
+            'Event Name': f'{rng.choice(EVENT_NAMES)} {number}',
+            'Event State & Type': rng.choice(['Confirmed - Hosted', 'Tentative - Sponsored', 'Canceled - Hosted']),
+            'Event Start Date': start.isoformat(),
+            'Event End Date': (start + timedelta(days=rng.randrange(5))).isoformat(),
+            'Internal Review Date': (start - timedelta(days=30)).isoformat(),
+            'Owner': 'synthetic',
+            'Budget': rng.randrange(1000, 100000),
+        }
+        for title in INTAKE_DATE_COLUMNS:
+            if rng.random() < 0.7:
+                cells[title] = (start - timedelta(days=rng.randrange(1, 60))).isoformat()
+        rows.append({'cells': cells})
+    return rows
+
+
+def request_rows(rng: random.Random, size: int, yellow_fraction: float) -> list:
+    return [{'cells': event_cells(rng, number, 'Yellow' if rng.random() < yellow_fraction else 'Green')}
+            for number in range(size)]
+
+
+def generate_sheets(api, map: int = 500, intake: int = 500, request: int = 500,
+                    yellow_fraction: float = 0.05, seed: int = 1) -> dict:
+    """Adds a full set of source and destination sheets to a FakeSmartsheet
+    Returns {SHEET NAME: SHEET ID}, with the same names as the
+    source/destination entries of sheet_id.yaml.
+    """
+    rng = random.Random(seed)
+    return {
+        'map source': api.add_sheet('Event Map', MAP_COLUMNS, map_rows(rng, map)),
+        'intake source': api.add_sheet('Event Intake', INTAKE_COLUMNS, intake_rows(rng, intake)),
+        'request source': api.add_sheet('TechX Requests', REQUEST_COLUMNS,
+                                        request_rows(rng, request, yellow_fraction)),
+        'map destination': api.add_sheet('Map Calendar', CALENDAR_COLUMNS),
+        'intake destination': api.add_sheet('Intake Calendar', CALENDAR_COLUMNS),
+        'combined destination': api.add_sheet('Combined Calendar', CALENDAR_COLUMNS),
+    }
+
+
+def sheet_id_config(sheet_ids: dict) -> dict:
+    # the sheet_id.yaml contents for a set of generated sheets
+    return {
+        'map': {'source': sheet_ids['map source'], 'destination': sheet_ids['map destination']},
+        'intake': {'source': sheet_ids['intake source'], 'destination': sheet_ids['intake destination']},
+        'combined': {'source': {'map': sheet_ids['map source'], 'intake': sheet_ids['intake source']},
+                     'destination': sheet_ids['combined destination']},
+        'request to map': {'source': sheet_ids['request source'], 'destination': sheet_ids['map source']},
+    }
@@ -0,0 +1,78 @@
+"""Compares the serial and process-pool paths of transform.transform_rows
+
+Generates synthetic map and intake sheets in memory (no server needed),
+turns them into SDK rows the way a fetch would, and times the
+row-to-events transform for each sheet size, serially and with each
+number of worker processes. The pool is started before timing; its
+startup cost is reported on its own. Every parallel result is checked
+against the serial one, colors included.
+
+    python -m bench.transform_benchmark --sizes 2000 20000 100000 --processes 2 4
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import smartsheet
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def sdk_rows(api, sheet_id: int, column_selector) -> tuple:
+    # returns (columns, rows) as a fetch of the pipeline's columns would give them
+    columns = [smartsheet.models.Column(column) for column in api.get_columns(sheet_id, {})['data']]
+    wanted = ','.join(str(column.id) for column in column_selector(columns))
+    sheet = smartsheet.models.Sheet(api.get_sheet(sheet_id, {'columnIds': wanted}))
+    return list(sheet.columns), list(sheet.rows)
+
+
+def timed(func) -> tuple:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000, 100000], help='rows per sheet')
+    parser.add_argument('--processes', type=int, nargs='+', default=[2, 4], help='worker process counts to try')
+    parser.add_argument('--chunk-rows', type=int, default=2000, help='rows handed to a worker at a time')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SMARTSHEET_ACCESS_TOKEN', 'fake-token')  # the pipeline modules make a client on import
+    sys.path.insert(0, str(REPO_ROOT))
+    from bench.fake_smartsheet import FakeSmartsheet
+    from bench.synthetic import generate_sheets
+    from intake_calendar import intake_columns, intake_row_processor
+    from map_calendar import map_columns, map_row_processor
+    from transform import transform_pool, transform_rows
+    from utils import assign_colors
+
+    for processes in args.processes:
+        startup, _ = timed(lambda: transform_pool(processes).submit(int).result())
+        print(f"starting {processes} worker processes took {startup:.2f}s")
+
+    print(f"{'sheet':<8} {'rows':>7}  {'path':<12} {'seconds':>8} {'rows/s':>9} {'speedup':>8}")
+    for size in args.sizes:
+        api = FakeSmartsheet()
+        sheet_ids = generate_sheets(api, map=size, intake=size, request=0)
+        for name, sheet_id, column_selector, row_processor in (
+                ('map', sheet_ids['map source'], map_columns, map_row_processor),
+                ('intake', sheet_ids['intake source'], intake_columns, intake_row_processor)):
+            columns, rows = sdk_rows(api, sheet_id, column_selector)
+            process_row = row_processor(columns)
+            serial, expected = timed(lambda: transform_rows(process_row, rows, processes=0))
+            print(f"{name:<8} {len(rows):>7}  {'serial':<12} {serial:8.3f} {len(rows) / serial:9.0f} {1:8.2f}")
+            for processes in args.processes:
+                seconds, result = timed(lambda: transform_rows(process_row, rows, processes, args.chunk_rows))
+                if result != expected or assign_colors(events for _, events in result) != assign_colors(
+                        events for _, events in expected):
+                    raise AssertionError(f"{processes} processes gave a different result for the {name} sheet")
+                print(f"{name:<8} {len(rows):>7}  {f'{processes} processes':<12} {seconds:8.3f} "
+                      f"{len(rows) / seconds:9.0f} {serial / seconds:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
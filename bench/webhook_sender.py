@@ -0,0 +1,70 @@
+"""Stands in for Smartsheet's webhook sender, for trying out daemon.py locally
+
+Sends a verification challenge, then a burst of sheet callbacks for the
+given sheet ids, the way Smartsheet batches them up after edits.
+
+    python -m bench.webhook_sender http://127.0.0.1:8080 1234 5678 --callbacks 20 --interval 0.2
+
+--columns marks the callbacks as column changes, so the daemon drops its
+cached column lists. --secret signs the callbacks like a webhook with
+that shared secret would; the daemon only checks signatures for webhooks
+it registered itself.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import datetime, timezone
+from urllib.request import Request, urlopen
+
+
+def post(url: str, payload: dict, secret: str = None) -> tuple:
+    body = json.dumps(payload).encode()
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['Smartsheet-Hmac-SHA256'] = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    with urlopen(Request(url, data=body, headers=headers, method='POST')) as response:
+        return response.status, response.read()
+
+
+def sheet_callback(webhook_id: int, sheet_id: int, columns: bool = False) -> dict:
+    object_type = 'column' if columns else 'row'
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+    return {
+        'nonce': secrets.token_hex(16),
+        'timestamp': now,
+        'webhookId': webhook_id,
+        'scope': 'sheet',
+        'scopeObjectId': sheet_id,
+        'events': [{'objectType': object_type, 'eventType': 'updated', 'id': secrets.randbits(48),
+                    'userId': 1, 'timestamp': now}],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sends fake Smartsheet webhook callbacks to the daemon")
+    parser.add_argument('url', help="the daemon's callback URL")
+    parser.add_argument('sheet_ids', nargs='+', type=int, help="sheets to report as changed, in turn")
+    parser.add_argument('--callbacks', type=int, default=10, help="how many callbacks to send")
+    parser.add_argument('--interval', type=float, default=0.5, help="seconds between callbacks")
+    parser.add_argument('--columns', action='store_true', help="report column changes instead of row changes")
+    parser.add_argument('--webhook-id', type=int, default=1)
+    parser.add_argument('--secret', help="shared secret to sign the callbacks with")
+    args = parser.parse_args()
+
+    challenge = secrets.token_hex(16)
+    status, body = post(args.url, {'challenge': challenge, 'webhookId': args.webhook_id})
+    answered = json.loads(body or b'{}').get('smartsheetHookResponse') == challenge
+    print(f"challenge: HTTP {status}, {'answered' if answered else 'NOT answered'}")
+
+    for number in range(args.callbacks):
+        sheet_id = args.sheet_ids[number % len(args.sheet_ids)]
+        status, _ = post(args.url, sheet_callback(args.webhook_id, sheet_id, args.columns), args.secret)
+        print(f"callback {number + 1} for sheet {sheet_id}: HTTP {status}")
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
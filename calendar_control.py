@@ -1,28 +1,134 @@
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from importlib import import_module
 
 import yaml
 
+from instrumentation import pipeline_context, recorder, write_report
+from settings import get_settings
+from sheet_cache import clear_cache
+from sheet_fetch import clear_columns
+
 logger = logging.getLogger('main')
 
+PIPELINES = {  # {NAME IN sheet_id.yaml: MODULE WITH ITS process_sheet FUNCTION}
+    'request to map': 'request_to_map.request_to_map_calendar',
+    'intake': 'intake_calendar',
+    'map': 'map_calendar',
+    'combined': 'combined_calendar',
+}
+
 
-def run() -> None:
+def run(pipelines: set = None, keep_cache: bool = False) -> None:
+    """Runs the calendar pipelines in sheet_id.yaml
+    pipelines limits the run to those pipelines (by default all of them
+    run); keep_cache keeps the source sheet results and column lists
+    of earlier runs, which are reused if their sheet's version hasn't
+    changed.
+    """
     logger.info("starting control program")
-    from combined_calendar import process_sheet as process_combined
-    from intake_calendar import process_sheet as process_intake
-    from map_calendar import process_sheet as process_map
-    from request_to_map.request_to_map_calendar import process_sheet as process_request
+    if not keep_cache:
+        clear_cache()
+        clear_columns()
+    recorder.reset()
 
-    with open('sheet_id.yaml') as yaml_file:
-        sheet_ids = yaml.safe_load(yaml_file)
-
-    for process_cal in (
-                        process_request,
-                        process_intake,
-                        process_map,
-                        process_combined,
-                        ):
-        module = process_cal.__module__.split('.')[-1].replace('_', ' ')
-        logger.info(f"starting {module} processing")
-        process_cal(sheet_ids[' '.join(module.split()[:-1])])
+    sheet_ids = load_sheet_ids()
+    if pipelines is not None:
+        sheet_ids = {name: ids for name, ids in sheet_ids.items() if name in pipelines}
+
+    try:
+        run_pipelines(sheet_ids, find_dependencies(sheet_ids), get_settings()['pipeline_workers'])
+    finally:
+        write_report(**get_settings()['metrics'])
 
     logger.info("program finished")
+
+
+def load_sheet_ids() -> dict:
+    with open('sheet_id.yaml') as yaml_file:
+        return yaml.safe_load(yaml_file)
+
+
+def sheet_id_set(ids) -> set:
+    # a source/destination entry is either a single sheet id or a {name: id} dict of them
+    return set(ids.values()) if isinstance(ids, dict) else {ids}
+
+
+def find_dependencies(sheet_ids: dict) -> dict:
+    """Builds the pipeline DAG from sheet_id.yaml
+    A pipeline depends on every other pipeline whose destination is one
+    of its sources, since it has to read that sheet after it is written.
+    Returns {PIPELINE: {PIPELINES IT DEPENDS ON}}
+    """
+    dependencies = {
+        name: {other for other, other_ids in sheet_ids.items()
+               if other != name and sheet_id_set(other_ids['destination']) & sheet_id_set(ids['source'])}
+        for name, ids in sheet_ids.items()
+    }
+    for name, depends_on in dependencies.items():
+        logger.debug(f"{name} depends on {sorted(depends_on) or 'nothing'}")
+    return dependencies
+
+
+def affected_pipelines(sheet_ids: dict, changed_sheet_id: int) -> set:
+    # the pipelines that read the changed sheet, and every pipeline that depends on one of them
+    dependencies = find_dependencies(sheet_ids)
+    affected = {name for name, ids in sheet_ids.items() if changed_sheet_id in sheet_id_set(ids['source'])}
+    while dependents := {name for name, depends_on in dependencies.items()
+                         if depends_on & affected and name not in affected}:
+        affected |= dependents
+    return affected
+
+
+def run_pipelines(sheet_ids: dict, dependencies: dict, max_workers: int) -> None:
+    """Runs every pipeline once its dependencies have finished
+    Independent pipelines run at the same time on a thread pool of
+    max_workers threads, so the run takes as long as its longest chain of
+    dependent pipelines. If a pipeline fails, the pipelines that depend
+    on it are skipped, the others still run, and a RuntimeError is raised
+    at the end.
+    """
+    pending = dict(dependencies)
+    done, failed = set(), set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            ready = True
+            while ready:
+                ready = False
+                for name, depends_on in list(pending.items()):
+                    if depends_on & failed:
+                        logger.error(f"skipping {name} processing because {', '.join(depends_on & failed)} failed")
+                        failed.add(name)
+                    elif depends_on <= done:
+                        logger.info(f"starting {name} processing")
+                        running[pool.submit(run_pipeline, name, sheet_ids[name])] = name
+                    else:
+                        continue
+                    del pending[name]
+                    ready = True
+            if not running:
+                if pending:
+                    raise ValueError(f"circular dependency between {', '.join(pending)} in sheet_id.yaml")
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception(f"{name} processing failed")
+                    failed.add(name)
+                else:
+                    logger.info(f"finished {name} processing")
+                    done.add(name)
+
+    if failed:
+        raise RuntimeError(f"processing failed for {', '.join(sorted(failed))}")
+
+
+def run_pipeline(name: str, ids: dict) -> None:
+    with pipeline_context(name):
+        import_module(PIPELINES[name]).process_sheet(ids)
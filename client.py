@@ -0,0 +1,43 @@
+import os
+from functools import lru_cache
+
+import smartsheet
+
+from async_api import take_slots
+from instrumentation import instrument
+from planner import plannable
+from scheduler import schedule
+from settings import get_settings
+
+CHANGE_AGENT = "dkarpele_smartsheet_calendar"
+
+
+def new_client(max_connections: int = 8) -> smartsheet.Smartsheet:
+    # uses the 'SMARTSHEET_ACCESS_TOKEN' env variable; 'SMARTSHEET_API_BASE' points it at another server,
+    # e.g. the offline stand-in in bench/fake_smartsheet.py
+    if api_base := os.environ.get('SMARTSHEET_API_BASE'):
+        smart = smartsheet.Smartsheet(max_connections=max_connections, api_base=api_base)
+    else:
+        smart = smartsheet.Smartsheet(max_connections=max_connections)
+    smart.errors_as_exceptions(True)
+    smart.with_change_agent(CHANGE_AGENT)
+    # scheduled and slotted outside the instrumentation, so waiting isn't latency; planned writes never get that far
+    return plannable(schedule(take_slots(instrument(smart))))
+
+
+@lru_cache(maxsize=None)
+def shared_client() -> smartsheet.Smartsheet:
+    # the one client every pipeline uses, so they all share its pool of kept-alive connections;
+    # the pool has a connection for each request async_api lets be in flight at once
+    return new_client(max_connections=get_settings()['api_concurrency'])
+
+
+class LazyClient:
+    """Stands in for shared_client() until it is first used
+    The pipeline modules each hold one from import time, so importing a
+    pipeline doesn't build the client (or need the access token); the
+    first API call builds it, once, for every pipeline.
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(shared_client(), name)
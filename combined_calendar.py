@@ -1,22 +1,25 @@
 #!/usr/bin/env python3
 
 import logging
+from functools import partial
 
-import smartsheet
-
+from async_api import run_concurrently
+from client import LazyClient
+from feed import publish
 from intake_calendar import intake_processing
 from map_calendar import map_processing
-from utils import clear_and_write_sheet
+from utils import sync_sheet
 
-logger = logging.getLogger('main')
+logger = logging.getLogger('main.combined')  # its level can be set on its own, see settings.py
 
-smart = smartsheet.Smartsheet()  # use 'SMARTSHEET_ACCESS_TOKEN' env variable
-smart.errors_as_exceptions(True)
-CHANGE_AGENT = "dkarpele_smartsheet_calendar"
-smart.with_change_agent(CHANGE_AGENT)
+smart = LazyClient()  # the shared client, built on first use from the 'SMARTSHEET_ACCESS_TOKEN' env variable
 
 
 def process_sheet(sheet_ids) -> None:
-    new_cells = map_processing(sheet_ids['source']['map'])
-    new_cells.extend(intake_processing(sheet_ids['source']['intake']))
-    clear_and_write_sheet(smart, sheet_ids['destination'], new_cells)
+    # both event lists are usually already computed (and cached) by the map and intake calendars this run;
+    # if not, the two sources are fetched at the same time
+    map_cells, intake_cells = run_concurrently([partial(map_processing, sheet_ids['source']['map']),
+                                                partial(intake_processing, sheet_ids['source']['intake'])])
+    new_cells = [*map_cells, *intake_cells]
+    sync_sheet(smart, sheet_ids['destination'], new_cells)
+    publish('combined', new_cells)
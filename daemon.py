@@ -0,0 +1,196 @@
+"""Long-running mode: update the calendars when Smartsheet says a source sheet changed
+
+Serves Smartsheet webhook callbacks over HTTP. A callback for a source
+sheet in sheet_id.yaml marks the pipelines that read it (and the ones
+that depend on those) as due; once callbacks have stopped coming for
+debounce_seconds, or max_delay_seconds after the first one, the due
+pipelines run, reusing the source sheet results and column lists of
+earlier runs. There is a full run from scratch at startup and every
+resync_minutes, in case a callback was missed.
+
+If callback_url is set, a webhook is created (or re-enabled) for each
+source sheet, pointing at it, and only callbacks signed with their
+webhook's shared secret are accepted. Without it, callbacks are
+accepted from anything that can reach the port, e.g.
+bench/webhook_sender.py, so the server only listens on a loopback
+address unless allow_unsigned_callbacks is set.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import smartsheet
+
+import calendar_control
+from client import shared_client
+from settings import get_settings
+from sheet_fetch import forget_columns
+
+logger = logging.getLogger('main')
+
+WEBHOOK_NAME = 'smartsheet_calendar'
+
+
+class Daemon:
+    def __init__(self, sheet_ids: dict, debounce_seconds: float, max_delay_seconds: float, resync_minutes: float,
+                 signed_only: bool = False):
+        self.sheet_ids = sheet_ids
+        self.signed_only = signed_only  # reject callbacks without a good signature, even before the secrets are known
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.resync_seconds = resync_minutes * 60
+        self.secrets = {}  # {WEBHOOK ID: SHARED SECRET} of the webhooks we registered
+        self.due = set()
+        self.first_change = self.last_change = None
+        self.next_resync = time.monotonic()  # a full run right away
+        self.condition = threading.Condition()
+
+    def sheet_changed(self, sheet_id: int, columns_changed: bool = False) -> None:
+        pipelines = calendar_control.affected_pipelines(self.sheet_ids, sheet_id)
+        if not pipelines:
+            logger.debug(f"ignoring callback for sheet {sheet_id}, which no pipeline reads")
+            return
+        if columns_changed:
+            forget_columns(sheet_id)
+        with self.condition:
+            now = time.monotonic()
+            self.first_change = self.first_change or now
+            self.last_change = now
+            self.due |= pipelines
+            self.condition.notify()
+        logger.debug(f"sheet {sheet_id} changed; {', '.join(sorted(pipelines))} due")
+
+    def next_run(self):
+        # waits until it's time for a run, then returns the pipelines to run (None for all of them)
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now >= self.next_resync:
+                    self.due.clear()
+                    self.first_change = self.last_change = None
+                    self.next_resync = now + self.resync_seconds
+                    return None
+                wake = self.next_resync
+                if self.due:
+                    run_at = min(self.last_change + self.debounce_seconds,
+                                 self.first_change + self.max_delay_seconds)
+                    if now >= run_at:
+                        due, self.due = self.due, set()
+                        self.first_change = self.last_change = None
+                        return due
+                    wake = min(wake, run_at)
+                self.condition.wait(wake - now)
+
+    def run_forever(self) -> None:
+        while True:
+            pipelines = self.next_run()
+            logger.info(f"running {'all pipelines' if pipelines is None else ', '.join(sorted(pipelines))}")
+            try:
+                calendar_control.run(pipelines, keep_cache=pipelines is not None)  # resyncs start from scratch
+            except Exception:
+                logger.exception("run failed; waiting for the next change")
+
+    def register_webhooks(self, callback_url: str) -> None:
+        # makes sure each source sheet has an enabled webhook calling callback_url, and learns their shared secrets
+        smart = shared_client()
+        existing = {(hook.scope_object_id, hook.callback_url): hook
+                    for hook in smart.Webhooks.list_webhooks(include_all=True).data if hook.name == WEBHOOK_NAME}
+        for sheet_id in set().union(*(calendar_control.sheet_id_set(ids['source'])
+                                      for ids in self.sheet_ids.values())):
+            hook = existing.get((sheet_id, callback_url))
+            if hook is None:
+                hook = smart.Webhooks.create_webhook(smartsheet.models.Webhook({
+                    'name': WEBHOOK_NAME, 'callbackUrl': callback_url, 'scope': 'sheet', 'scopeObjectId': sheet_id,
+                    'events': ['*.*'], 'version': 1})).result
+                logger.info(f"created webhook {hook.id} for sheet {sheet_id}")
+            self.secrets[hook.id] = hook.shared_secret
+            if not hook.enabled:
+                # enabling sends a verification challenge, so the server has to be up by now
+                smart.Webhooks.update_webhook(hook.id, smartsheet.models.Webhook({'enabled': True}))
+                logger.info(f"enabled webhook {hook.id} for sheet {sheet_id}")
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    server: 'CallbackServer'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            callback = json.loads(body)
+        except ValueError:
+            return self.respond(400)
+        if not isinstance(callback, dict):
+            return self.respond(400)
+        if challenge := callback.get('challenge'):  # verification, when a webhook is enabled and every 100 callbacks
+            return self.respond(200, {'smartsheetHookResponse': challenge}, {'Smartsheet-Hook-Response': challenge})
+
+        daemon = self.server.daemon
+        if ((daemon.signed_only or daemon.secrets)
+                and not self.signed(body, daemon.secrets.get(callback.get('webhookId')))):
+            logger.warning(f"rejected a callback with a bad signature for webhook {callback.get('webhookId')}")
+            return self.respond(401)
+        if status := callback.get('newWebhookStatus'):
+            logger.warning(f"webhook {callback.get('webhookId')} is now {status}")
+        elif callback.get('scope') == 'sheet':
+            events = callback.get('events') or ()
+            daemon.sheet_changed(callback['scopeObjectId'],
+                                 columns_changed=any(event.get('objectType') == 'column' for event in events))
+        self.respond(200)
+
+    def signed(self, body: bytes, secret: str) -> bool:
+        if not secret:
+            return False
+        expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, self.headers.get('Smartsheet-Hmac-SHA256', ''))
+
+    def respond(self, status: int, payload: dict = None, headers: dict = None) -> None:
+        data = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CallbackServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, daemon: Daemon):
+        super().__init__(address, CallbackHandler)
+        self.daemon = daemon
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        return host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:  # a host name, or '' for every interface
+        return False
+
+
+def serve() -> None:
+    settings = get_settings()['daemon']
+    if not settings['callback_url'] and not is_loopback(settings['host']) and not settings['allow_unsigned_callbacks']:
+        raise ValueError(f"callbacks aren't signed without a callback_url, so anything that can reach "
+                         f"{settings['host']}:{settings['port']} could start runs; listen on 127.0.0.1, set the "
+                         f"daemon setting's callback_url, or set its allow_unsigned_callbacks")
+    daemon = Daemon(calendar_control.load_sheet_ids(), settings['debounce_seconds'], settings['max_delay_seconds'],
+                    settings['resync_minutes'], signed_only=bool(settings['callback_url']))
+    server = CallbackServer((settings['host'], settings['port']), daemon)
+    threading.Thread(target=server.serve_forever, name='webhook callbacks', daemon=True).start()
+    logger.info(f"listening for webhook callbacks on {settings['host']}:{settings['port']}")
+    if get_settings()['feed']['port']:
+        import feed
+        feed.start_server()
+    if settings['callback_url']:
+        daemon.register_webhooks(settings['callback_url'])
+    daemon.run_forever()
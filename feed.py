@@ -0,0 +1,220 @@
+"""Local calendar feeds, so dashboards can read the calendars without using the API's quota
+
+With the feed setting's directory set, every calendar pipeline publishes
+its events after each sync: <directory>/<calendar>.json, a compact list
+of the events, and <directory>/<calendar>.ics, the same events as an
+iCalendar feed. The events are exactly the ones written to the calendar
+sheet, in the same order and with the same colors.
+
+The files are only rewritten when the events changed, so runs that
+change nothing leave them (and their ETags) alone. Each file is written
+to a temporary file first and moved into place, so readers never see
+half of one.
+
+serve() makes the feeds available over HTTP (GET /<calendar>.ics or
+/<calendar>.json), with an ETag on each response; a request whose
+If-None-Match has the current ETag gets a 304 and no body. Daemon mode
+serves them too when the feed setting has a port.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from planner import is_planning
+from settings import get_settings
+from utils import COLORS
+
+logger = logging.getLogger('main')
+
+CONTENT_TYPES = {'ics': 'text/calendar; charset=utf-8', 'json': 'application/json'}
+PRODUCT_ID = '-//smartsheet_calendar//calendar feed//EN'
+
+
+def publish(calendar: str, events: list) -> bool:
+    """Writes a calendar's events to its .json and .ics feeds
+    Does nothing if the feed setting has no directory, or while a plan is
+    being made (the calendar sheets aren't written then either).
+    Returns whether the feeds were rewritten.
+    """
+    directory = get_settings()['feed']['directory']
+    if not directory or is_planning():
+        return False
+    events = [event for event in events if event.is_writable()]  # what the calendar sheet holds
+    listing = json.dumps({'calendar': calendar, 'events': [event_json(event) for event in events]},
+                         separators=(',', ':')).encode()
+    json_path, ics_path = (os.path.join(directory, f'{calendar}.{extension}') for extension in ('json', 'ics'))
+    try:
+        with open(json_path, 'rb') as feed_file:
+            if feed_file.read() == listing and os.path.exists(ics_path):
+                logger.debug(f"{calendar} feed unchanged")
+                return False
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+
+    write_atomically(ics_path, ical(calendar, events).encode())
+    write_atomically(json_path, listing)  # last, since it's what tells whether the feeds are up to date
+    logger.info(f"published {len(events)} events to the {calendar} feed")
+    return True
+
+
+def write_atomically(path: str, data: bytes) -> None:
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as feed_file:
+        feed_file.write(data)
+        feed_file.flush()
+        os.fsync(feed_file.fileno())
+    os.replace(temp_path, path)
+
+
+def event_json(event) -> dict:
+    return {'name': event.name, 'start': event.date, 'end': event.end_date or None, 'color': color_hex(event.color)}
+
+
+def color_hex(color) -> str:
+    try:
+        return COLORS[int(color)]
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def ical(calendar: str, events: list) -> str:
+    """Renders events as an iCalendar (RFC 5545) feed of all-day events
+    An event's UID is made from its name and dates, so it stays the same
+    from one run to the next. Events whose start isn't a date are left
+    out.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODUCT_ID}', 'CALSCALE:GREGORIAN',
+             f'X-WR-CALNAME:{escape(calendar)}']
+    seen = {}
+    for event in events:
+        if (start := parse_date(event.date)) is None:
+            continue
+        end = max(parse_date(event.end_date) or start, start) + timedelta(days=1)  # DTEND is exclusive
+        key = f'{event.name}|{event.date}|{event.end_date}'
+        seen[key] = seen.get(key, 0) + 1  # the same event can be on a calendar more than once
+        uid = hashlib.sha1(f'{key}|{seen[key]}'.encode()).hexdigest()
+        lines += ['BEGIN:VEVENT', f'UID:{uid}@smartsheet_calendar', f'DTSTAMP:{stamp}',
+                  f'DTSTART;VALUE=DATE:{start:%Y%m%d}', f'DTEND;VALUE=DATE:{end:%Y%m%d}',
+                  f'SUMMARY:{escape(event.name)}', 'TRANSP:TRANSPARENT', 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ''.join(f'{folded}\r\n' for line in lines for folded in fold(line))
+
+
+def parse_date(value) -> date:
+    # calendar dates are 'YYYY-MM-DD' (possibly followed by a time); anything else isn't one
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def escape(text: str) -> str:
+    return re.sub(r'([\\;,])', r'\\\1', str(text)).replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line: str) -> list:
+    # content lines are folded to at most 75 octets; continuation lines start with a space
+    parts, size = [''], 0
+    for char in line:
+        if size + len(char.encode()) > (75 if len(parts) == 1 else 74):
+            parts.append('')
+            size = 0
+        parts[-1] += char
+        size += len(char.encode())
+    return [parts[0], *(f' {part}' for part in parts[1:])]
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    server: 'FeedServer'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.send_feed(body=True)
+
+    def do_HEAD(self) -> None:
+        self.send_feed(body=False)
+
+    def send_feed(self, body: bool) -> None:
+        found = re.fullmatch(r'/(\w+)\.(ics|json)', unquote(urlparse(self.path).path))
+        feed = self.server.load(f'{found.group(1)}.{found.group(2)}') if found else None
+        if feed is None:
+            return self.respond(404, b'', {'Content-Type': 'text/plain'}, body)
+        data, etag, modified = feed
+        headers = {'ETag': etag, 'Last-Modified': formatdate(modified, usegmt=True), 'Cache-Control': 'no-cache'}
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            return self.respond(304, b'', headers, body)
+        self.respond(200, data, {**headers, 'Content-Type': CONTENT_TYPES[found.group(2)]}, body)
+
+    def respond(self, status: int, data: bytes, headers: dict, body: bool) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body and status != 304:
+            self.wfile.write(data)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+
+class FeedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, directory: str):
+        super().__init__(address, FeedHandler)
+        self.directory = directory
+        self.cache = {}  # {FILE NAME: ((MTIME, SIZE), (DATA, ETAG, MTIME))}
+        self.lock = threading.Lock()
+
+    def load(self, file_name: str) -> tuple:
+        # returns (data, ETag, modification time) of a feed file, or None if there isn't one;
+        # a file is only read again once it has been replaced
+        path = os.path.join(self.directory, file_name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            version, feed = self.cache.get(file_name, (None, None))
+            if version != (stat.st_mtime_ns, stat.st_size):
+                with open(path, 'rb') as feed_file:
+                    data = feed_file.read()
+                feed = data, f'"{hashlib.sha256(data).hexdigest()[:32]}"', stat.st_mtime
+                self.cache[file_name] = (stat.st_mtime_ns, stat.st_size), feed
+            return feed
+
+
+def feed_server() -> FeedServer:
+    settings = get_settings()['feed']
+    if not settings['directory'] or not settings['port']:
+        raise ValueError("set the feed setting's directory and port to serve the calendar feeds")
+    server = FeedServer((settings['host'], settings['port']), settings['directory'])
+    logger.info(f"serving the calendar feeds in {settings['directory']} on {settings['host']}:{settings['port']}")
+    return server
+
+
+def start_server() -> FeedServer:
+    # serves the feeds from a background thread, e.g. next to daemon mode's callback server
+    server = feed_server()
+    threading.Thread(target=server.serve_forever, name='calendar feeds', daemon=True).start()
+    return server
+
+
+def serve() -> None:
+    feed_server().serve_forever()
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import smartsheet
+
+logger = logging.getLogger('main')
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds, upper bounds
+RETRIED_STATUSES = {429, 500, 502, 503, 504}  # statuses the SDK retries; 429 is the rate limit
+NO_PIPELINE = 'control'
+
+_pipeline = ContextVar('pipeline', default=NO_PIPELINE)  # copied into asyncio.to_thread workers
+
+
+@contextmanager
+def pipeline_context(name: str):
+    # API calls made inside the block (and by the async_api calls it starts) are counted against the named pipeline
+    token = _pipeline.set(name)
+    try:
+        yield
+    finally:
+        _pipeline.reset(token)
+
+
+def current_pipeline() -> str:
+    return _pipeline.get()
+
+
+def pipeline_logger() -> logging.Logger:
+    # the logger of the pipeline running in this context ('main.map', ...), so that code shared by the pipelines
+    # logs at the level set for the one it's working for (see the logging setting); 'main' outside of a pipeline
+    pipeline = _pipeline.get()
+    return logger if pipeline == NO_PIPELINE else logging.getLogger(f'main.{pipeline}')
+
+
+def endpoint_name(method: str, url: str) -> str:
+    # "GET https://api.smartsheet.com/2.0/sheets/123/rows?ids=1" -> "GET /sheets/{id}/rows"
+    path = re.sub(r'^[a-z]+://[^/]+(/2\.0)?', '', url.split('?')[0])
+    return f"{method} {re.sub(r'/[0-9]+', '/{id}', path)}"
+
+
+class Stats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.retried = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+
+    def record(self, latency: float, status: int, sent: int, received: int) -> None:
+        self.calls += 1
+        self.errors += status >= 400
+        self.rate_limited += status == 429
+        self.retried += status in RETRIED_STATUSES
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.latency_sum += latency
+        self.latency_buckets[next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound),
+                                  len(LATENCY_BUCKETS))] += 1
+
+    def to_dict(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), self.latency_buckets):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'calls': self.calls, 'errors': self.errors, 'rate_limited': self.rate_limited,
+                'retried': self.retried, 'bytes_sent': self.bytes_sent, 'bytes_received': self.bytes_received,
+                'latency_seconds': {'sum': round(self.latency_sum, 4), 'buckets': buckets}}
+
+
+class Recorder:
+    """Counts every API call, per pipeline and per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.time()
+            self.stats = defaultdict(Stats)  # {(PIPELINE, ENDPOINT): Stats}
+
+    def record(self, endpoint: str, latency: float, status: int, sent: int, received: int) -> None:
+        with self.lock:
+            self.stats[current_pipeline(), endpoint].record(latency, status, sent, received)
+
+    def summary(self) -> dict:
+        with self.lock:
+            pipelines = defaultdict(dict)
+            for (pipeline, endpoint), stats in sorted(self.stats.items()):
+                pipelines[pipeline][endpoint] = stats.to_dict()
+            totals = {pipeline: {key: sum(endpoint[key] for endpoint in endpoints.values())
+                                 for key in ('calls', 'errors', 'rate_limited', 'retried',
+                                             'bytes_sent', 'bytes_received')}
+                      for pipeline, endpoints in pipelines.items()}
+            return {'started': self.started, 'duration_seconds': round(time.time() - self.started, 3),
+                    'totals': totals, 'pipelines': dict(pipelines)}
+
+    def prometheus(self) -> str:
+        # text exposition format, for node_exporter's textfile collector
+        lines = []
+        metrics = [('calls', 'API calls made'), ('errors', 'API calls that returned an error status'),
+                   ('rate_limited', 'API calls rejected by the rate limit'),
+                   ('retried', 'API calls the SDK had to retry'), ('bytes_sent', 'request body bytes'),
+                   ('bytes_received', 'response body bytes')]
+        with self.lock:
+            stats = sorted(self.stats.items())
+        for metric, help_text in metrics:
+            lines += [f'# HELP smartsheet_calendar_api_{metric}_total {help_text}',
+                      f'# TYPE smartsheet_calendar_api_{metric}_total counter']
+            lines += [f'smartsheet_calendar_api_{metric}_total{{{labels(pipeline, endpoint)}}} '
+                      f'{getattr(entry, metric)}' for (pipeline, endpoint), entry in stats]
+        lines += ['# HELP smartsheet_calendar_api_latency_seconds API call latency',
+                  '# TYPE smartsheet_calendar_api_latency_seconds histogram']
+        for (pipeline, endpoint), entry in stats:
+            latency = entry.to_dict()['latency_seconds']
+            for bound, count in latency['buckets'].items():
+                lines.append(f'smartsheet_calendar_api_latency_seconds_bucket'
+                             f'{{{labels(pipeline, endpoint)},le="{bound}"}} {count}')
+            lines.append(f'smartsheet_calendar_api_latency_seconds_sum{{{labels(pipeline, endpoint)}}} '
+                         f'{latency["sum"]}')
+            lines.append(f'smartsheet_calendar_api_latency_seconds_count{{{labels(pipeline, endpoint)}}} '
+                         f'{entry.calls}')
+        return '\n'.join(lines) + '\n'
+
+
+def labels(pipeline: str, endpoint: str) -> str:
+    return f'pipeline="{pipeline}",endpoint="{endpoint}"'
+
+
+recorder = Recorder()
+
+
+def instrument(smart: smartsheet.Smartsheet) -> smartsheet.Smartsheet:
+    """Records every HTTP request the client sends, including the SDK's own retries"""
+    session = smart._session
+    if getattr(session, 'instrumented', False):
+        return smart
+    send = session.send
+
+    def instrumented_send(request, **kwargs):
+        start = time.perf_counter()
+        response = send(request, **kwargs)
+        body = request.body or b''
+        recorder.record(endpoint_name(request.method, request.url), time.perf_counter() - start,
+                        response.status_code, len(body), len(response.content))
+        return response
+
+    session.send = instrumented_send
+    session.instrumented = True
+    return smart
+
+
+def write_report(summary_file: str = None, prometheus_file: str = None) -> dict:
+    # writes the run's JSON summary and/or Prometheus textfile; both are replaced atomically
+    summary = recorder.summary()
+    for path, contents in ((summary_file, lambda: json.dumps(summary, indent=2)),
+                           (prometheus_file, recorder.prometheus)):
+        if path:
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'w') as report_file:
+                report_file.write(contents())
+            os.replace(temp_path, path)
+    for pipeline, totals in summary['totals'].items():
+        logger.info(f"{pipeline}: {totals['calls']} API calls, {totals['rate_limited']} rate limited, "
+                    f"{totals['bytes_sent']} bytes sent, {totals['bytes_received']} bytes received")
+    return summary
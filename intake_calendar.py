@@ -1,68 +1,71 @@
 #!/usr/bin/env python3
 
 import logging
-from itertools import cycle
+from functools import partial
 from re import match
 
 import smartsheet
 
-from utils import COLOR_INDEX, clear_and_write_sheet, column_name_to_id_map, get_cell_by_column_name, \
-    replace_event_names
-
-logger = logging.getLogger('main')
-
-smart = smartsheet.Smartsheet()  # use 'SMARTSHEET_ACCESS_TOKEN' env variable
-smart.errors_as_exceptions(True)
-CHANGE_AGENT = "dkarpele_smartsheet_calendar"
-smart.with_change_agent(CHANGE_AGENT)
-
-
-def intake_processing(intake_sheet_id: int) -> list:
-    new_cells = []
-    color_cycle = cycle(COLOR_INDEX)
-    sheet = smart.Sheets.get_sheet(intake_sheet_id)
-    rows = sheet.rows
-    columns = sheet.columns
-    col_map = column_name_to_id_map(columns=columns)
-    date_cols = [
-        col
-        for col in columns
-        if col.type == "DATE"
-        and not col.hidden
-        and col.title != "Event Start Date"
-        and col.title != "Event End Date"
-    ]
-    logger.debug(f"found {len(columns)} total columns")
+from client import LazyClient
+from feed import publish
+from sheet_cache import cached_by_sheet_version
+from sync_state import incremental_events
+from transform import RowTransform
+from utils import RowExtractor, replace_event_names, sync_sheet
+
+logger = logging.getLogger('main.intake')  # its level can be set on its own, see settings.py
+
+smart = LazyClient()  # the shared client, built on first use from the 'SMARTSHEET_ACCESS_TOKEN' env variable
+
+
+@cached_by_sheet_version(smart)
+def intake_processing(intake_sheet_id: int, version: int = None) -> list:
+    return incremental_events(smart, 'intake', intake_sheet_id, intake_row_processor, version, intake_columns)
+
+
+INTAKE_COLUMNS = ["Event Name", "Event State & Type", "Event Start Date", "Event End Date"]
+
+
+def is_date_column(col: smartsheet.models.Column) -> bool:
+    # every other visible date column becomes its own calendar event
+    return col.type == "DATE" and not col.hidden and col.title not in ("Event Start Date", "Event End Date")
+
+
+def intake_columns(columns: list) -> list:
+    return [col for col in columns if col.title in INTAKE_COLUMNS or is_date_column(col)]
+
+
+def intake_row_processor(columns: list) -> RowTransform:
+    date_cols = [col for col in columns if is_date_column(col)]
     logger.debug(f"found {len(date_cols)} date-type columns")
-    logger.debug(f"found {len(rows)} rows")
-    for row in rows:
-        event = get_cell_by_column_name(row, "Event Name", col_map).value
-        # if the row matches, it is a label row. Contains no data so it's skipped
-        if match(r"^Q[1-4] FY\d{2}", event):
-            logger.debug(f"{event} was identified as a separator row")
-            continue
-        event_state = get_cell_by_column_name(row, "Event State & Type", col_map).value
-        if event_state is not None and "Canceled" in event_state:
-            logger.debug(f"{event} was identified as a canceled event")
-            event = f'(Canceled) {event}'
-        logger.debug(f"{event} is being processed")
-        color = next(color_cycle)  # each event gets its own color
-        event = replace_event_names(event)  # do some filtering to shorten some words
-
-        start_col = next(col for col in columns if col.title == "Event Start Date")
-        end_col = next(col for col in columns if col.title == "Event End Date")
-        start_date = row.get_column(start_col.id).value
-        end_date = row.get_column(end_col.id).value
-        new_cells.append((event, start_date or "", end_date or "", color))
-
-        for date_col in date_cols:
-            item = replace_event_names(date_col.title)
-            name = f"{event} | {item}"
-            date = row.get_column(date_col.id).value
-            new_cells.append((name, date or "", "", color))
-
-    return new_cells
+    extractor = RowExtractor(columns, [*INTAKE_COLUMNS, *(col.title for col in date_cols)])
+    return RowTransform(extractor.values,
+                        partial(intake_events, date_names=[replace_event_names(col.title) for col in date_cols]))
+
+
+def intake_events(values: tuple, date_names: list) -> list:
+    # values are the row's INTAKE_COLUMNS values, then its date columns', in the order of date_names
+    event, event_state, start, end, *dates = values
+    # if the row matches, it is a label row. Contains no data so it's skipped
+    if match(r"^Q[1-4] FY\d{2}", event):
+        logger.debug("%s was identified as a separator row", event)
+        return []
+    if event_state is not None and "Canceled" in event_state:
+        logger.debug("%s was identified as a canceled event", event)
+        event = f'(Canceled) {event}'
+    logger.debug("%s is being processed", event)
+    event = replace_event_names(event)  # do some filtering to shorten some words
+
+    events = [(event, start or "", end or "")]
+
+    for item, date in zip(date_names, dates):
+        name = f"{event} | {item}"
+        events.append((name, date or "", ""))
+
+    return events
 
 
 def process_sheet(sheet_ids) -> None:
-    clear_and_write_sheet(smart, sheet_ids['destination'], intake_processing(sheet_ids['source']))
+    events = intake_processing(sheet_ids['source'])
+    sync_sheet(smart, sheet_ids['destination'], events)
+    publish('intake', events)
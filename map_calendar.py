@@ -1,63 +1,72 @@
 #!/usr/bin/env python3
 
 import logging
-from itertools import cycle
+from functools import partial
 from re import match
 
 import smartsheet
 
-from utils import COLOR_INDEX, clear_and_write_sheet, column_name_to_id_map, get_cell_by_column_name
+from client import LazyClient
+from feed import publish
+from sheet_cache import cached_by_sheet_version
+from sync_state import incremental_events
+from transform import RowTransform
+from utils import RowExtractor, sync_sheet
 
-logger = logging.getLogger('main')
+logger = logging.getLogger('main.map')  # its level can be set on its own, see settings.py
 
-smart = smartsheet.Smartsheet()  # use 'SMARTSHEET_ACCESS_TOKEN' env variable
-smart.errors_as_exceptions(True)
-CHANGE_AGENT = "dkarpele_smartsheet_calendar"
-smart.with_change_agent(CHANGE_AGENT)
+smart = LazyClient()  # the shared client, built on first use from the 'SMARTSHEET_ACCESS_TOKEN' env variable
 
 
-def map_processing(map_sheet_id: int) -> list:
-    new_cells = []
-    color_cycle = cycle(COLOR_INDEX)
-    sheet = smart.Sheets.get_sheet(map_sheet_id)
-    rows = sheet.rows
-    columns = sheet.columns
-    col_map = column_name_to_id_map(columns=columns)
-    logger.debug(f"found {len(columns)} total columns")
-    logger.debug(f"found {len(rows)} rows")
-    for row in rows:
-        event = get_cell_by_column_name(row, "Event Name", col_map).display_value
-        # if the row matches any of the below, it should not be added to the calendar
-        if match(r"^Q[1-4]", str(event)) or not row.parent_id or event is None:
-            logger.debug(f"{event} was identified as a non-event row")
-            continue
-        if get_cell_by_column_name(row, "TechX Status", col_map).value != 'Green':
-            logger.debug(f"{event} was identified as an unconfirmed event")
-            continue
+@cached_by_sheet_version(smart)
+def map_processing(map_sheet_id: int, version: int = None) -> list:
+    return incremental_events(smart, 'map', map_sheet_id, map_row_processor, version, map_columns)
 
-        logger.debug(f"{event} is being processed")
-        color = next(color_cycle)  # each event gets its own color
 
-        just_event = event
-        if staff := get_cell_by_column_name(row, "TechX Resource", col_map).value:
-            staff = staff.strip('"')
-            logger.debug(f"    {event} staff identified: {staff}")
-            event = f'{event} | {staff}'
-        else:
-            logger.debug(f"    {event} was identified as an event without anyone assigned")
+MAP_COLUMNS = ["Event Name", "TechX Status", "TechX Resource", "Event Start Date", "Event End Date",
+               "JLL Hand over date", "Move In Date"]
 
-        start_date = get_cell_by_column_name(row, "Event Start Date", col_map).value
-        end_date = get_cell_by_column_name(row, "Event End Date", col_map).value
-        new_cells.append((event, start_date or "", end_date or "", color))
 
-        jll_date = get_cell_by_column_name(row, "JLL Hand over date", col_map).value
-        new_cells.append((just_event + ' | JLL Hand Over', jll_date or "", "", color))
+def map_columns(columns: list) -> list:
+    return [col for col in columns if col.title in MAP_COLUMNS]
 
-        setup_date = get_cell_by_column_name(row, "Move In Date", col_map).value
-        new_cells.append((just_event + ' | Setup Start', setup_date or "", "", color))
 
-    return new_cells
+def map_row_processor(columns: list) -> RowTransform:
+    return RowTransform(partial(map_row_values, extractor=RowExtractor(columns, MAP_COLUMNS)), map_events)
+
+
+def map_row_values(row: smartsheet.models.Row, extractor: RowExtractor) -> tuple:
+    # the row's parent, then its MAP_COLUMNS values; the event name is read as it is displayed
+    event_cell, *cells = extractor.cells(row)
+    return (row.parent_id, event_cell.display_value, *(cell.value for cell in cells))
+
+
+def map_events(values: tuple) -> list:
+    parent_id, event, status, staff, start, end, jll, setup = values
+    # if the row matches any of the below, it should not be added to the calendar
+    if match(r"^Q[1-4]", str(event)) or not parent_id or event is None:
+        logger.debug("%s was identified as a non-event row", event)
+        return []
+    if status != 'Green':
+        logger.debug("%s was identified as an unconfirmed event", event)
+        return []
+
+    logger.debug("%s is being processed", event)
+
+    just_event = event
+    if staff:
+        staff = staff.strip('"')
+        logger.debug("    %s staff identified: %s", event, staff)
+        event = f'{event} | {staff}'
+    else:
+        logger.debug("    %s was identified as an event without anyone assigned", event)
+
+    return [(event, start or "", end or ""),
+            (just_event + ' | JLL Hand Over', jll or "", ""),
+            (just_event + ' | Setup Start', setup or "", "")]
 
 
 def process_sheet(sheet_ids) -> None:
-    clear_and_write_sheet(smart, sheet_ids['destination'], map_processing(sheet_ids['source']))
+    events = map_processing(sheet_ids['source'])
+    sync_sheet(smart, sheet_ids['destination'], events)
+    publish('map', events)
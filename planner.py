@@ -0,0 +1,339 @@
+"""Dry runs that save every write a run would make, to check its cost and send it later
+
+Inside planning(), the shared client doesn't send adds, updates or
+deletes: each one is recorded as an operation (the pipeline it came
+from, the method, the path and the exact JSON body, chunked as it would
+have been) and answered with a made-up success response. Reads still go
+to the API, so every pipeline plans against the sheets as they are.
+
+Rows that would have been added (or copied) get negative placeholder
+ids, so that later operations can refer to them, like request to map's
+quarter rows under a new FY row, or the placing and formatting of rows
+it moved. execute_plan
+sends the operations in order and swaps in the real ids as the rows are
+created.
+
+A plan only holds while the sheets it writes to are unchanged, so their
+versions are saved with it and checked before anything is sent. The
+pipelines downstream of a planned write (e.g. map after request to map)
+plan against the sheet as it was before that write.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import unquote
+
+import requests
+import smartsheet
+
+from async_api import run_concurrently
+from instrumentation import current_pipeline, recorder
+from settings import get_settings
+from utils import RowsPayload
+
+logger = logging.getLogger('main')
+
+ROW_ID_KEYS = ('id', 'parentId', 'siblingId')  # where a planned row's placeholder id can turn up in a body
+PLACEHOLDER_IN_PATH = re.compile(r'(?<=[=,])-\d+')  # and in a path, e.g. rows?ids=-3,-4
+
+_plan = None  # the Plan being recorded, while inside planning()
+_plan_lock = threading.Lock()
+
+
+class PlanOutdatedError(RuntimeError):
+    pass
+
+
+class Plan:
+    def __init__(self):
+        self.operations = []  # [{'pipeline', 'method', 'path', 'body', 'creates': [PLACEHOLDERS]}]
+        self.versions = {}  # {SHEET ID: VERSION} of every sheet the operations write to
+        self.placeholders = 0
+
+    def record(self, method: str, path: str, body) -> list:
+        # returns the placeholder ids of the rows the operation adds, if any
+        with _plan_lock:
+            creates = []
+            if method == 'POST' and path.split('?')[0].endswith(('/rows', '/rows/copy')):
+                created = len(body['rowIds']) if is_copy(path) else len(rows_of(body))
+                creates = [-(self.placeholders + number) for number in range(1, created + 1)]
+                self.placeholders += len(creates)
+            self.operations.append({'pipeline': current_pipeline(), 'method': method, 'path': path,
+                                    'body': body, 'creates': creates})
+            return creates
+
+    def sheet_ids(self) -> set:
+        return {sheet_id_of(operation['path']) for operation in self.operations} - {None}
+
+    def estimate(self, reads: int) -> dict:
+        # reads is how many read calls planning made; a real run makes the same ones
+        rate = get_settings()['rate_limit']['requests_per_minute']
+        pipelines = {}
+        for operation in self.operations:
+            entry = pipelines.setdefault(operation['pipeline'], {'calls': 0, 'payload_bytes': 0})
+            entry['calls'] += 1
+            entry['payload_bytes'] += len(json.dumps(operation['body'])) if operation['body'] is not None else 0
+        writes = len(self.operations)
+        return {'write_calls': writes,
+                'payload_bytes': sum(entry['payload_bytes'] for entry in pipelines.values()),
+                'read_calls': reads,
+                'run_minutes': round((reads + writes) / rate, 2),  # at the rate limit, for a run from scratch
+                'replay_minutes': round((len(self.versions) + writes) / rate, 2),
+                'pipelines': pipelines}
+
+    def to_dict(self) -> dict:
+        return {'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'versions': self.versions,
+                'operations': self.operations}
+
+
+def rows_of(body) -> list:
+    # rows endpoints take either one row or a list of them
+    return body if isinstance(body, list) else [body]
+
+
+def is_copy(path: str) -> bool:
+    return path.split('?')[0].endswith('/rows/copy')
+
+
+def sheet_id_of(path: str) -> int:
+    found = re.match(r'/sheets/(\d+)', path)
+    return int(found.group(1)) if found else None
+
+
+@contextmanager
+def planning():
+    """Records the writes made inside the block instead of sending them
+    Yields the Plan they are recorded in. Only one plan can be recorded
+    at a time, and every pipeline thread writes to it.
+    """
+    global _plan
+    with _plan_lock:
+        if _plan is not None:
+            raise RuntimeError("already planning")
+        _plan = plan = Plan()
+    try:
+        yield plan
+    finally:
+        with _plan_lock:
+            _plan = None
+
+
+def is_planning() -> bool:
+    return _plan is not None
+
+
+def echo_row(row: dict) -> dict:
+    # a row as the API returns it: cells only have their value, since objectValue isn't asked for
+    return {**row, 'cells': [{'columnId': cell.get('columnId'), 'value': cell_value(cell)}
+                             for cell in row.get('cells') or ()]}
+
+
+def cell_value(cell: dict):
+    if 'value' not in cell and isinstance(values := (cell.get('objectValue') or {}).get('values'), list):
+        return ', '.join(values)  # a multi-picklist's value is its options, listed
+    return cell.get('value')
+
+
+def planned_response(request, creates: list, body) -> requests.Response:
+    # what the API would have answered, as far as the pipelines care: the rows as sent, with placeholder ids
+    query = unquote(request.url).partition('?')[2]
+    if request.method == 'POST' and creates and is_copy(request.url):
+        # copy_rows answers with the ids of the copies, instead of the usual result
+        return json_response(request, {'destinationSheetId': body['to']['sheetId'],
+                                       'rowMappings': [{'from': row_id, 'to': placeholder}
+                                                       for row_id, placeholder in zip(body['rowIds'], creates)]})
+    if request.method == 'POST' and creates:
+        rows = [{**echo_row(row), 'id': row_id} for row_id, row in zip(creates, rows_of(body))]
+        for row in rows:
+            if not any(key in row for key in ('toTop', 'toBottom', 'parentId', 'siblingId')):
+                row['toBottom'] = True  # where the API puts rows without a location
+        result = rows
+    elif request.method == 'PUT' and body is not None:
+        result = [echo_row(row) for row in rows_of(body)]
+    elif request.method == 'DELETE' and (ids := re.search(r'ids=([-\d,]+)', query)):
+        result = [int(row_id) for row_id in ids.group(1).split(',')]
+    else:
+        result = None
+    payload = {'message': 'SUCCESS', 'resultCode': 0, 'result': result}
+    if 'allowPartialSuccess=true' in query:
+        payload['failedItems'] = []
+    return json_response(request, payload)
+
+
+def json_response(request, payload: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json;charset=UTF-8'
+    response.encoding = 'utf-8'
+    response._content = json.dumps(payload).encode()
+    response.request = request
+    response.url = request.url
+    return response
+
+
+def plannable(smart: smartsheet.Smartsheet) -> smartsheet.Smartsheet:
+    """Lets planning() intercept the client's writes
+    Goes outside the scheduler and instrumentation, so planned writes
+    don't wait for the rate limit and aren't counted as API calls.
+    """
+    session = smart._session
+    if getattr(session, 'plannable', False):
+        return smart
+    send = session.send
+    api_base = smart._api_base
+
+    def plannable_send(request, **kwargs):
+        plan = _plan
+        if plan is None or request.method == 'GET':
+            return send(request, **kwargs)
+        body = json.loads(request.body) if request.body else None
+        path = unquote(request.url[len(api_base):] if request.url.startswith(api_base) else request.url)
+        return planned_response(request, plan.record(request.method, path, body), body)
+
+    session.send = plannable_send
+    session.plannable = True
+    return smart
+
+
+def make_plan(plan_file: str, pipelines: set = None) -> dict:
+    """Runs the pipelines without writing anything, and saves what they would have written
+    Returns the plan's cost estimate, which is also saved with it.
+    """
+    import calendar_control
+    from client import shared_client
+
+    smart = shared_client()
+    with planning() as plan:
+        calendar_control.run(pipelines)
+    reads = sum(totals['calls'] for totals in recorder.summary()['totals'].values())
+    sheet_ids = sorted(plan.sheet_ids())
+    versions = run_concurrently([partial(smart.Sheets.get_sheet_version, sheet_id) for sheet_id in sheet_ids])
+    plan.versions = {str(sheet_id): version.version for sheet_id, version in zip(sheet_ids, versions)}
+
+    estimate = plan.estimate(reads)
+    with open(plan_file, 'w') as file:
+        json.dump({**plan.to_dict(), 'estimate': estimate}, file, indent=1)
+    for pipeline, entry in estimate['pipelines'].items():
+        logger.info(f"{pipeline}: {entry['calls']} write calls planned, {entry['payload_bytes']} bytes")
+    logger.info(f"planned {estimate['write_calls']} write calls after {estimate['read_calls']} reads: "
+                f"about {estimate['run_minutes']} minutes at the rate limit, "
+                f"{estimate['replay_minutes']} to replay; saved to {plan_file}")
+    return estimate
+
+
+def check_versions(smart: smartsheet.Smartsheet, versions: dict) -> None:
+    sheet_ids = list(versions)
+    current = run_concurrently([partial(smart.Sheets.get_sheet_version, int(sheet_id)) for sheet_id in sheet_ids])
+    changed = [sheet_id for sheet_id, version in zip(sheet_ids, current) if version.version != versions[sheet_id]]
+    if changed:
+        raise PlanOutdatedError(f"sheets {', '.join(changed)} changed since the plan was made; make a new plan")
+
+
+def execute_plan(plan_file: str, force: bool = False) -> None:
+    """Sends the operations saved by make_plan
+    Each pipeline's operations are sent in the order they were planned.
+    Consecutive operations that don't depend on each other, and don't put
+    rows in the same place, are sent concurrently. Raises PlanOutdatedError without sending anything if
+    one of the sheets changed since (unless force is set). An operation
+    that fails is logged and the rest are still sent.
+    """
+    from client import shared_client
+
+    smart = shared_client()
+    with open(plan_file) as file:
+        saved = json.load(file)
+    if not force:
+        check_versions(smart, saved['versions'])
+
+    row_ids = {}  # {PLACEHOLDER: REAL ROW ID}
+    by_pipeline = {}
+    for operation in saved['operations']:
+        by_pipeline.setdefault(operation['pipeline'], []).append(operation)
+    for pipeline, operations in by_pipeline.items():
+        failures = 0
+        for group in independent_groups(operations):
+            results = run_concurrently([partial(send_operation, smart, operation, row_ids) for operation in group])
+            failures += results.count(False)
+        logger.info(f"{pipeline}: sent {len(operations) - failures} of {len(operations)} planned operations")
+
+
+def independent_groups(operations: list):
+    # splits operations into runs of the same call that don't use rows added earlier in the run, or put rows where
+    # an earlier one in the run did (the later rows have to land after them)
+    group, created, placed = [], set(), set()
+    for operation in operations:
+        key = (operation['method'], operation['path'].split('?')[0])
+        if group and (key != (group[0]['method'], group[0]['path'].split('?')[0])
+                      or created & set(placeholders_in(operation)) or placed & locations_in(operation)):
+            yield group
+            group, created, placed = [], set(), set()
+        group.append(operation)
+        created.update(operation['creates'])
+        placed.update(locations_in(operation))
+    if group:
+        yield group
+
+
+def locations_in(operation: dict) -> set:
+    # where the rows of an operation are put: {(PARENT ID, SIBLING ID, TO BOTTOM)}; rows added (or copied) without
+    # a location go to the bottom of the sheet, like the API puts them
+    rows = rows_of(operation['body']) if operation['body'] is not None else ()
+    locations = set()
+    for row in rows:
+        if isinstance(row, dict):
+            location = (row.get('parentId'), row.get('siblingId'), bool(row.get('toBottom')))
+            if location == (None, None, False) and operation['method'] == 'POST':
+                location = (None, None, True)
+            if location != (None, None, False):
+                locations.add(location)
+    return locations
+
+
+def placeholders_in(operation: dict) -> list:
+    found = [int(row_id) for row_id in PLACEHOLDER_IN_PATH.findall(operation['path'])]
+    for row in rows_of(operation['body']) if operation['body'] is not None else ():
+        if isinstance(row, dict):
+            found += [row[key] for key in ROW_ID_KEYS if isinstance(row.get(key), int) and row[key] < 0]
+    return found
+
+
+def resolve(value, row_ids: dict):
+    # swaps placeholder ids for the ids of the rows that were actually added
+    if isinstance(value, list):
+        return [resolve(item, row_ids) for item in value]
+    if isinstance(value, dict):
+        return {key: row_ids.get(item, item) if key in ROW_ID_KEYS and isinstance(item, int)
+                else resolve(item, row_ids) for key, item in value.items()}
+    return value
+
+
+def send_operation(smart: smartsheet.Smartsheet, operation: dict, row_ids: dict) -> bool:
+    path = PLACEHOLDER_IN_PATH.sub(lambda found: str(row_ids.get(int(found.group()), found.group())),
+                                   operation['path'])
+    body = resolve(operation['body'], row_ids)
+    payload = RowsPayload(body) if isinstance(body, list) else smartsheet.models.JSONObject(body)
+    try:
+        if operation['method'] == 'DELETE':
+            response = smart.Passthrough.delete(path)
+        else:
+            response = getattr(smart.Passthrough, operation['method'].lower())(path, payload)
+    except Exception as e:
+        logger.error(f"{operation['method']} {path} failed: {e}")
+        return False
+
+    if operation['creates'] and is_copy(path):
+        copies = {mapping['from']: mapping['to'] for mapping in response.to_dict().get('rowMappings') or ()}
+        row_ids.update((placeholder, copies[row_id])
+                       for row_id, placeholder in zip(body['rowIds'], operation['creates']) if row_id in copies)
+    elif operation['creates']:
+        result = response.to_dict()
+        failed = {item['index'] for item in result.get('failedItems') or ()}
+        added = iter(result.get('result') or ())
+        for index, placeholder in enumerate(operation['creates']):
+            if index not in failed:
+                row_ids[placeholder] = next(added)['id']
+    return True
@@ -1,18 +1,13 @@
-from datetime import date, datetime
-
-YEARS_AND_QUARTERS = {
-    20: {
-        1: (date(2019, 7, 28), date(2019, 10, 26)),
-        2: (date(2019, 10, 27), date(2020, 1, 25)),
-        3: (date(2020, 1, 26), date(2020, 4, 25)),
-        4: (date(2020, 4, 26), date(2020, 7, 25)),
-    },
-    21: {
-        1: (date(2020, 7, 26), date(2020, 10, 24)),
-        2: (date(2020, 10, 25), date(2021, 1, 23)),
-        3: (date(2021, 1, 24), date(2021, 5, 1)),
-        4: (date(2021, 5, 2), date(2021, 7, 31)),
-    },
+import threading
+from bisect import bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+QUARTER_WEEKS = 4 + 4 + 5  # every quarter is three fiscal months of 4, 4 and 5 weeks
+LONG_QUARTER = 3  # in a 53-week year the extra week goes to Q3, as in FY21
+
+# years whose quarters don't follow the rule, {FY: {QUARTER: (START, END)}}
+IRREGULAR_YEARS = {
     22: {
         1: (date(2021, 8, 1), date(2021, 10, 24)),
         2: (date(2021, 10, 25), date(2022, 1, 23)),
@@ -25,71 +20,91 @@ YEARS_AND_QUARTERS = {
         3: (date(2023, 1, 29), date(2023, 4, 29)),
         4: (date(2023, 4, 30), date(2023, 7, 29)),
     },
-    24: {
-        1: (date(2023, 7, 30), date(2023, 10, 28)),
-        2: (date(2023, 10, 29), date(2024, 1, 27)),
-        3: (date(2024, 1, 28), date(2024, 4, 27)),
-        4: (date(2024, 4, 28), date(2024, 7, 27)),
-    },
     25: {
         1: (date(2024, 7, 28), date(2024, 10, 27)),
         2: (date(2024, 10, 28), date(2025, 2, 2)),
         3: (date(2025, 2, 3), date(2025, 4, 28)),
         4: (date(2025, 4, 29), date(2025, 7, 26)),
     },
-    26: {
-        1: (date(2025, 7, 27), date(2025, 10, 25)),
-        2: (date(2025, 10, 26), date(2026, 1, 24)),
-        3: (date(2026, 1, 25), date(2026, 4, 25)),
-        4: (date(2026, 4, 26), date(2026, 7, 25)),
-    },
-    27: {  # estimated, need to update once calendar is out
-        1: (date(2026, 7, 26), date(2026, 10, 25)),
-        2: (date(2026, 10, 26), date(2027, 1, 24)),
-        3: (date(2027, 1, 25), date(2027, 4, 25)),
-        4: (date(2027, 4, 26), date(2027, 7, 25)),
-    },
 }
 
+# FY27 follows the rule rather than the estimate the old hardcoded table had for it. It is a 53-week year (FY28
+# starts on 2027-08-01), so its Q1 and Q2 end a day earlier, on 2026-10-24 and 2027-01-23, and Q3 takes the extra
+# week, up to 2027-05-01. That moves 8 of the estimate's days to another quarter (2026-10-25, 2027-01-24 and
+# 2027-04-26 to 05-01), and FY27 ends on 2027-07-31 instead of 07-25. FY22 to FY26 are unchanged, see
+# tests/test_fy_q_sort.py
+
+FIRST_FY = 20  # the table always covers at least FY20 through FY27
+LAST_FY = 27
+
+# (QUARTER START ORDINALS, (FY, QUARTER) FOR EACH START, ORDINAL OF THE DAY AFTER THE LAST QUARTER),
+# replaced as a whole whenever it's extended, so lookups never see it half-built
+_table = ((), (), 0)
+_table_lock = threading.Lock()
+
+
+def fy_start(fy: int) -> date:
+    # a fiscal year starts on the Sunday after the last Saturday of July
+    july_31 = date(2000 + fy - 1, 7, 31)
+    return july_31 - timedelta(days=(july_31.weekday() - 5) % 7) + timedelta(days=1)
+
+
+def fiscal_quarters(fy: int) -> dict:
+    """Works out a fiscal year's quarters from the 4-4-5 rule
+    Years listed in IRREGULAR_YEARS are returned as listed.
+    Returns {QUARTER: (START, END)}
+    """
+    if fy in IRREGULAR_YEARS:
+        return IRREGULAR_YEARS[fy]
+    start = fy_start(fy)
+    long_year = (fy_start(fy + 1) - start).days == 53 * 7
+    quarters = {}
+    for quarter in range(1, 5):
+        end = start + timedelta(weeks=QUARTER_WEEKS + (long_year and quarter == LONG_QUARTER))
+        quarters[quarter] = (start, end - timedelta(days=1))
+        start = end
+    return quarters
+
+
+def extend_table(first_fy: int, last_fy: int) -> None:
+    global _table
+    with _table_lock:
+        starts, labels, end = _table
+        if starts:
+            first_fy, last_fy = min(first_fy, labels[0][0]), max(last_fy, labels[-1][0])
+        starts, labels = [], []
+        for fy in range(first_fy, last_fy + 1):
+            for quarter, (start, end) in fiscal_quarters(fy).items():
+                starts.append(start.toordinal())
+                labels.append((fy, quarter))
+        _table = (tuple(starts), tuple(labels), end.toordinal() + 1)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(input_date: str) -> int:
+    return date.fromisoformat(input_date).toordinal()
+
 
 def calc_fy_q_hardcoded(input_date):
-    input_date = datetime.strptime(input_date, '%Y-%m-%d').date()
-    for year, quarters in YEARS_AND_QUARTERS.items():
-        for quarter, time_range in quarters.items():
-            if time_range[0] <= input_date <= time_range[1]:
-                return year, quarter
-    else:
-        # if all else fails, return the next year after the last known year, Q1
-        return max(YEARS_AND_QUARTERS.keys()) + 1, 1
-
-
-def print_quarters():
-    for year, quarters in YEARS_AND_QUARTERS.items():
+    # takes a 'YYYY-MM-DD' date and returns its (FY, QUARTER); the table grows to cover any date it's given
+    day = parse_date(input_date)
+    starts, labels, end = _table
+    if not starts or not starts[0] <= day < end:
+        year = date.fromordinal(day).year - 2000
+        extend_table(min(year, FIRST_FY), max(year + 1, LAST_FY))
+        starts, labels, end = _table
+    return labels[bisect_right(starts, day) - 1]
+
+
+def print_quarters(first_fy: int = FIRST_FY, last_fy: int = LAST_FY):
+    for year in range(first_fy, last_fy + 1):
         print(f'FY{year}:')
-        for quarter, time_range in quarters.items():
+        for quarter, time_range in fiscal_quarters(year).items():
             print(f'\tQ{quarter}:')
             print(f'\t\ttime range: {time_range[0]} – {time_range[1]}')
             print(f'\t\tduration: {(time_range[1] - time_range[0]).days}')
 
 
 if __name__ == '__main__':
-    test_dates = ['2017-04-20',
-                  '2020-01-01',
-                  '2020-07-22',
-                  '2020-07-27',
-                  '2021-07-31',
-                  '2021-10-08',
-                  '2022-10-08',
-                  '2023-10-08',
-                  '2024-10-08', ]
-    print('test:')
-    for test_date in test_dates:
-        print(test_date)
-        # second test - calculate quarter from a hardcoded list of quarters with start/end dates
-        result = calc_fy_q_hardcoded(test_date)
-        print('result:')
-        print(f'\t{result}')
-        print(f'\tFY{result[0]} Q{result[1]}\n')
-
-    # just print all the years and quarters
+    # print all the years and quarters; the lookups are checked in tests/test_fy_q_sort.py
     print_quarters()
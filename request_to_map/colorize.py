@@ -1,5 +1,16 @@
+import logging
+
+from functools import partial
+
 import smartsheet
 
+from async_api import run_concurrently
+from request_to_map.sheet_tree import SheetTree
+from scheduler import COSMETIC, priority
+from utils import MAX_ROWS_PER_REQUEST, chunks
+
+logger = logging.getLogger('main.request to map')
+
 color_white = 2
 color_for_year_row = 21
 color_for_quarter = {0: {'quarter row': 12, 'event row': 5},
@@ -10,31 +21,52 @@ color_for_quarter = {0: {'quarter row': 12, 'event row': 5},
 fallback_color = {'quarter row': color_white, 'event row': color_white}
 
 
-def colorize_rows(smart: smartsheet.Smartsheet, sheet_id: int) -> None:
-    from request_to_map.request_to_map_calendar import find_child_rows, find_fy_rows
-    rows_to_update = []
-    for year_row in find_fy_rows(sheet_id):
-        year_color = color_white
-        if any(row.parent_id == year_row.id for row in smart.Sheets.get_sheet(sheet_id).rows):
-            year_color = color_for_year_row
-        new_row = copy_row(year_row)
-        new_row = process_row(new_row, year_color)
-        rows_to_update.append(new_row)
+def colorize_rows(smart: smartsheet.Smartsheet, tree: SheetTree) -> None:
+    """Colors the map sheet from an already-fetched SheetTree
+    Works out every FY, quarter and event row's target color in one walk
+    of the tree, and only sends the rows whose current format doesn't
+    already have that color, chunked into update_rows calls that are
+    sent concurrently, behind any other pipeline's reads and writes.
+    """
+    rows_to_update = [process_row(copy_row(row), color)
+                      for row, color in target_colors(tree)
+                      if needs_color(row, color)]
+    logger.debug(f'{len(rows_to_update)} rows need to be recolored')
 
-        for quarter_num, quarter_row in enumerate(find_child_rows(sheet_id, year_row.id)):
-            new_row = copy_row(quarter_row)
-            new_row = process_row(new_row, color_for_quarter.get(quarter_num, fallback_color)["quarter row"])
-            rows_to_update.append(new_row)
+    with priority(COSMETIC):
+        run_concurrently([partial(send_colors, smart, tree.sheet_id, chunk)
+                          for chunk in chunks(rows_to_update, MAX_ROWS_PER_REQUEST)])
 
-            for event_row in find_child_rows(sheet_id, quarter_row.id):
-                new_row = copy_row(event_row)
-                new_row = process_row(new_row, color_for_quarter.get(quarter_num, fallback_color)["event row"])
-                rows_to_update.append(new_row)
 
+def send_colors(smart: smartsheet.Smartsheet, sheet_id: int, rows: list) -> None:
     try:
-        smart.Sheets.update_rows(sheet_id, rows_to_update)
+        smart.Sheets.update_rows(sheet_id, rows)
     except Exception as e:
-        print(e)
+        logger.error(e)
+
+
+def target_colors(tree: SheetTree):
+    # yields (row, color) for every FY row, its quarters and their events
+    for year_row in tree.fy_rows():
+        yield year_row, color_for_year_row if tree.has_children(year_row.id) else color_white
+
+        for quarter_num, quarter_row in enumerate(tree.child_rows(year_row.id)):
+            colors = color_for_quarter.get(quarter_num, fallback_color)
+            yield quarter_row, colors['quarter row']
+
+            for event_row in tree.child_rows(quarter_row.id):
+                yield event_row, colors['event row']
+
+
+def needs_color(row: smartsheet.models.row, color: int) -> bool:
+    return (background_color(row.format) != str(color)
+            or any(background_color(cell.format) != str(color) for cell in row.cells))
+
+
+def background_color(row_format: str) -> str:
+    # the background color index is the 10th field of a format descriptor
+    fields = (row_format or '').split(',')
+    return fields[9] if len(fields) > 9 else ''
 
 
 def copy_row(row: smartsheet.models.row) -> smartsheet.models.row:
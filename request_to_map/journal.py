@@ -0,0 +1,118 @@
+"""Write-ahead journal of the rows request to map moves to the map sheet
+
+Moving a row takes two writes: adding it to the map sheet, then setting
+its TechX Status to Green on the request sheet. Each request row is
+journaled as PLANNED before its add is sent, as ADDED (with the id of
+the new map row) once the add is confirmed, and as DONE once its status
+is. Rows copied on the server are COPIED (to the bottom of the map
+sheet) in between, until they are put in their quarter. A run that dies
+part way leaves the row Yellow, and the next run reads the journal
+instead of adding it again:
+
+- ADDED rows only have their status set;
+- COPIED rows are put in their quarter, without being copied again;
+- PLANNED rows are looked up in the map sheet (which is downloaded
+  anyway) and are treated as ADDED or COPIED if their add or copy went
+  through, or moved again if it didn't.
+
+DONE entries are dropped once the run is over, colorizing included.
+"""
+import logging
+import sqlite3
+from datetime import datetime, timezone
+
+from settings import get_settings
+
+logger = logging.getLogger('main.request to map')
+
+JOURNAL_FILE = 'move_journal.db'  # lives next to sheet_id.yaml
+
+PLANNED, COPIED, ADDED, DONE = 'planned', 'copied', 'added', 'done'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS moves (
+    request_sheet_id INTEGER NOT NULL,
+    map_sheet_id INTEGER NOT NULL,
+    row_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    map_row_id INTEGER,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (request_sheet_id, map_sheet_id, row_id)
+);
+"""
+
+
+class Journal:
+    """The journal of moves from one request sheet to one map sheet
+    With durable off (simulations, plans, or the move_journal setting
+    off) it is kept in memory only. Use it as a context manager, from
+    the thread that made it.
+    """
+
+    def __init__(self, request_id: int, map_id: int, durable: bool = True):
+        self.request_id = request_id
+        self.map_id = map_id
+        durable = durable and get_settings()['move_journal']
+        self.connection = sqlite3.connect(JOURNAL_FILE if durable else ':memory:', timeout=30)
+        self.connection.executescript(SCHEMA)
+        self.entries = {row_id: (status, map_row_id) for row_id, status, map_row_id in self.connection.execute(
+            "SELECT row_id, status, map_row_id FROM moves WHERE request_sheet_id = ? AND map_sheet_id = ?",
+            (request_id, map_id))}
+        if self.entries:
+            logger.info(f'resuming: {len(self.entries)} rows of an interrupted run are in {JOURNAL_FILE}')
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.connection.close()
+
+    def status(self, row_id: int) -> str:
+        # returns PLANNED, COPIED, ADDED, DONE or None
+        return self.entries.get(row_id, (None, None))[0]
+
+    def map_row_id(self, row_id: int) -> int:
+        return self.entries.get(row_id, (None, None))[1]
+
+    def map_row_ids(self) -> set:
+        # the map rows that journaled moves made
+        return {map_row_id for _, map_row_id in self.entries.values() if map_row_id is not None}
+
+    def planned(self, row_ids: list) -> None:
+        self._record([(row_id, PLANNED, None) for row_id in row_ids])
+
+    def copied(self, pairs: list) -> None:
+        # pairs is [(REQUEST ROW ID, MAP ROW ID)]
+        self._record([(row_id, COPIED, map_row_id) for row_id, map_row_id in pairs])
+
+    def added(self, pairs: list) -> None:
+        # pairs is [(REQUEST ROW ID, MAP ROW ID)]
+        self._record([(row_id, ADDED, map_row_id) for row_id, map_row_id in pairs])
+
+    def done(self, row_ids: list) -> None:
+        self._record([(row_id, DONE, self.map_row_id(row_id)) for row_id in row_ids])
+
+    def forget(self, row_ids: list) -> None:
+        # for rows that weren't added after all; they are still Yellow and get moved by the next run
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM moves WHERE request_sheet_id = ? AND map_sheet_id = ? AND row_id = ?",
+                [(self.request_id, self.map_id, row_id) for row_id in row_ids])
+        for row_id in row_ids:
+            self.entries.pop(row_id, None)
+
+    def finish(self) -> None:
+        # the run is over: DONE rows are Green, so they won't come up again
+        self.forget([row_id for row_id, (status, _) in self.entries.items() if status == DONE])
+
+    def _record(self, entries: list) -> None:
+        # committed before returning, so the entries survive the process dying right after
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO moves (request_sheet_id, map_sheet_id, row_id, status, map_row_id, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.request_id, self.map_id, row_id, status, map_row_id, updated_at)
+                 for row_id, status, map_row_id in entries])
+        for row_id, status, map_row_id in entries:
+            self.entries[row_id] = (status, map_row_id)
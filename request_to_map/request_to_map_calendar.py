@@ -1,18 +1,26 @@
 import logging
 from datetime import date, datetime
+from functools import partial
+from itertools import groupby
 
 import smartsheet
 
+from async_api import run_concurrently, run_in_order
+from client import LazyClient
+from planner import is_planning
 from request_to_map.FY_Q_sort import calc_fy_q_hardcoded
 from request_to_map.colorize import colorize_rows
+from request_to_map.journal import ADDED, COPIED, DONE, PLANNED, Journal
+from request_to_map.sheet_tree import SheetTree
+from settings import get_settings
+from sheet_fetch import SheetPages, sheet_columns
+from utils import MAX_ROWS_PER_REQUEST, chunks
 
-logger = logging.getLogger('main')
+logger = logging.getLogger('main.request to map')  # its level can be set on its own, see settings.py
 
-smart = smartsheet.Smartsheet()  # use 'SMARTSHEET_ACCESS_TOKEN' env variable
-smart.errors_as_exceptions(True)
+smart = LazyClient()  # the shared client, built on first use from the 'SMARTSHEET_ACCESS_TOKEN' env variable
 
-CHANGE_AGENT = 'dkarpele_smartsheet_calendar'
-smart.with_change_agent(CHANGE_AGENT)
+REQUEST_COLUMNS = ['Event Name', 'TechX Status', 'Event Start Date']  # read from request rows besides the copied ones
 
 
 def process_sheet(sheet_ids):
@@ -21,89 +29,446 @@ def process_sheet(sheet_ids):
 
 def _process_sheet(request_id: int,
                    map_id: int,
-                   simulate: bool = False) -> None:
+                   simulate: bool = False,
+                   batched: bool = True) -> None:
     """Main loop for processing the sheet
     takes the sheet ids for the request sheet to pull rows from, and
     the map sheet to send rows to. An optional simulate option does not
     alter any sheets, but only shows the rows that would be copied.
-    Get rows from the request sheet, and builds {name: id} column map
+    Builds {name: id} column maps of both sheets, then streams the
+    request sheet's rows, fetching only the columns that are copied to
+    the map sheet or read here (see request_columns)
     Prints out the column names and ids
+    The map sheet is downloaded once into a SheetTree index, which is
+    kept up to date as rows are added and is used to colorize the map
+    sheet at the end
     For each row in the request sheet, the TechX status column is checked
     if it is Yellow, the row is printed and if simulation is false, the
     row is sent to the map sheet and then the TechX Status column is
     changed to green.
+    In batched mode (the default) the Yellow rows are collected first and
+    moved together by transfer_rows; otherwise the whole request sheet is
+    read first, and each row is sent on its own with send_row.
+    Every move is journaled (see journal.py), so Yellow rows that an
+    interrupted run already added to the map sheet only have their
+    status set.
     Does not return anything.
     """
 
-    rows = smart.Sheets.get_sheet(request_id, level=2, include=['objectValue']).rows
-    request_column_mapping = column_name_to_id_map(request_id)
-    map_column_mapping = column_name_to_id_map(map_id)
+    all_request_columns, map_columns = run_concurrently([
+        partial(sheet_columns, smart, request_id, level=2),
+        partial(sheet_columns, smart, map_id, level=2)])
+    request_column_mapping = {column.title: column.id for column in all_request_columns}
+    map_column_mapping = {column.title: column.id for column in map_columns}
+    translation = ColumnTranslation(all_request_columns, map_columns)
+    rows, tree = run_concurrently([
+        partial(SheetPages, smart, request_id, request_columns(all_request_columns, map_column_mapping),
+                level=2, include=['objectValue']),
+        partial(SheetTree.fetch, smart, map_id, map_column_mapping)])
+    if not batched and not simulate:
+        rows = list(rows)  # send_row sets statuses on the request sheet, which must not change mid-fetch
+
+    with Journal(request_id, map_id, durable=not simulate and not is_planning()) as journal:
+        print_col_headings(request_column_mapping)
+        rows_moved = 0
+        rows_to_move = []
+        rows_added = []  # added to the map sheet by an interrupted run
+        for row in rows:
+            if check_row(row, request_column_mapping):
+                logger.debug('  ^row will be processed')
+                print_row(row, request_column_mapping)
+                if simulate:
+                    logger.debug('Simulation! This row would have been updated to green and added to the map sheet.\n')
+                elif (status := resume_row(journal, row, request_column_mapping, tree, translation)) == DONE:
+                    logger.debug('  row was already moved')
+                elif status == ADDED:
+                    rows_added.append(row)
+                elif batched or status == COPIED:  # a copied row is put in place by transfer_rows
+                    rows_to_move.append(row)
+                else:
+                    rows_moved += 1
+                    journal.planned([row.id])
+                    map_row_id = send_row(sheet_id=map_id,
+                                          row=row,
+                                          request_column_mapping=request_column_mapping,
+                                          map_column_mapping=map_column_mapping,
+                                          tree=tree,
+                                          translation=translation)
+                    journal.added([(row.id, map_row_id)])
+                    smart.Sheets.update_rows(request_id,
+                                             update_row_status(row=row,
+                                                               column_mapping=request_column_mapping,
+                                                               value='Green'))
+                    journal.done([row.id])
+        if rows_to_move:
+            rows_moved += transfer_rows(request_id=request_id,
+                                        map_id=map_id,
+                                        rows=rows_to_move,
+                                        request_column_mapping=request_column_mapping,
+                                        map_column_mapping=map_column_mapping,
+                                        tree=tree,
+                                        translation=translation,
+                                        journal=journal)
+        if rows_added:
+            rows_moved += set_status_green(request_id, rows_added, request_column_mapping, journal)
+        logger.info(f'{rows_moved} rows moved')
+        if not simulate:
+            logger.info('colorizing rows...')
+            colorize_rows(smart, tree)
+            journal.finish()
+    logger.info('all operations complete!')
+
 
-    print_col_headings(request_column_mapping)
+def resume_row(journal: Journal,
+               row: smartsheet.models.Row,
+               request_column_mapping: dict,
+               tree: SheetTree,
+               translation: 'ColumnTranslation') -> str:
+    """Settles a Yellow row's journal entry from an interrupted run
+    A PLANNED row's add or copy may or may not have gone through, so
+    the (already downloaded) map sheet is searched for a row that holds
+    every cell the move would have written, and that no other journaled
+    move made: in its quarter, the row is now ADDED; at the top level,
+    where copies land (with only the cells the server copies), it is
+    COPIED; if there is none it is forgotten and moved again. A map row
+    that only shares the event's name and start date isn't taken for it.
+    Returns the row's journal status: COPIED, ADDED, DONE or None.
+    """
+    if journal.status(row.id) == PLANNED:
+        fy, q = calc_fy_q_hardcoded(get_cell_by_column_name(row, 'Event Start Date', request_column_mapping).value)
+        quarter_row = tree.quarter_row(fy, q)
+        taken = journal.map_row_ids()
+        sent_columns = {column.id for column in translation.map_columns.values()
+                        if column.title != 'TechX Service Request'}
+        if quarter_row and (map_row := find_moved_row(row, translation, tree, quarter_row.id, sent_columns, taken)):
+            logger.debug('  row %s was added to the map sheet by an interrupted run', row.id)
+            journal.added([(row.id, map_row.id)])
+        elif map_row := find_moved_row(row, translation, tree, None, translation.copied_on_server, taken):
+            logger.debug('  row %s was copied to the map sheet by an interrupted run', row.id)
+            journal.copied([(row.id, map_row.id)])
+        else:
+            journal.forget([row.id])
+    return journal.status(row.id)
+
+
+def find_moved_row(row: smartsheet.models.Row,
+                   translation: 'ColumnTranslation',
+                   tree: SheetTree,
+                   parent_id: int,
+                   column_ids: set,
+                   taken: set) -> smartsheet.models.Row:
+    # the map row under parent_id (None for the top level), not in taken, whose cells in the map columns column_ids
+    # hold what the request row's cells do, or None
+    wanted = {map_column.id: cell_key(cell) for cell in row.cells
+              if (map_column := translation.map_columns.get(cell.column_id)) is not None
+              and map_column.id in column_ids}
+    return next((map_row for map_row in tree.child_rows(parent_id)
+                 if map_row.id not in taken
+                 and all(cell_key(map_row.get_column(column_id)) == key for column_id, key in wanted.items())),
+                None)
+
+
+def cell_key(cell: smartsheet.models.Cell):
+    # what a cell holds, the same whether it was read from the request sheet or written to the map sheet;
+    # build_map_row writes empty cells as ' ', and multi-picklists read without their text as their values
+    if cell is None:
+        return None
+    value = cell.value
+    if value is None and (values := getattr(cell.object_value, 'values', None)):
+        value = ', '.join(values)
+    return (value.strip() if isinstance(value, str) else value) or None
+
+
+def request_columns(columns: list, map_column_mapping: dict) -> list:
+    # the request sheet columns worth downloading: the ones the map sheet also has, and REQUEST_COLUMNS
+    return [column for column in columns if column.title in map_column_mapping or column.title in REQUEST_COLUMNS]
+
+
+def transfer_rows(request_id: int,
+                  map_id: int,
+                  rows: list,
+                  request_column_mapping: dict,
+                  map_column_mapping: dict,
+                  tree: SheetTree,
+                  translation: 'ColumnTranslation',
+                  journal: Journal) -> int:
+    """Moves a batch of request rows to the map sheet
+    Plans every insertion first (see plan_transfer), then sends each
+    group of rows that share a location in as few add_rows calls as
+    MAX_ROWS_PER_REQUEST allows. The groups are sent concurrently, since
+    they only refer to rows that already exist, but a group's own calls
+    are sent one after another: each lands between the one before it and
+    the sibling, which keeps the quarter in start date order.
+    With the server_side_copy setting on (see copy_on_server), the rows
+    are copied by the server instead (see copy_to_map), and their calls
+    are update_rows that put the copies in place, check "TechX Service
+    Request" and fill in the columns the server couldn't copy. Rows an
+    interrupted run already copied are placed that way whatever the
+    setting, in calls of their own.
+    Calls are made with partial success allowed, so a rejected row does
+    not sink the rest of its chunk; only the rows that were actually
+    added have their TechX Status flipped to Green (see set_status_green).
+    Rows that failed either step are logged and stay Yellow for the next
+    run, which only sets the status of the ones that were added (or
+    places the ones that were copied).
+    Returns the number of rows moved.
+    """
+    plan = plan_transfer(map_id, rows, request_column_mapping, map_column_mapping, tree, translation)
+    copying = copy_on_server(translation)
+    sends = [(location, on_server, chunk)
+             for location, pairs in plan.items()
+             for on_server, run in groupby(pairs, key=lambda pair: copying or journal.status(pair[0].id) == COPIED)
+             for chunk in chunks(list(run), MAX_ROWS_PER_REQUEST)]
+    journal.planned([request_row.id for _, _, chunk in sends for request_row, _ in chunk
+                     if journal.status(request_row.id) != COPIED])
+    sends = copy_to_map(request_id, map_id, sends, journal)
+    sent_rows = [[placement_row(new_row, translation) if on_server else new_row for _, new_row in chunk]
+                 for _, on_server, chunk in sends]
+    by_location = {}  # sends are planned location by location, so each location's calls are in order
+    for (location, on_server, _), chunk_rows in zip(sends, sent_rows):
+        by_location.setdefault(location, []).append(
+            partial(smart.Sheets.update_rows_with_partial_success if on_server
+                    else smart.Sheets.add_rows_with_partial_success, map_id, chunk_rows))
+    results = [result for location_results in run_concurrently([partial(run_in_order, calls)
+                                                                for calls in by_location.values()])
+               for result in location_results]
+    added_rows = []
+    for (location, on_server, chunk), chunk_rows, result in zip(sends, sent_rows, results):
+        failed = {item.index: item for item in result.failed_items}
+        added = []
+        for index, (request_row, _) in enumerate(chunk):
+            if index in failed:
+                logger.error(f'  row {request_row.id} could not be added to sheet {map_id}: '
+                             f'{failed[index].error.message}')
+            else:
+                added.append(request_row)
+        journal.added([(request_row.id, map_row.id) for request_row, map_row in zip(added, result.result)])
+        if on_server:  # the copies that weren't placed stay journaled, to be put in place by the next run
+            tree.add([copied_row(request_row, placement, translation)
+                      for index, ((request_row, _), placement) in enumerate(zip(chunk, chunk_rows))
+                      if index not in failed])
+        else:
+            journal.forget([request_row.id for index, (request_row, _) in enumerate(chunk) if index in failed])
+            tree.add(result.result)
+        added_rows += added
+        logger.debug(f'  {len(chunk) - len(failed)} of {len(chunk)} rows sent to {location}')
+    return set_status_green(request_id, added_rows, request_column_mapping, journal)
+
+
+def copy_on_server(translation: 'ColumnTranslation') -> bool:
+    # copy_rows is only trusted when it can't add a column to the map sheet or convert a value between types
+    if not get_settings()['server_side_copy']:
+        return False
+    if not translation.copies_cleanly:
+        logger.warning('not every request sheet column is on the map sheet with the same type, '
+                       'so rows are sent with add_rows instead of being copied on the server')
+    return translation.copies_cleanly
+
+
+def copy_to_map(request_id: int, map_id: int, sends: list, journal: Journal) -> list:
+    """Copies the request rows of the on-server sends to the bottom of the map sheet, on the server
+    The server copies the cells of the columns that have the same title
+    and type in both sheets, so their values aren't sent at all. Rows
+    journaled as COPIED by an interrupted run are already there. The new
+    row of each copied request row gets the id of its copy; the rows of
+    a copy_rows call that failed are logged and left out.
+    Returns sends without the rows that weren't copied.
+    """
+    to_copy = [request_row.id for _, on_server, chunk in sends if on_server for request_row, _ in chunk
+               if journal.status(request_row.id) != COPIED]
+    results = run_concurrently([partial(copy_chunk, request_id, map_id, row_ids)
+                                for row_ids in chunks(to_copy, MAX_ROWS_PER_REQUEST)])
+    copies = {mapping.from_: mapping.to for result in results if result for mapping in result.row_mappings}
+    journal.copied(list(copies.items()))
+    journal.forget([row_id for row_id in to_copy if row_id not in copies])
+
+    copied_sends = []
+    for location, on_server, chunk in sends:
+        if on_server:
+            chunk = [(request_row, new_row) for request_row, new_row in chunk
+                     if journal.status(request_row.id) == COPIED]
+            for request_row, new_row in chunk:
+                new_row.id = journal.map_row_id(request_row.id)
+        if chunk:
+            copied_sends.append((location, on_server, chunk))
+    return copied_sends
+
+
+def copy_chunk(request_id: int, map_id: int, row_ids: list) -> smartsheet.models.CopyOrMoveRowResult:
+    # returns None if the call failed; copy_rows has no partial success, so none of the rows were copied
+    directive = smartsheet.models.CopyOrMoveRowDirective({
+        'row_ids': row_ids,
+        'to': smartsheet.models.CopyOrMoveRowDestination({'sheet_id': map_id})})
+    try:
+        return smart.Sheets.copy_rows(request_id, directive)
+    except Exception as e:
+        logger.error(f'  rows {row_ids} could not be copied to sheet {map_id}: {e}')
+        return None
+
+
+def placement_row(new_row: smartsheet.models.Row, translation: 'ColumnTranslation') -> smartsheet.models.Row:
+    # the update that puts a copied row where new_row was planned to go, with the cells the server didn't copy
+    placement = smartsheet.models.Row({'id': new_row.id,
+                                       'cells': [cell for cell in new_row.cells
+                                                 if cell.column_id not in translation.copied_on_server]})
+    for attribute in ('parent_id', 'sibling_id', 'above', 'to_bottom'):
+        if (value := getattr(new_row, attribute)) is not None:
+            setattr(placement, attribute, value)
+    return placement
+
+
+def copied_row(request_row: smartsheet.models.Row,
+               placement: smartsheet.models.Row,
+               translation: 'ColumnTranslation') -> smartsheet.models.Row:
+    # the map row that copy_rows and its placement make of request_row, as the API would return it
+    cells = {map_column.id: cell.to_dict() for cell in request_row.cells
+             if (map_column := translation.map_columns.get(cell.column_id)) is not None
+             and map_column.id in translation.copied_on_server}
+    cells.update((cell.column_id, cell.to_dict()) for cell in placement.cells)
+    return smartsheet.models.Row({**placement.to_dict(),
+                                  'cells': [{**cells.get(column_id, {}), 'columnId': column_id}
+                                            for column_id in translation.map_column_ids]})
+
+
+def set_status_green(request_id: int, rows: list, request_column_mapping: dict, journal: Journal) -> int:
+    """Flips the TechX Status of rows that are on the map sheet to Green
+    In one chunked update_rows, with partial success allowed. The rows
+    that were updated are journaled as DONE.
+    Returns the number of rows updated.
+    """
+    status_chunks = chunks(rows, MAX_ROWS_PER_REQUEST)
+    results = run_concurrently([partial(smart.Sheets.update_rows_with_partial_success, request_id,
+                                        [update_row_status(row=row, column_mapping=request_column_mapping,
+                                                           value='Green') for row in chunk])
+                                for chunk in status_chunks])
     rows_moved = 0
+    for chunk, result in zip(status_chunks, results):
+        failed = {item.index for item in result.failed_items}
+        for item in result.failed_items:
+            logger.error(f'  row {chunk[item.index].id} was added to the map sheet but its status could not '
+                         f'be updated: {item.error.message}')
+        journal.done([row.id for index, row in enumerate(chunk) if index not in failed])
+        rows_moved += len(chunk) - len(failed)
+    return rows_moved
+
+
+def plan_transfer(map_id: int,
+                  rows: list,
+                  request_column_mapping: dict,
+                  map_column_mapping: dict,
+                  tree: SheetTree,
+                  translation: 'ColumnTranslation') -> dict:
+    """Works out where each request row goes in the map sheet
+    Every row is placed against the state of the map sheet before the
+    batch, so rows that land in the same gap of the same quarter share
+    a location and can be sent in one add_rows call. Within a group the
+    rows are ordered by start date, which keeps the quarter sorted once
+    the group is inserted above its sibling (or at the bottom).
+    Missing FY/quarter rows are still created right away, since the new
+    rows need their ids.
+    Returns {(PARENT ID, SIBLING ID): [(REQUEST ROW, NEW ROW), ...]}
+    """
+    plan = {}
     for row in rows:
-        if check_row(row, request_column_mapping):
-            logger.debug(f'  ^row will be processed')
-            print_row(row, request_column_mapping)
-            if not simulate:
-                rows_moved += 1
-                send_row(sheet_id=map_id,
-                         row=row,
-                         request_column_mapping=request_column_mapping,
-                         map_column_mapping=map_column_mapping)
-                smart.Sheets.update_rows(request_id,
-                                         update_row_status(row=row,
-                                                           column_mapping=request_column_mapping,
-                                                           value='Green'))
-            else:
-                logger.debug('Simulation! This row would have been updated to green and added to the map sheet.\n')
-    logger.info(f'{rows_moved} rows moved')
-    if not simulate:
-        logger.info('colorizing rows...')
-        colorize_rows(smart, map_id)
-    logger.info('all operations complete!')
+        fy, q = calc_fy_q_hardcoded(get_cell_by_column_name(row=row,
+                                                            column_name='Event Start Date',
+                                                            col_map=request_column_mapping).value)
+        new_row = build_map_row(row, translation, map_column_mapping)
+        row_parent_id = get_quarter_parent_id(fy, q, tree, map_column_mapping, map_id)
+        sib_id = sort_quarter_rows(tree, row_parent_id, new_row, map_column_mapping)
+        plan.setdefault((row_parent_id, sib_id), []).append((row, new_row))
+
+    for (row_parent_id, sib_id), pairs in plan.items():
+        pairs.sort(key=lambda pair: get_start_date(pair[1], map_column_mapping))
+        for _, new_row in pairs:
+            set_row_location(new_row, row_parent_id, sib_id)
+    logger.debug(f'  planned {len(rows)} rows into {len(plan)} locations')
+    return plan
 
 
 def send_row(sheet_id: int,
              row: smartsheet.models.Row,
              request_column_mapping: dict,
-             map_column_mapping: dict) -> None:
+             map_column_mapping: dict,
+             tree: SheetTree,
+             translation: 'ColumnTranslation') -> int:
     """Main function for sending each row
-    Takes the map sheet id, the row to be sent, and the request sheet
-    {name: id} column map.
-    Calculated the FY/Quarter number, the map sheet {name: id}
-    column map, and the dictionary of fy and quarter rows
-    Creates an empty row, and sets the parent_id to the id of the
-    quarter to which it belongs, and sets it to be added to the
-    bottom of that row's children
-    Iterates though all the cells, and if the name of that cell's
-    column id is also in the map sheet, creates a new empty cell,
-    copies over the value of the cell, sets the column id to be the
-    column id that has the same name as the old cell's column, and
-    appends that cell to the new row.
-    Finally, that row is added to the map sheet
-    Does not return anything.
+    Takes the map sheet id, the row to be sent, the request sheet
+    {name: id} column map, the SheetTree index of the map sheet and the
+    run's ColumnTranslation.
+    Calculated the FY/Quarter number and looks up the fy and quarter
+    rows in the index
+    Builds the new row with build_map_row, sets it to be added above
+    the first row of its quarter that starts later, or to the bottom
+    of the quarter row's children if there is none.
+    Finally, that row is added to the map sheet and to the index
+    Returns the id of the new map row.
     """
     logger.debug('  Sending row...')
     fy, q = calc_fy_q_hardcoded(get_cell_by_column_name(row=row,
                                                         column_name='Event Start Date',
                                                         col_map=request_column_mapping).value)
-    logger.debug(f'  Fiscal Year: {fy}, Quarter: {q}')
-    fy_q_dict = make_fy_q_dict(sheet_id, map_column_mapping)
-    logger.debug(f'  Found these fiscal years in sheet: {list(fy_q_dict)}')
-    columns = smart.Sheets.get_columns(sheet_id, include_all=True, level=2)
-    column_dict = {col.title: col for col in columns.data}
+    logger.debug('  Fiscal Year: %s, Quarter: %s', fy, q)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'  Found these fiscal years in sheet: {tree.fiscal_years()}')
+    new_row = build_map_row(row, translation, map_column_mapping)
+
+    row_parent_id = get_quarter_parent_id(fy, q, tree, map_column_mapping, sheet_id)
+    sib_id = sort_quarter_rows(tree,
+                               row_parent_id,
+                               new_row,
+                               map_column_mapping)
+    set_row_location(new_row, row_parent_id, sib_id)
+    added = smart.Sheets.add_rows(sheet_id, new_row).result
+    tree.add(added)
+    logger.debug('  Row sent to sheet %s!', sheet_id)
+    return added[0].id
+
+
+class ColumnTranslation:
+    """Which map sheet column each request sheet column is copied to
+
+    Columns are matched by title once per run, so copying a row is a
+    dict lookup per cell. The server's copy_rows only copies between
+    columns that have the same type too; copied_on_server holds the ids
+    of the map columns whose copied cells can be kept as they are (all
+    of those but "TechX Service Request", which is always checked), and
+    copies_cleanly is whether every request column has such a map column.
+    """
+
+    def __init__(self, request_columns: list, map_columns: list):
+        by_title = {column.title: column for column in map_columns}
+        self.map_column_ids = [column.id for column in map_columns]
+        self.map_columns = {column.id: by_title[column.title]
+                            for column in request_columns if column.title in by_title}  # {REQUEST ID: MAP COLUMN}
+        self.copied_on_server = {by_title[column.title].id for column in request_columns
+                                 if column.title in by_title and column.title != 'TechX Service Request'
+                                 and str(by_title[column.title].type) == str(column.type)}
+        self.copies_cleanly = all(column.title in by_title and str(by_title[column.title].type) == str(column.type)
+                                  for column in request_columns)
+
+
+def build_map_row(row: smartsheet.models.Row,
+                  translation: ColumnTranslation,
+                  map_column_mapping: dict) -> smartsheet.models.Row:
+    """Copies a request row into a new, unplaced map sheet row
+    Iterates though all the cells, and if that cell's column is also in
+    the map sheet (see ColumnTranslation), creates a new empty cell,
+    copies over the value of the cell, sets the column id to be the id
+    of the map sheet's column, and appends that cell to the new row.
+    The "TechX Service Request" column is checked.
+    Returns the new row.
+    """
     new_row = smartsheet.models.Row()
 
     for cell in row.cells:
-        column_name = reverse_dict_search(request_column_mapping, cell.column_id)
-        if column_name in map_column_mapping.keys():
-            cell_contents = dict(column_id=map_column_mapping[column_name],
+        if (map_column := translation.map_columns.get(cell.column_id)) is not None:
+            cell_contents = dict(column_id=map_column.id,
                                  strict=False,
                                  override_validation=True,
                                  )
             try:
-                if column_dict[column_name].type == 'MULTI_PICKLIST':
+                if map_column.type == 'MULTI_PICKLIST':
                     cell_value = smartsheet.models.MultiPicklistObjectValue()
 
                     try:
@@ -120,27 +485,23 @@ def send_row(sheet_id: int,
                 cell_contents['value'] = cell.value or ' '
             new_row.cells.append(smartsheet.models.Cell(cell_contents))
 
-    row_parent_id = get_quarter_parent_id(fy, q, fy_q_dict, map_column_mapping, sheet_id)
-    sib_id = sort_quarter_rows(sheet_id,
-                               row_parent_id,
-                               new_row,
-                               map_column_mapping)
+    new_row.cells.append(smartsheet
+                         .models.Cell(dict(value=True,
+                                           column_id=map_column_mapping['TechX Service Request'])))
+    logger.debug('  Checked "TechX Service Request" column')
+    return new_row
+
+
+def set_row_location(new_row: smartsheet.models.Row, row_parent_id: int, sib_id: int) -> None:
     if sib_id:
         new_row.sibling_id = sib_id
         new_row.above = True
-        logger.debug(f'  Found sibling row with ID: {sib_id} (row will be added above its sibling)')
+        logger.debug('  Found sibling row with ID: %s (row will be added above its sibling)', sib_id)
     else:
         new_row.parent_id = row_parent_id
         new_row.to_bottom = True
-        logger.debug(f'  Sibling row not found. Falling back to parent ID of quarter ' +
-                     f'row (row will be added to bottom of quarter row\'s children)')
-
-    new_row.cells.append(smartsheet
-                         .models.Cell(dict(value=True,
-                                           column_id=map_column_mapping['TechX Service Request'])))
-    logger.debug('  Checked "TechX Service Request" column')
-    smart.Sheets.add_rows(sheet_id, new_row)
-    logger.debug(f'  Row sent to sheet {sheet_id}!')
+        logger.debug('  Sibling row not found. Falling back to parent ID of quarter '
+                     'row (row will be added to bottom of quarter row\'s children)')
 
 
 def update_row_status(row: smartsheet.models.Row,
@@ -181,8 +542,8 @@ def update_row_status(row: smartsheet.models.Row,
 
     new_row.cells = new_cells
     get_cell_by_column_name(new_row, column_name, column_mapping).value = value
-    logger.debug(
-        f'  Updated {column_name} column in row {new_row.id if new_row.id is not None else "(no ID yet)"} to {value}')
+    logger.debug('  Updated %s column in row %s to %s',
+                 column_name, new_row.id if new_row.id is not None else '(no ID yet)', value)
     return new_row
 
 
@@ -190,11 +551,15 @@ def check_row(row: smartsheet.models.Row,
               column_mapping: dict,
               column_name: str = 'TechX Status',
               val_to_test: str = 'Yellow') -> bool:
-    logger.debug(f'  checking row {get_cell_by_column_name(row, "Event Name", column_mapping).value} ({row.id}) ')
+    if logger.isEnabledFor(logging.DEBUG):  # per row, so skip the lookup unless it's going to be logged
+        logger.debug('  checking row %s (%s) ',
+                     get_cell_by_column_name(row, 'Event Name', column_mapping).value, row.id)
     return get_cell_by_column_name(row, column_name, column_mapping).value == val_to_test
 
 
 def print_col_headings(cols: dict) -> None:  # prints column name and id for all columns, plus FY/Quarter
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug(' '.join([column_format(col_title) for col_title in cols.keys()] + ['FY/Quarter']))
     logger.debug(' '.join(str(col_id).ljust(24) for col_id in cols.values()))
 
@@ -202,7 +567,9 @@ def print_col_headings(cols: dict) -> None:  # prints column name and id for all
 def print_row(row: smartsheet.models.Row,
               column_mapping: dict,
               column_name: str = 'Event Start Date') -> None:
-    # format, print the columns in the row + FY/Quarter
+    # format, print the columns in the row + FY/Quarter; only worth doing if debug messages are logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     fy, q = calc_fy_q_hardcoded(get_cell_by_column_name(row, column_name, column_mapping).value)
     logger.debug(' '.join([column_format(c.display_value or c.value) for c in row.cells] + [f'FY{fy} Q{q}']))
 
@@ -211,59 +578,19 @@ def column_format(item: str, just: int = 24) -> str:
     return (str(item)[:just - 2] + (str(item)[just - 2:] and '..')).ljust(just)
 
 
-def column_name_to_id_map(sheet_id: int) -> dict:
-    # returns a title:id dict of all columns in sheet
-    return {column.title: column.id for column in smart.Sheets.get_columns(sheet_id, include_all=True).data}
-
-
 def get_cell_by_column_name(row: smartsheet.models.Row,
                             column_name: str,
                             col_map: dict) -> smartsheet.models.Cell:
     return row.get_column(col_map[column_name])  # {NAME: ID}
 
 
-def reverse_dict_search(search_dict: dict, search_value: str) -> str:
-    for key, val in search_dict.items():
-        if val == search_value:
-            return key
-
-
-def make_fy_q_dict(sheet_id: int,
-                   column_mapping: dict,
-                   column_name: str = 'Event Name') -> dict:
-    fy_q_dict = {str(get_cell_by_column_name(fy,
-                                             column_name,
-                                             column_mapping).value): [fy, {}] for fy in find_fy_rows(sheet_id)}
-    for year, (year_row, _) in fy_q_dict.items():
-        quarters = find_child_rows(sheet_id, year_row.id)
-        fy_q_dict[year][1] = {str(get_cell_by_column_name(quarter,
-                                                          column_name,
-                                                          column_mapping).value)[:2]: quarter for quarter in quarters}
-    return fy_q_dict
-
-
-def find_fy_rows(sheet_id: int):
-    return (
-        row
-        for row in smart.Sheets.get_sheet(sheet_id, level=2, include=['objectValue']).rows
-        if not row.to_dict().get('parentId', False) and str(row.cells[0].value).startswith('FY'))
-
-
-def find_child_rows(sheet_id: int, parent_row_id: int):
-    return (
-        row
-        for row in smart.Sheets.get_sheet(sheet_id, level=2, include=['objectValue']).rows
-        if row.to_dict().get('parentId', False) == parent_row_id)
-
-
-def get_quarter_parent_id(fy: int, q: int, fy_q_dict: dict, column_mapping: dict, sheet_id: int) -> int:
-    if ('FY' + str(fy)) not in fy_q_dict:
-        add_fyq_rows(fy, column_mapping, sheet_id)
-        fy_q_dict = make_fy_q_dict(sheet_id, column_mapping)
-    return fy_q_dict['FY' + str(fy)][1]['Q' + str(q)].id
+def get_quarter_parent_id(fy: int, q: int, tree: SheetTree, column_mapping: dict, sheet_id: int) -> int:
+    if tree.fy_row(fy) is None:
+        add_fyq_rows(fy, column_mapping, sheet_id, tree)
+    return tree.quarter_row(fy, q).id
 
 
-def add_fyq_rows(fy: int, column_mapping: dict, sheet_id: int) -> None:
+def add_fyq_rows(fy: int, column_mapping: dict, sheet_id: int, tree: SheetTree) -> None:
     main_column_id = column_mapping['Event Name']
 
     fy_row = smartsheet.models.Row()
@@ -272,6 +599,7 @@ def add_fyq_rows(fy: int, column_mapping: dict, sheet_id: int) -> None:
         "value": "FY" + str(fy)
     })
     fy_add_result = smart.Sheets.add_rows(sheet_id, fy_row)  # add the FY row first
+    tree.add(fy_add_result.result)
     fy_row_id = fy_add_result.result[0].id  # get the id of the row we just added
 
     quarter_rows = []
@@ -285,19 +613,14 @@ def add_fyq_rows(fy: int, column_mapping: dict, sheet_id: int) -> None:
         new_row.to_bottom = True
         quarter_rows.append(new_row)
 
-    smart.Sheets.add_rows(sheet_id, quarter_rows)  # add the quarter rows
+    tree.add(smart.Sheets.add_rows(sheet_id, quarter_rows).result)  # add the quarter rows
 
 
-def sort_quarter_rows(sheet_id: int,
+def sort_quarter_rows(tree: SheetTree,
                       quarter_row_id: int,
                       new_row: smartsheet.models.Row,
                       col_map: dict) -> int:
-    rows_in_quarter = find_child_rows(sheet_id, quarter_row_id)
-    new_row_start_date = get_start_date(new_row, col_map)
-    for row in rows_in_quarter:
-        row_date = get_start_date(row, col_map)
-        if new_row_start_date < row_date:
-            return row.id
+    return tree.sibling_after(quarter_row_id, get_start_date(new_row, col_map))
 
 
 def get_start_date(row: smartsheet.models.row, col_map: dict, column: str = 'Event Start Date') -> date:
@@ -0,0 +1,98 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+import smartsheet
+
+
+class SheetTree:
+    """In-memory index of the map sheet's FY -> quarter -> event hierarchy
+
+    Built from a single get_sheet call. Keeps a parent -> children list
+    in sheet order for every row, looks up FY and quarter rows by their
+    label, and keeps each parent's children sorted by start date so the
+    insertion point of a new row can be found without another download.
+    Rows added through the API are fed back in with add() so the index
+    stays in step with the sheet for the rest of the run.
+    """
+
+    def __init__(self,
+                 sheet: smartsheet.models.Sheet,
+                 column_mapping: dict,
+                 name_column: str = 'Event Name',
+                 date_column: str = 'Event Start Date'):
+        self.sheet_id = sheet.id
+        self.column_mapping = column_mapping
+        self.name_column = name_column
+        self.date_column = date_column
+        self.rows = {}
+        self.children = defaultdict(list)  # {PARENT ID (None for top level): [CHILD IDS]}
+        self._sorted = {}  # {PARENT ID: ([START DATES], [CHILD IDS])}, rebuilt lazily
+        for row in sheet.rows:
+            self.rows[row.id] = row
+            self.children[row.parent_id].append(row.id)
+
+    @classmethod
+    def fetch(cls, smart: smartsheet.Smartsheet, sheet_id: int, column_mapping: dict, **kwargs) -> 'SheetTree':
+        sheet = smart.Sheets.get_sheet(sheet_id, level=2, include=['objectValue', 'format'])
+        return cls(sheet, column_mapping, **kwargs)
+
+    def label(self, row: smartsheet.models.Row) -> str:
+        return str(row.get_column(self.column_mapping[self.name_column]).value)
+
+    def child_rows(self, parent_id: int) -> list:
+        return [self.rows[row_id] for row_id in self.children.get(parent_id, ())]
+
+    def has_children(self, parent_id: int) -> bool:
+        return bool(self.children.get(parent_id))
+
+    def fy_rows(self) -> list:
+        return [row for row in self.child_rows(None) if str(row.cells[0].value).startswith('FY')]
+
+    def fiscal_years(self) -> list:
+        return [self.label(row) for row in self.fy_rows()]
+
+    def fy_row(self, fy: int) -> smartsheet.models.Row:
+        return next((row for row in self.fy_rows() if self.label(row) == f'FY{fy}'), None)
+
+    def quarter_row(self, fy: int, q: int) -> smartsheet.models.Row:
+        if (fy_row := self.fy_row(fy)) is None:
+            return None
+        return next((row for row in self.child_rows(fy_row.id) if self.label(row)[:2] == f'Q{q}'), None)
+
+    def sibling_after(self, parent_id: int, start_date) -> int:
+        # id of the first child that starts later than start_date, or None if there isn't one
+        dates, row_ids = self._sorted_index(parent_id)
+        position = bisect_right(dates, start_date)
+        return row_ids[position] if position < len(row_ids) else None
+
+    def add(self, new_rows: list) -> None:
+        # index rows returned by add_rows; siblingId is the row directly above the new one.
+        # planned rows (see planner) come back with the location they asked for instead. a row the tree
+        # already holds, like a copied row being put in place, is moved from where it was
+        for row in new_rows:
+            if (old_row := self.rows.get(row.id)) is not None:
+                self.children[old_row.parent_id].remove(row.id)
+                self._sorted.pop(old_row.parent_id, None)
+            self.rows[row.id] = row
+            if row.above and row.sibling_id in self.rows:
+                row.parent_id = self.rows[row.sibling_id].parent_id
+                siblings = self.children[row.parent_id]
+                siblings.insert(siblings.index(row.sibling_id), row.id)
+            else:
+                siblings = self.children[row.parent_id]
+                if row.to_bottom:
+                    siblings.append(row.id)
+                elif row.sibling_id in siblings:
+                    siblings.insert(siblings.index(row.sibling_id) + 1, row.id)
+                else:
+                    siblings.insert(0, row.id)
+            self._sorted.pop(row.parent_id, None)
+
+    def _sorted_index(self, parent_id: int) -> tuple:
+        if parent_id not in self._sorted:
+            from request_to_map.request_to_map_calendar import get_start_date
+            keyed = sorted(((get_start_date(row, self.column_mapping, self.date_column), row.id)
+                            for row in self.child_rows(parent_id)),
+                           key=lambda pair: pair[0])
+            self._sorted[parent_id] = ([pair[0] for pair in keyed], [pair[1] for pair in keyed])
+        return self._sorted[parent_id]
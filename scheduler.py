@@ -0,0 +1,146 @@
+"""Client-side rate limiting for the Smartsheet API
+
+Every request the shared client sends first takes a token from one token
+bucket, refilled at the rate_limit setting's requests_per_minute. When
+requests are waiting for a token, reads go first, then writes, then
+cosmetic writes (see priority()), in arrival order within each level.
+
+A 429 response pauses the whole bucket with an exponential backoff (or
+the server's Retry-After), halves the refill rate, and resends the
+request; each request that goes through afterwards raises the rate back
+towards the limit. The SDK's own retry only sees a 429 once
+max_retries resends have failed.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+import smartsheet
+
+from settings import get_settings
+
+logger = logging.getLogger('main')
+
+READ, WRITE, COSMETIC = 0, 1, 2  # request priorities, lowest goes first
+BASE_BACKOFF = 1.0  # seconds to pause after the first 429 in a row
+MAX_BACKOFF = 60.0
+MIN_RATE_FRACTION = 0.1  # backing off never drops the rate below this share of the limit
+
+_priority = ContextVar('priority', default=None)  # copied into asyncio.to_thread workers
+
+
+@contextmanager
+def priority(level: int):
+    # requests sent inside the block wait behind anything more urgent, e.g. colorize_rows' formatting updates
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Scheduler:
+    def __init__(self, requests_per_minute: int, burst: int, max_retries: int):
+        self.limit = requests_per_minute / 60  # tokens per second
+        self.rate = self.limit  # lowered after a 429, raised again as requests go through
+        self.burst = burst
+        self.max_retries = max_retries
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_limited = 0.0  # when the last 429 came back
+        self.backoffs = 0  # 429s in a row
+        self.waiting = []  # heap of (PRIORITY, ARRIVAL NUMBER) tickets
+        self.arrivals = itertools.count()
+        self.condition = threading.Condition()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, level: int) -> float:
+        # blocks until this request's turn comes and there's a token for it; returns when it was let through
+        with self.condition:
+            ticket = (level, next(self.arrivals))
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if self.waiting[0] != ticket:
+                    self.condition.wait()
+                elif now < self.paused_until or self.tokens < 1:
+                    self.condition.wait(max(self.paused_until - now, (1 - self.tokens) / self.rate))
+                else:
+                    heapq.heappop(self.waiting)
+                    self.tokens -= 1
+                    self.condition.notify_all()  # the next ticket in line is at the front now
+                    return now
+
+    def rate_limited(self, sent: float, retry_after: float = None) -> None:
+        with self.condition:
+            now = time.monotonic()
+            if sent >= self.last_limited:  # 429s for requests sent before the last one don't back off further
+                self.backoffs += 1
+                self.rate = max(self.limit * MIN_RATE_FRACTION, self.rate / 2)
+            self.last_limited = now
+            delay = retry_after or min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.backoffs - 1)) * random.uniform(1, 1.5)
+            self.paused_until = max(self.paused_until, now + delay)
+            self.tokens = 0
+            self.condition.notify_all()
+        logger.warning(f"rate limited; pausing API calls for {delay:.1f}s, "
+                       f"then sending at most {self.rate * 60:.0f} per minute")
+
+    def succeeded(self) -> None:
+        with self.condition:
+            self.backoffs = 0
+            if self.rate < self.limit:  # back to the full rate after about 20 requests
+                self.rate = min(self.limit, self.rate + self.limit / 20)
+
+
+@lru_cache(maxsize=None)
+def shared_scheduler() -> Scheduler:
+    return Scheduler(**get_settings()['rate_limit'])
+
+
+def retry_after(response) -> float:
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def schedule(smart: smartsheet.Smartsheet, scheduler: Scheduler = None) -> smartsheet.Smartsheet:
+    """Sends every request the client makes through the scheduler
+    Requests without a priority() are READs if they are GETs and WRITEs
+    otherwise. Clients share shared_scheduler() unless given their own.
+    """
+    session = smart._session
+    if getattr(session, 'scheduled', False):
+        return smart
+    scheduler = scheduler or shared_scheduler()
+    send = session.send
+
+    def scheduled_send(request, **kwargs):
+        level = _priority.get()
+        if level is None:
+            level = READ if request.method == 'GET' else WRITE
+        for attempt in range(scheduler.max_retries + 1):
+            sent = scheduler.acquire(level)
+            response = send(request, **kwargs)
+            if response.status_code != 429:
+                scheduler.succeeded()
+                return response
+            if attempt < scheduler.max_retries:
+                scheduler.rate_limited(sent, retry_after(response))
+                response.close()
+        return response
+
+    session.send = scheduled_send
+    session.scheduled = True
+    return smart
@@ -0,0 +1,74 @@
+import logging
+from functools import lru_cache
+
+import yaml
+
+logger = logging.getLogger('main')
+
+SETTINGS_FILE = 'settings.yaml'
+
+DEFAULTS = {
+    'pipeline_workers': 4,  # how many calendar pipelines may run at once
+    'incremental_sync': True,  # reuse the events stored in sync_state.db for rows that haven't changed
+    'schema_cache': True,  # reuse the column lists stored in schema_cache.db for sheets that haven't changed
+    'move_journal': True,  # journal request to map's moves in move_journal.db, so an interrupted run can resume
+    'server_side_copy': False,  # request to map has the API copy rows to the map sheet instead of sending their cells
+    'fetch_page_size': 1000,  # rows per get_sheet page when a whole source sheet is streamed
+    'transform_processes': 0,  # worker processes for turning big source sheets into events; 0 keeps it in-process
+    'transform_chunk_rows': 2000,  # rows handed to a worker process at a time
+    'api_concurrency': 8,  # how many API requests may be in flight at once, across all pipelines
+    'event_name_replacements': [  # (ORIGINAL, NEW) pairs applied by utils.replace_event_names
+        ('Cisco Live', 'CL'),
+        ('Cisco ', ''),
+        ('Partner Summit', 'PS'),
+        ('Date(s)', ''),
+        ('Date (s)', ''),
+        ('Dates', ''),
+        ('Date', ''),
+    ],
+    'rate_limit': {  # see scheduler.py
+        'requests_per_minute': 290,  # a little under the API's 300 per token, so a full burst never goes over
+        'burst': 10,  # requests that may go out at once after a quiet spell
+        'max_retries': 8,  # resends of a rate-limited request before the SDK's own retry takes over
+    },
+    'daemon': {  # see daemon.py
+        'host': '127.0.0.1',  # where the webhook callback server listens
+        'port': 8080,
+        'callback_url': None,  # the public URL Smartsheet should call; set it to have webhooks registered
+        'allow_unsigned_callbacks': False,  # without a callback_url, listen on a non-loopback host anyway
+        'debounce_seconds': 10,  # run once callbacks have stopped coming for this long...
+        'max_delay_seconds': 60,  # ...or this long after the first one, if they keep coming
+        'resync_minutes': 60,  # full run every so often, in case a callback was missed
+    },
+    'logging': {
+        'queue': True,  # hand log records to a background thread, so the pipelines never wait on the log files
+        'pipeline_levels': {},  # {PIPELINE: LEVEL}, e.g. {'map': 'INFO'}; pipelines left out log everything
+    },
+    'feed': {  # see feed.py
+        'directory': None,  # where each calendar's .ics and .json feed is written after every sync; None writes none
+        'host': '127.0.0.1',  # where the feed server listens (python __init__.py --serve-feeds, or in daemon mode)
+        'port': None,  # None: no feed server in daemon mode
+    },
+    'metrics': {
+        'summary_file': 'run_summary.json',  # JSON summary of the run's API calls, per pipeline and endpoint
+        'prometheus_file': None,  # e.g. /var/lib/node_exporter/textfile/smartsheet_calendar.prom
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> dict:
+    # returns DEFAULTS updated with whatever is set in settings.yaml, if it exists
+    settings = {key: dict(value) if isinstance(value, dict) else value for key, value in DEFAULTS.items()}
+    try:
+        with open(SETTINGS_FILE) as yaml_file:
+            overrides = yaml.safe_load(yaml_file) or {}
+    except FileNotFoundError:
+        logger.debug(f"{SETTINGS_FILE} not found, using default settings")
+        return settings
+    for key, value in overrides.items():
+        if isinstance(settings.get(key), dict) and isinstance(value, dict):
+            settings[key].update(value)
+        else:
+            settings[key] = value
+    return settings
@@ -0,0 +1,49 @@
+import threading
+from functools import wraps
+
+import smartsheet
+
+from instrumentation import pipeline_logger
+
+_results = {}  # {(FUNCTION NAME, SHEET ID): (SHEET VERSION, RESULT)}
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def clear_cache() -> None:
+    with _locks_lock:
+        _results.clear()
+        _locks.clear()
+
+
+def _lock_for(key: tuple) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def cached_by_sheet_version(smart: smartsheet.Smartsheet):
+    """Memoizes a sheet_id -> event list function for the current run
+
+    The result is keyed by the function, the sheet id and the sheet's
+    version, so a source sheet that is used by several calendars is
+    downloaded and transformed once, and a sheet that was changed earlier
+    in the run (e.g. the map sheet by request to map) is picked up again.
+    Checking the version is a single cheap get_sheet_version call, and
+    the version is passed on to the function so it doesn't have to
+    check again. Callers get their own copy of the list.
+    """
+    def decorator(process):
+        @wraps(process)
+        def wrapper(sheet_id: int) -> list:
+            key = (process.__qualname__, sheet_id)
+            with _lock_for(key):
+                version = smart.Sheets.get_sheet_version(sheet_id).version
+                cached = _results.get(key)
+                if cached is not None and cached[0] == version:
+                    pipeline_logger().debug(f"reusing {process.__name__} result for sheet {sheet_id} "
+                                            f"(version {version})")
+                else:
+                    _results[key] = cached = (version, process(sheet_id, version=version))
+            return list(cached[1])
+        return wrapper
+    return decorator
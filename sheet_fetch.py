@@ -0,0 +1,161 @@
+"""Column-projected, paginated sheet fetching
+
+Pipelines declare which columns they read with a column selector, a
+function from the sheet's full column list to the columns it needs.
+Only those columns are downloaded (the API's columnIds filter), and big
+sheets are streamed a page at a time by SheetPages, which downloads the
+next page while the caller works through the current one. At most two
+pages of rows are held at once, however big the sheet is.
+
+Column lists themselves are cached on disk per sheet version (see
+sheet_columns), so they are only downloaded after the sheet changes.
+"""
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from contextvars import copy_context
+
+import smartsheet
+
+from instrumentation import pipeline_logger
+from settings import get_settings
+
+SCHEMA_CACHE_FILE = 'schema_cache.db'  # lives next to sheet_id.yaml
+
+_columns = {}  # {(SHEET ID, LEVEL): [COLUMNS]} already checked against the sheet's version, see clear_columns
+_columns_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS columns (
+    sheet_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    PRIMARY KEY (sheet_id, level)
+);
+"""
+
+
+class SheetChangedError(RuntimeError):
+    pass
+
+
+def all_columns(columns: list) -> list:
+    # the column selector for pipelines that read every column
+    return columns
+
+
+def clear_columns() -> None:
+    # column lists are only checked against the sheet's version the first time they're needed after this
+    with _columns_lock:
+        _columns.clear()
+
+
+def forget_columns(sheet_id: int) -> None:
+    # for the daemon, which keeps column lists between runs and hears about column changes from webhooks
+    with _columns_lock:
+        for key in [key for key in _columns if key[0] == sheet_id]:
+            del _columns[key]
+
+
+def connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(SCHEMA_CACHE_FILE, timeout=30)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def load_schema(sheet_id: int, level: int, version: int) -> list:
+    # returns the sheet's stored columns if they were stored at this version, otherwise None
+    with closing(connect()) as connection:
+        stored = connection.execute("SELECT columns FROM columns WHERE sheet_id = ? AND level = ? AND version = ?",
+                                    (sheet_id, level, version)).fetchone()
+    return [smartsheet.models.Column(column) for column in json.loads(stored[0])] if stored else None
+
+
+def save_schema(sheet_id: int, level: int, version: int, columns: list) -> None:
+    with closing(connect()) as connection, connection:
+        connection.execute("INSERT OR REPLACE INTO columns (sheet_id, level, version, columns) VALUES (?, ?, ?, ?)",
+                           (sheet_id, level, version, json.dumps([column.to_dict() for column in columns])))
+
+
+def sheet_columns(smart: smartsheet.Smartsheet, sheet_id: int, level: int = None, version: int = None) -> list:
+    """Returns all of a sheet's columns, hidden ones included, in sheet order
+    The columns are kept in SCHEMA_CACHE_FILE along with the sheet's
+    version, and only downloaded again once the version has changed
+    (adding, removing or editing a column changes it too). version saves
+    looking it up, if the caller already has it. Within a run, the
+    columns are only checked the first time.
+    """
+    key = (sheet_id, level or 0)
+    with _columns_lock:
+        if key in _columns:
+            return _columns[key]
+
+    columns = None
+    if get_settings()['schema_cache']:
+        if version is None:
+            version = smart.Sheets.get_sheet_version(sheet_id).version
+        columns = load_schema(*key, version)
+    if columns is None:
+        pipeline_logger().debug(f"fetching the columns of sheet {sheet_id}")
+        columns = smart.Sheets.get_columns(sheet_id, include_all=True, **({'level': level} if level else {})).data
+        if version is not None:
+            save_schema(*key, version, columns)
+
+    with _columns_lock:
+        _columns[key] = columns
+    return columns
+
+
+def select_columns(smart: smartsheet.Smartsheet,
+                   sheet_id: int,
+                   column_selector=all_columns,
+                   version: int = None) -> list:
+    # returns the columns a pipeline needs out of the sheet's columns (hidden ones included), in sheet order
+    columns = sheet_columns(smart, sheet_id, version=version)
+    wanted = {column.id for column in column_selector(columns)}
+    selected = [column for column in columns if column.id in wanted]
+    pipeline_logger().debug(f"fetching {len(selected)} of {len(columns)} columns of sheet {sheet_id}")
+    return selected
+
+
+class SheetPages:
+    """Iterates over a sheet's rows a page at a time
+    Fetches the first page right away, so version and total_row_count
+    are known before iterating. columns limits the fetch to those
+    columns (all of them if None); any other get_sheet arguments, like
+    include or level, are passed along with every page request.
+    Raises SheetChangedError while iterating if the sheet is changed
+    between two page requests, since the pages no longer line up.
+    """
+
+    def __init__(self, smart: smartsheet.Smartsheet, sheet_id: int, columns: list = None, page_size: int = None,
+                 **kwargs):
+        self.smart = smart
+        self.sheet_id = sheet_id
+        self.page_size = page_size or get_settings()['fetch_page_size']
+        self.kwargs = kwargs
+        if columns is not None:
+            self.kwargs['column_ids'] = [column.id for column in columns]
+        first_page = self.fetch(1)
+        self.version = first_page.version
+        self.total_row_count = first_page.total_row_count
+        self.columns = first_page.columns
+        self.first_page = first_page
+
+    def fetch(self, page: int) -> smartsheet.models.Sheet:
+        return self.smart.Sheets.get_sheet(self.sheet_id, page_size=self.page_size, page=page, **self.kwargs)
+
+    def __iter__(self):
+        pages = -(-self.total_row_count // self.page_size)
+        sheet, self.first_page = self.first_page, None  # the rows are only iterated once
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            for page in range(1, pages + 1):
+                next_page = (prefetch.submit(copy_context().run, self.fetch, page + 1)
+                             if page < pages else None)
+                if sheet.version != self.version:
+                    raise SheetChangedError(f"sheet {self.sheet_id} changed while its rows were being fetched")
+                yield from sheet.rows
+                sheet = next_page and next_page.result()
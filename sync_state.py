@@ -0,0 +1,167 @@
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+import smartsheet
+
+from instrumentation import pipeline_logger
+from settings import get_settings
+from sheet_fetch import SheetChangedError, SheetPages, all_columns, select_columns
+from transform import transform_rows
+from utils import assign_colors
+
+SYNC_STATE_FILE = 'sync_state.db'  # lives next to sheet_id.yaml
+CLOCK_SKEW = timedelta(minutes=5)  # rowsModifiedSince is compared against the server's clock, so look back a bit
+FETCH_ATTEMPTS = 3  # full fetches to try before giving up on a sheet that keeps changing mid-fetch
+PROCESSOR_VERSION = 1  # bump when a row processor changes what it makes of a row, so the stored events are remade
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    pipeline TEXT NOT NULL,
+    sheet_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    synced_at TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    PRIMARY KEY (pipeline, sheet_id)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    pipeline TEXT NOT NULL,
+    sheet_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    row_id INTEGER NOT NULL,
+    events TEXT NOT NULL,
+    PRIMARY KEY (pipeline, sheet_id, position)
+);
+"""
+
+
+def connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(SYNC_STATE_FILE, timeout=30)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def load_state(pipeline: str, sheet_id: int):
+    # returns (version, synced_at, column signature, [(ROW ID, [EVENTS])] in sheet order), or None
+    with closing(connect()) as connection:
+        sheet = connection.execute(
+            "SELECT version, synced_at, columns FROM sheets WHERE pipeline = ? AND sheet_id = ?",
+            (pipeline, sheet_id)).fetchone()
+        if sheet is None:
+            return None
+        rows = connection.execute(
+            "SELECT row_id, events FROM rows WHERE pipeline = ? AND sheet_id = ? ORDER BY position",
+            (pipeline, sheet_id)).fetchall()
+    return (*sheet, [(row_id, [tuple(event) for event in json.loads(events)]) for row_id, events in rows])
+
+
+def save_state(pipeline: str, sheet_id: int, version: int, synced_at: str, columns: str, rows: list) -> None:
+    with closing(connect()) as connection, connection:
+        connection.execute("DELETE FROM rows WHERE pipeline = ? AND sheet_id = ?", (pipeline, sheet_id))
+        connection.executemany(
+            "INSERT INTO rows (pipeline, sheet_id, position, row_id, events) VALUES (?, ?, ?, ?, ?)",
+            ((pipeline, sheet_id, position, row_id, json.dumps(events))
+             for position, (row_id, events) in enumerate(rows)))
+        connection.execute(
+            "INSERT OR REPLACE INTO sheets (pipeline, sheet_id, version, synced_at, columns) VALUES (?, ?, ?, ?, ?)",
+            (pipeline, sheet_id, version, synced_at, columns))
+
+
+def processor_signature() -> str:
+    # anything besides the columns that a row processor may depend on
+    rules = json.dumps([PROCESSOR_VERSION, get_settings()['event_name_replacements']])
+    return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+
+def column_signature(columns: list) -> str:
+    # anything about the columns that a row processor may depend on, after the processor's own signature
+    return f'{processor_signature()}:' + json.dumps([(col.id, col.title, str(col.type), bool(col.hidden))
+                                                      for col in columns])
+
+
+def same_processor(signature: str) -> bool:
+    return signature.split(':', 1)[0] == processor_signature()
+
+
+def merge_rows(stored_rows: list, modified_rows: list, total_row_count: int, process_row) -> list:
+    """Applies the rows returned by a rowsModifiedSince fetch to the stored rows
+    Modified and new rows come back with their current row number; the
+    unchanged rows keep their relative order and fill the gaps. Deleted
+    rows are not reported by the API, so if the counts don't add up
+    (something was deleted) None is returned and the caller has to fall
+    back to a full fetch.
+    """
+    modified_ids = {row.id for row in modified_rows}
+    unchanged = [stored for stored in stored_rows if stored[0] not in modified_ids]
+    if len(unchanged) + len(modified_rows) != total_row_count:
+        return None
+
+    by_number = {row.row_number: (row.id, process_row(row)) for row in modified_rows}
+    unchanged = iter(unchanged)
+    return [by_number[number] if number in by_number else next(unchanged)
+            for number in range(1, total_row_count + 1)]
+
+
+def incremental_events(smart: smartsheet.Smartsheet,
+                       pipeline: str,
+                       sheet_id: int,
+                       row_processor,
+                       version: int = None,
+                       column_selector=all_columns) -> list:
+    """Returns a pipeline's event list for a source sheet, doing as little work as possible
+    row_processor takes the sheet's columns and returns a function that
+    turns one row into that row's [(name, start, end)] events; only the
+    columns picked by column_selector are fetched and passed to it. Each
+    row's events are stored in SYNC_STATE_FILE along with the sheet's
+    version. If the version hasn't changed since the last sync, the
+    stored events are used as they are; otherwise only the rows modified
+    since the last sync are fetched and reprocessed. Column changes,
+    changes to the event_name_replacements setting (or PROCESSOR_VERSION)
+    and deleted rows fall back to a full fetch, which is streamed a page at
+    a time and transformed by transform_rows. Colors are assigned after merging, so the result is the same
+    as processing the whole sheet. Logs through the pipeline's logger.
+    """
+    logger = pipeline_logger()
+    if version is None:
+        version = smart.Sheets.get_sheet_version(sheet_id).version
+    state = load_state(pipeline, sheet_id) if get_settings()['incremental_sync'] else None
+    synced_at = (datetime.now(timezone.utc) - CLOCK_SKEW).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    if state is not None and state[0] == version and same_processor(state[2]):
+        logger.info(f"{pipeline}: sheet {sheet_id} unchanged since last sync (version {version})")
+        return assign_colors(events for _, events in state[3])
+
+    columns = select_columns(smart, sheet_id, column_selector, version)
+    signature = column_signature(columns)
+    rows = None
+    if state is not None:
+        _, last_synced_at, stored_columns, stored_rows = state
+        if signature == stored_columns:
+            sheet = smart.Sheets.get_sheet(sheet_id, column_ids=[column.id for column in columns],
+                                           rows_modified_since=last_synced_at)
+            rows = merge_rows(stored_rows, sheet.rows, sheet.total_row_count, row_processor(columns))
+        if rows is None:
+            logger.info(f"{pipeline}: columns or name replacements changed, or rows deleted, in sheet {sheet_id}; "
+                        "reprocessing all rows")
+        else:
+            logger.info(f"{pipeline}: reprocessed {len(sheet.rows)} rows modified in sheet {sheet_id} "
+                        f"since {last_synced_at}")
+            version = sheet.version
+
+    for attempt in range(1, FETCH_ATTEMPTS + 1):
+        if rows is not None:
+            break
+        try:
+            pages = SheetPages(smart, sheet_id, columns)
+            rows = transform_rows(row_processor(columns), pages)
+            version = pages.version
+            logger.debug(f"found {len(rows)} rows")
+        except SheetChangedError:
+            if attempt == FETCH_ATTEMPTS:
+                raise
+            logger.warning(f"{pipeline}: sheet {sheet_id} changed while it was being fetched, fetching it again")
+
+    save_state(pipeline, sheet_id, version, synced_at, signature, rows)
+    return assign_colors(events for _, events in rows)
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import smartsheet
+
+from bench.fake_smartsheet import FakeSmartsheetServer
+from request_to_map import request_to_map_calendar
+from settings import get_settings
+from sheet_fetch import clear_columns
+
+
+class FakeServerTestCase(unittest.TestCase):
+    # a real SDK client against a fresh fake server, used as the shared client, run in a scratch directory
+
+    def setUp(self):
+        self.server = FakeSmartsheetServer(('127.0.0.1', 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.smart = self.client()
+        self.smart.errors_as_exceptions(True)
+
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir.name)  # for sheet_id.yaml, plans and the sqlite files
+        get_settings.cache_clear()
+        self.addCleanup(get_settings.cache_clear)
+        clear_columns()
+        self.addCleanup(clear_columns)
+        for patcher in (mock.patch('client.shared_client', lambda: self.smart),
+                        mock.patch.object(request_to_map_calendar, 'smart', self.smart)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def client(self) -> smartsheet.Smartsheet:
+        return smartsheet.Smartsheet(access_token='fake-token', api_base=self.server.api_base)
@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+from functools import partial
+from types import SimpleNamespace
+from unittest import mock
+
+from async_api import api_slots, run_concurrently, run_in_order, take_slots
+from settings import get_settings
+
+
+class TakeSlotsTest(unittest.TestCase):
+    def setUp(self):
+        get_settings.cache_clear()
+        api_slots.cache_clear()
+        self.addCleanup(api_slots.cache_clear)
+        self.addCleanup(get_settings.cache_clear)
+        patcher = mock.patch.dict(get_settings(), {'api_concurrency': 2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.lock = threading.Lock()
+        self.in_flight, self.most_in_flight = 0, 0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        return request
+
+    def test_every_request_takes_a_slot(self):
+        smart = take_slots(SimpleNamespace(_session=SimpleNamespace(send=self.send)))
+        self.assertIs(take_slots(smart), smart)
+        requests = [partial(smart._session.send, number) for number in range(6)]
+        nested = [partial(run_concurrently, requests[:3]), partial(run_in_order, requests[3:])]
+        self.assertEqual(run_concurrently([*nested, *requests]), [[0, 1, 2], [3, 4, 5], *range(6)])
+        self.assertEqual(self.most_in_flight, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import json
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from daemon import CallbackServer, Daemon, is_loopback, serve
+from settings import get_settings
+
+SHEET_IDS = {'intake': {'source': 10, 'destination': 20}}
+SECRET = 'shared-secret'
+
+
+class Started(Exception):
+    # raised where serve() would load sheet_id.yaml, once it has accepted its settings
+    pass
+
+
+class ServeTest(unittest.TestCase):
+    def serve(self, **settings) -> None:
+        with mock.patch.dict(get_settings()['daemon'], settings), \
+                mock.patch('calendar_control.load_sheet_ids', side_effect=Started):
+            serve()
+
+    def test_a_non_loopback_host_needs_signed_callbacks(self):
+        for host in ('0.0.0.0', '', '192.168.1.10', 'calendar.example.com'):
+            with self.assertRaises(ValueError):
+                self.serve(host=host, callback_url=None, allow_unsigned_callbacks=False)
+
+    def test_loopback_signed_or_explicitly_unsigned_hosts_start(self):
+        for settings in ({'host': '127.0.0.1', 'callback_url': None},
+                         {'host': 'localhost', 'callback_url': None},
+                         {'host': '::1', 'callback_url': None},
+                         {'host': '0.0.0.0', 'callback_url': 'https://calendar.example.com/hook'},
+                         {'host': '0.0.0.0', 'callback_url': None, 'allow_unsigned_callbacks': True}):
+            with self.assertRaises(Started):
+                self.serve(**{'allow_unsigned_callbacks': False, **settings})
+
+    def test_is_loopback(self):
+        self.assertTrue(is_loopback('127.0.0.2'))
+        self.assertFalse(is_loopback('10.0.0.1'))
+
+
+class CallbackTest(unittest.TestCase):
+    def start(self, signed_only: bool, secrets: dict = None) -> Daemon:
+        daemon = Daemon(SHEET_IDS, debounce_seconds=10, max_delay_seconds=60, resync_minutes=60,
+                        signed_only=signed_only)
+        daemon.secrets.update(secrets or {})
+        server = CallbackServer(('127.0.0.1', 0), daemon)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_address[1]}/'
+        return daemon
+
+    def post(self, callback: dict, signature: str = None) -> int:
+        body = json.dumps(callback).encode()
+        headers = {'Content-Type': 'application/json'}
+        if signature is not None:
+            headers['Smartsheet-Hmac-SHA256'] = signature
+        try:
+            with urlopen(Request(self.url, data=body, headers=headers, method='POST')) as response:
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    @staticmethod
+    def callback(webhook_id: int = 7) -> dict:
+        return {'webhookId': webhook_id, 'scope': 'sheet', 'scopeObjectId': 10,
+                'events': [{'objectType': 'row', 'eventType': 'updated'}]}
+
+    @staticmethod
+    def sign(callback: dict, secret: str = SECRET) -> str:
+        return hmac.new(secret.encode(), json.dumps(callback).encode(), hashlib.sha256).hexdigest()
+
+    def test_a_signed_callback_marks_the_pipelines_due(self):
+        daemon = self.start(signed_only=True, secrets={7: SECRET})
+        self.assertEqual(self.post(self.callback(), self.sign(self.callback())), 200)
+        self.assertEqual(daemon.due, {'intake'})
+
+    def test_unsigned_and_wrongly_signed_callbacks_are_rejected(self):
+        daemon = self.start(signed_only=True, secrets={7: SECRET})
+        for signature in (None, '', self.sign(self.callback(), 'another-secret'), self.sign({'webhookId': 7})):
+            self.assertEqual(self.post(self.callback(), signature), 401)
+        # signed with the secret of another webhook
+        self.assertEqual(self.post(self.callback(webhook_id=8), self.sign(self.callback(webhook_id=8))), 401)
+        self.assertEqual(daemon.due, set())
+
+    def test_signed_only_rejects_callbacks_before_the_secrets_are_known(self):
+        daemon = self.start(signed_only=True)
+        self.assertEqual(self.post(self.callback(), self.sign(self.callback())), 401)
+        self.assertEqual(daemon.due, set())
+
+    def test_verification_challenges_are_answered_unsigned(self):
+        self.start(signed_only=True, secrets={7: SECRET})
+        self.assertEqual(self.post({'challenge': 'abc', 'webhookId': 7}), 200)
+
+    def test_unsigned_callbacks_are_accepted_on_loopback(self):
+        daemon = self.start(signed_only=False)
+        self.assertEqual(self.post(self.callback()), 200)
+        self.assertEqual(daemon.due, {'intake'})
+
+
+if __name__ == '__main__':
+    unittest.main()
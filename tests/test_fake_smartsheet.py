@@ -0,0 +1,61 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import smartsheet
+
+import sync_state
+from fake_server import FakeServerTestCase
+from intake_calendar import INTAKE_COLUMNS, intake_columns, intake_row_processor
+
+LONG_AGO = '2020-01-01T00:00:00Z'
+
+
+class FakeServerTest(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+
+        api = self.server.api
+        columns = [{'title': title, 'type': 'DATE' if 'Date' in title else 'TEXT_NUMBER'} for title in INTAKE_COLUMNS]
+        self.sheet_id = api.add_sheet('Event Intake', columns, [
+            {'cells': {'Event Name': 'Q1 FY24'}},
+            *({'cells': {'Event Name': f'Roadshow {number}', 'Event Start Date': f'2023-08-0{number}'}}
+              for number in range(1, 5)),
+        ])
+        for row in api.sheet(self.sheet_id)['rows']:  # so that only the rows edited by a test look modified
+            row['modifiedAt'] = LONG_AGO
+
+    def edit_event_name(self, row_index: int, name: str) -> None:
+        sheet = self.server.api.sheet(self.sheet_id)
+        name_column = sheet['columns'][0]['id']
+        self.smart.Sheets.update_rows(self.sheet_id, [smartsheet.models.Row({
+            'id': sheet['rows'][row_index]['id'], 'cells': [{'columnId': name_column, 'value': name}]})])
+
+    def events(self) -> list:
+        return sync_state.incremental_events(self.smart, 'intake', self.sheet_id, intake_row_processor,
+                                             column_selector=intake_columns)
+
+    def test_rows_modified_since_reports_the_whole_sheet(self):
+        self.edit_event_name(2, 'Hackathon')
+        sheet = self.smart.Sheets.get_sheet(self.sheet_id, rows_modified_since='2021-01-01T00:00:00Z')
+        self.assertEqual(len(sheet.rows), 1)
+        self.assertEqual(sheet.total_row_count, 5)
+
+    def test_a_warm_run_with_one_edited_row_merges(self):
+        with mock.patch.object(sync_state, 'CLOCK_SKEW', timedelta(0)), \
+                mock.patch.object(sync_state, 'merge_rows', wraps=sync_state.merge_rows) as merge_rows, \
+                mock.patch.object(sync_state, 'transform_rows', wraps=sync_state.transform_rows) as transform_rows:
+            cold = self.events()
+            self.edit_event_name(2, 'Hackathon')
+            warm = self.events()
+
+        self.assertEqual(transform_rows.call_count, 1)  # the warm run didn't fall back to fetching the whole sheet
+        merge_rows.assert_called_once()
+        self.assertEqual([row.id for row in merge_rows.call_args.args[1]],
+                         [self.server.api.sheet(self.sheet_id)['rows'][2]['id']])
+        self.assertEqual([event.name for event in cold], ['Roadshow 1', 'Roadshow 2', 'Roadshow 3', 'Roadshow 4'])
+        self.assertEqual([event.name for event in warm], ['Roadshow 1', 'Hackathon', 'Roadshow 3', 'Roadshow 4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
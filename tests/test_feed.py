@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from feed import FeedServer, fold, ical, publish
+from settings import get_settings
+from utils import COLORS, CalendarEvent
+
+EVENTS = [
+    CalendarEvent('Cisco Live; Vegas, day 1\\2', '2024-06-02', '2024-06-06', 5),
+    CalendarEvent('Launch', '2024-01-10', '', 7),
+    CalendarEvent('Launch', '2024-01-10', '', 7),  # the same event twice
+    CalendarEvent('Unscheduled', None, None, 5),  # never written to the calendar sheet
+]
+
+
+def vevents(feed: str) -> list:
+    # [{PROPERTY: VALUE}] of the feed's VEVENTs, with folded lines unfolded
+    events, event = [], None
+    for line in feed.replace('\r\n ', '').split('\r\n'):
+        if line == 'BEGIN:VEVENT':
+            event = {}
+        elif line == 'END:VEVENT':
+            events.append(event)
+            event = None
+        elif event is not None:
+            name, value = line.split(':', 1)
+            event[name] = value
+    return events
+
+
+class IcalTest(unittest.TestCase):
+    def test_events_are_all_day_vevents(self):
+        feed = ical('intake', EVENTS)
+        self.assertTrue(feed.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'))
+        self.assertTrue(feed.endswith('END:VCALENDAR\r\n'))
+        events = vevents(feed)
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]['SUMMARY'], 'Cisco Live\\; Vegas\\, day 1\\\\2')
+        self.assertEqual(events[0]['DTSTART;VALUE=DATE'], '20240602')
+        self.assertEqual(events[0]['DTEND;VALUE=DATE'], '20240607')  # the day after the last one
+        self.assertEqual((events[1]['DTSTART;VALUE=DATE'], events[1]['DTEND;VALUE=DATE']), ('20240110', '20240111'))
+        self.assertNotEqual(events[1]['UID'], events[2]['UID'])
+        again = vevents(ical('intake', EVENTS))
+        self.assertEqual([event['UID'] for event in events], [event['UID'] for event in again])  # stable across runs
+
+    def test_long_lines_are_folded(self):
+        lines = fold('SUMMARY:' + 'é' * 100)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertTrue(all(line.startswith(' ') for line in lines[1:]))
+        self.assertEqual(lines[0] + ''.join(line[1:] for line in lines[1:]), 'SUMMARY:' + 'é' * 100)
+
+
+class FeedTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch.dict(get_settings()['feed'], {'directory': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, path: str, headers: dict = None) -> tuple:
+        # returns (status, headers, body)
+        try:
+            with urlopen(Request(self.url + path, headers=headers or {})) as response:
+                return response.status, response.headers, response.read()
+        except HTTPError as error:
+            return error.code, error.headers, error.read()
+
+    def serve(self) -> None:
+        server = FeedServer(('127.0.0.1', 0), self.directory)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_publish_writes_the_writable_events_once(self):
+        self.assertTrue(publish('intake', EVENTS))
+        with open(os.path.join(self.directory, 'intake.json')) as feed_file:
+            listing = json.load(feed_file)
+        self.assertEqual(listing['calendar'], 'intake')
+        self.assertEqual(listing['events'][0], {'name': 'Cisco Live; Vegas, day 1\\2', 'start': '2024-06-02',
+                                                'end': '2024-06-06', 'color': COLORS[5]})
+        self.assertEqual([event['end'] for event in listing['events']], ['2024-06-06', None, None])
+        self.assertFalse(publish('intake', EVENTS))  # unchanged
+        self.assertTrue(publish('intake', EVENTS[1:]))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['intake.ics', 'intake.json'])
+
+    def test_a_matching_if_none_match_gets_a_304(self):
+        publish('intake', EVENTS)
+        self.serve()
+        status, headers, body = self.get('/intake.ics')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(len(vevents(body.decode())), 3)
+        etag = headers['ETag']
+
+        status, headers, body = self.get('/intake.ics', {'If-None-Match': etag})
+        self.assertEqual((status, body, headers['ETag']), (304, b'', etag))
+        self.assertEqual(self.get('/intake.ics', {'If-None-Match': f'"other", W/{etag}'})[0], 304)
+        self.assertEqual(self.get('/intake.ics', {'If-None-Match': '"other"'})[0], 200)
+
+        publish('intake', EVENTS[1:])
+        status, headers, _ = self.get('/intake.ics', {'If-None-Match': etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['ETag'], etag)
+
+    def test_unknown_feeds_are_not_found(self):
+        publish('intake', EVENTS)
+        self.serve()
+        for path in ('/map.ics', '/intake.txt', '/../intake.json'):
+            self.assertEqual(self.get(path)[0], 404, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from datetime import date, timedelta
+
+from request_to_map.FY_Q_sort import calc_fy_q_hardcoded, fiscal_quarters
+
+# the hardcoded table the 4-4-5 rule replaced, {FY: {QUARTER: (START, END)}}
+OLD_TABLE = {
+    20: {
+        1: (date(2019, 7, 28), date(2019, 10, 26)),
+        2: (date(2019, 10, 27), date(2020, 1, 25)),
+        3: (date(2020, 1, 26), date(2020, 4, 25)),
+        4: (date(2020, 4, 26), date(2020, 7, 25)),
+    },
+    21: {
+        1: (date(2020, 7, 26), date(2020, 10, 24)),
+        2: (date(2020, 10, 25), date(2021, 1, 23)),
+        3: (date(2021, 1, 24), date(2021, 5, 1)),
+        4: (date(2021, 5, 2), date(2021, 7, 31)),
+    },
+    22: {
+        1: (date(2021, 8, 1), date(2021, 10, 24)),
+        2: (date(2021, 10, 25), date(2022, 1, 23)),
+        3: (date(2022, 1, 24), date(2022, 5, 1)),
+        4: (date(2022, 5, 2), date(2022, 7, 31)),
+    },
+    23: {
+        1: (date(2022, 8, 1), date(2022, 10, 29)),
+        2: (date(2022, 10, 30), date(2023, 1, 28)),
+        3: (date(2023, 1, 29), date(2023, 4, 29)),
+        4: (date(2023, 4, 30), date(2023, 7, 29)),
+    },
+    24: {
+        1: (date(2023, 7, 30), date(2023, 10, 28)),
+        2: (date(2023, 10, 29), date(2024, 1, 27)),
+        3: (date(2024, 1, 28), date(2024, 4, 27)),
+        4: (date(2024, 4, 28), date(2024, 7, 27)),
+    },
+    25: {
+        1: (date(2024, 7, 28), date(2024, 10, 27)),
+        2: (date(2024, 10, 28), date(2025, 2, 2)),
+        3: (date(2025, 2, 3), date(2025, 4, 28)),
+        4: (date(2025, 4, 29), date(2025, 7, 26)),
+    },
+    26: {
+        1: (date(2025, 7, 27), date(2025, 10, 25)),
+        2: (date(2025, 10, 26), date(2026, 1, 24)),
+        3: (date(2026, 1, 25), date(2026, 4, 25)),
+        4: (date(2026, 4, 26), date(2026, 7, 25)),
+    },
+    27: {  # estimated, need to update once calendar is out
+        1: (date(2026, 7, 26), date(2026, 10, 25)),
+        2: (date(2026, 10, 26), date(2027, 1, 24)),
+        3: (date(2027, 1, 25), date(2027, 4, 25)),
+        4: (date(2027, 4, 26), date(2027, 7, 25)),
+    },
+}
+
+
+def days(start: date, end: date):
+    while start <= end:
+        yield start
+        start += timedelta(days=1)
+
+
+def old_fy_q(day: date) -> tuple:
+    return next((fy, quarter) for fy, quarters in OLD_TABLE.items()
+                for quarter, (start, end) in quarters.items() if start <= day <= end)
+
+
+class FiscalQuarterTest(unittest.TestCase):
+    def test_fy20_to_fy26_match_the_old_table(self):
+        for day in days(OLD_TABLE[20][1][0], OLD_TABLE[26][4][1]):
+            self.assertEqual(calc_fy_q_hardcoded(day.isoformat()), old_fy_q(day), day)
+
+    def test_fy27_boundaries_shift_by_8_days(self):
+        # FY27 follows the rule instead of the old table's estimate, see FY_Q_sort.py
+        moved = {day: (old_fy_q(day), calc_fy_q_hardcoded(day.isoformat()))
+                 for day in days(OLD_TABLE[27][1][0], OLD_TABLE[27][4][1])
+                 if calc_fy_q_hardcoded(day.isoformat()) != old_fy_q(day)}
+        self.assertEqual(moved, {date(2026, 10, 25): ((27, 1), (27, 2)),
+                                 date(2027, 1, 24): ((27, 2), (27, 3)),
+                                 **{day: ((27, 4), (27, 3)) for day in days(date(2027, 4, 26), date(2027, 5, 1))}})
+        self.assertEqual(fiscal_quarters(27)[4][1], date(2027, 7, 31))
+        self.assertEqual(calc_fy_q_hardcoded('2027-08-01'), (28, 1))
+
+    def test_quarters_follow_each_other(self):
+        for fy in range(20, 35):
+            quarters = fiscal_quarters(fy)
+            self.assertEqual(fiscal_quarters(fy + 1)[1][0], quarters[4][1] + timedelta(days=1), fy)
+            for quarter in range(1, 4):
+                self.assertEqual(quarters[quarter + 1][0], quarters[quarter][1] + timedelta(days=1), (fy, quarter))
+
+    def test_dates_outside_the_table(self):
+        self.assertEqual(calc_fy_q_hardcoded('2017-04-20'), (17, 3))
+        self.assertEqual(calc_fy_q_hardcoded('2031-04-26'), (31, 3))
+        self.assertEqual(calc_fy_q_hardcoded('2031-05-01'), (31, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
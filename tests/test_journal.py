@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import unittest
+from collections import Counter
+from unittest import mock
+
+from bench.synthetic import generate_sheets
+from fake_server import FakeServerTestCase
+from planner import plannable, planning
+from request_to_map import journal, request_to_map_calendar
+from request_to_map.journal import ADDED, COPIED, DONE, PLANNED, Journal
+from settings import get_settings
+
+
+class Crash(Exception):
+    # stands in for the process dying
+    pass
+
+
+def crash_after(method: str):
+    # the first call of a Journal method that has rows to record dies once they are recorded
+    original = getattr(Journal, method)
+
+    def crashing(self, rows):
+        original(self, rows)
+        if rows:
+            raise Crash(method)
+    return mock.patch.object(Journal, method, crashing)
+
+
+def crash_before(method: str):
+    # the first call of a Journal method that has rows to record dies before they are recorded
+    original = getattr(Journal, method)
+
+    def crashing(self, rows):
+        if rows:
+            raise Crash(method)
+        original(self, rows)
+    return mock.patch.object(Journal, method, crashing)
+
+
+class FakeSheetsTestCase(FakeServerTestCase):
+    # request to map against generated sheets on a fake server
+
+    def setUp(self):
+        super().setUp()
+
+        sheet_ids = generate_sheets(self.server.api, map=30, intake=0, request=12, yellow_fraction=0.5)
+        self.request_id, self.map_id = sheet_ids['request source'], sheet_ids['map source']
+        self.map_before = self.map_names()
+        self.yellow = Counter(self.request_names('Yellow'))
+        self.assertTrue(self.yellow)
+
+    def cell_values(self, sheet_id: int, title: str) -> list:
+        # [(ROW, VALUE)] of a column, in sheet order
+        sheet = self.server.api.sheet(sheet_id)
+        column_id = next(column['id'] for column in sheet['columns'] if column['title'] == title)
+        return [(row, row['cells'].get(column_id, {}).get('value')) for row in sheet['rows']]
+
+    def map_names(self) -> Counter:
+        return Counter(name for _, name in self.cell_values(self.map_id, 'Event Name'))
+
+    def request_names(self, status: str) -> list:
+        statuses = dict((row['id'], value) for row, value in self.cell_values(self.request_id, 'TechX Status'))
+        return [name for row, name in self.cell_values(self.request_id, 'Event Name') if statuses[row['id']] == status]
+
+    def journal_entries(self) -> list:
+        if not os.path.exists(journal.JOURNAL_FILE):
+            return []
+        with sqlite3.connect(journal.JOURNAL_FILE) as connection:
+            return connection.execute("SELECT row_id, status FROM moves").fetchall()
+
+    def run_pipeline(self, **kwargs) -> None:
+        request_to_map_calendar._process_sheet(self.request_id, self.map_id, **kwargs)
+
+
+class JournalResumeTest(FakeSheetsTestCase):
+    def crash_and_resume(self, crash, journaled_status: str, **kwargs) -> None:
+        with crash, self.assertRaises(Crash):
+            self.run_pipeline(**kwargs)
+        self.assertIn(journaled_status, {status for _, status in self.journal_entries()})  # the rest are PLANNED
+        self.run_pipeline(**kwargs)
+
+        self.assertEqual(self.map_names(), self.map_before + self.yellow)  # every row once, none lost
+        moved = set(self.yellow)
+        self.assertTrue(all(row['parentId'] for row, name in self.cell_values(self.map_id, 'Event Name')
+                            if name in moved and not self.map_before[name]))  # all in their quarter
+        self.assertEqual(self.request_names('Yellow'), [])
+        self.assertEqual(self.journal_entries(), [])
+
+    def test_an_uninterrupted_run(self):
+        self.run_pipeline()
+        self.assertEqual(self.map_names(), self.map_before + self.yellow)
+        self.assertEqual(self.journal_entries(), [])
+
+    def test_planned_rows_that_were_not_added_are_moved_again(self):
+        self.crash_and_resume(crash_after('planned'), PLANNED)
+
+    def test_planned_rows_that_were_added_are_found_in_their_quarter(self):
+        self.crash_and_resume(crash_before('added'), PLANNED)
+
+    def test_added_rows_only_have_their_status_set(self):
+        self.crash_and_resume(crash_after('added'), ADDED)
+
+    def test_done_rows_are_dropped_by_the_next_run(self):
+        self.crash_and_resume(crash_after('done'), DONE)
+
+    def test_rows_sent_one_at_a_time_resume_too(self):
+        self.crash_and_resume(crash_before('added'), PLANNED, batched=False)
+
+    def test_copied_rows_are_put_in_place_without_copying_them_again(self):
+        with mock.patch.dict(get_settings(), {'server_side_copy': True}):
+            self.crash_and_resume(crash_after('copied'), COPIED)
+
+    def test_copied_rows_are_placed_even_with_server_side_copy_off(self):
+        with mock.patch.dict(get_settings(), {'server_side_copy': True}), \
+                crash_after('copied'), self.assertRaises(Crash):
+            self.run_pipeline()
+        self.crash_and_resume(crash_after('added'), ADDED)
+
+    def test_planned_rows_that_were_copied_are_found_at_the_top_level(self):
+        with mock.patch.dict(get_settings(), {'server_side_copy': True}):
+            self.crash_and_resume(crash_before('copied'), PLANNED)
+
+
+class PagedRequestSheetTest(FakeSheetsTestCase):
+    # the request sheet's 12 rows are read in pages of 5 while Yellow rows are moved
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(get_settings(), {'fetch_page_size': 5})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rows_sent_in_a_batch(self):
+        self.run_pipeline()
+        self.assertEqual(self.map_names(), self.map_before + self.yellow)
+        self.assertEqual(self.request_names('Yellow'), [])
+
+    def test_rows_sent_one_at_a_time(self):
+        self.run_pipeline(batched=False)
+        self.assertEqual(self.map_names(), self.map_before + self.yellow)
+        self.assertEqual(self.request_names('Yellow'), [])
+
+
+class InMemoryJournalTest(FakeSheetsTestCase):
+    def test_simulations_keep_the_journal_in_memory(self):
+        self.run_pipeline(simulate=True)
+        self.assertFalse(os.path.exists(journal.JOURNAL_FILE))
+        self.assertEqual(self.map_names(), self.map_before)
+
+    def test_plans_keep_the_journal_in_memory(self):
+        plannable(self.smart)
+        with planning() as plan:
+            self.run_pipeline()
+        self.assertTrue(plan.operations)
+        self.assertFalse(os.path.exists(journal.JOURNAL_FILE))
+        self.assertEqual(self.map_names(), self.map_before)
+
+    def test_the_move_journal_setting_keeps_it_in_memory(self):
+        with mock.patch.dict(get_settings(), {'move_journal': False}):
+            with Journal(1, 2) as first:
+                first.planned([3])
+            with Journal(1, 2) as second:
+                self.assertIsNone(second.status(3))
+        self.assertFalse(os.path.exists(journal.JOURNAL_FILE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+import smartsheet
+import yaml
+
+from bench.synthetic import MAP_COLUMNS, REQUEST_COLUMNS, generate_sheets, sheet_id_config
+from fake_server import FakeServerTestCase
+from planner import PlanOutdatedError, execute_plan, make_plan, plannable
+from request_to_map.FY_Q_sort import calc_fy_q_hardcoded
+
+WRITES = {'add_rows', 'update_rows', 'delete_rows', 'copy_rows'}
+
+
+def request(name: str, status: str, start: str) -> dict:
+    return {'cells': {'Event Name': name, 'TechX Status': status, 'Event Start Date': start}}
+
+
+class PlanTest(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+
+        api = self.server.api
+        self.map_id = api.add_sheet('Event Map', MAP_COLUMNS, [
+            {'cells': {'Event Name': 'FY24'}},
+            *({'parent': 0, 'cells': {'Event Name': f'Q{quarter}'}} for quarter in range(1, 5)),
+        ])
+        self.request_id = api.add_sheet('TechX Requests', REQUEST_COLUMNS, [
+            request('Roadshow', 'Yellow', '2023-08-10'),
+            request('Hackathon', 'Green', '2023-09-01'),
+            request('Impact', 'Yellow', '2028-09-01'),  # in FY29, which the map sheet doesn't have yet
+        ])
+        with open('sheet_id.yaml', 'w') as yaml_file:
+            yaml.safe_dump({'request to map': {'source': self.request_id, 'destination': self.map_id}}, yaml_file)
+
+    def client(self) -> smartsheet.Smartsheet:
+        return plannable(super().client())
+
+    def map_rows(self, parent_id: int = None) -> dict:
+        # {EVENT NAME: STORED ROW} of the map sheet rows under parent_id (None for the top level)
+        sheet = self.server.api.sheet(self.map_id)
+        return {row['cells'][sheet['columns'][0]['id']]['value']: row for row in sheet['rows']
+                if row['parentId'] == parent_id}
+
+    def write_calls(self) -> dict:
+        return {endpoint: entry['calls'] for endpoint, entry in self.server.stats.to_dict().items()
+                if endpoint in WRITES}
+
+    def test_a_plan_writes_nothing_until_it_is_executed(self):
+        before = self.server.api.sheet(self.map_id)['version'], self.server.api.sheet(self.request_id)['version']
+        estimate = make_plan('plan.json', {'request to map'})
+        self.assertEqual(self.write_calls(), {})
+        self.assertEqual((self.server.api.sheet(self.map_id)['version'],
+                          self.server.api.sheet(self.request_id)['version']), before)
+
+        with open('plan.json') as plan_file:
+            operations = json.load(plan_file)['operations']
+        self.assertEqual(estimate['write_calls'], len(operations))
+        self.assertEqual({operation['pipeline'] for operation in operations}, {'request to map'})
+        placeholders = [row_id for operation in operations for row_id in operation['creates']]
+        self.assertTrue(placeholders)
+        self.assertTrue(all(row_id < 0 for row_id in placeholders))
+
+        execute_plan('plan.json')
+        self.assertEqual(self.write_calls().keys(), {'add_rows', 'update_rows'})
+        self.assertTrue(all(row['id'] > 0 and (row['parentId'] or 0) >= 0
+                            for row in self.server.api.sheet(self.map_id)['rows']))
+        fy_rows = self.map_rows()
+        self.assertEqual(list(fy_rows), ['FY24', 'FY29'])
+        for name, start in (('Roadshow', '2023-08-10'), ('Impact', '2028-09-01')):
+            fy, quarter = calc_fy_q_hardcoded(start)
+            quarter_row = self.map_rows(fy_rows[f'FY{fy}']['id'])[f'Q{quarter}']
+            self.assertEqual(list(self.map_rows(quarter_row['id'])), [name])  # by the real ids of new rows too
+        self.assertEqual(self.server.api.sheet(self.request_id)['version'], 2)  # statuses set to Green
+
+    def test_a_plan_is_not_sent_once_its_sheets_have_changed(self):
+        make_plan('plan.json', {'request to map'})
+        self.server.api.sheet(self.map_id)['version'] += 1
+        with self.assertRaises(PlanOutdatedError):
+            execute_plan('plan.json')
+        self.assertEqual(self.write_calls(), {})
+
+
+class CalendarPlanTest(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.sheet_ids = generate_sheets(self.server.api, map=0, intake=600, request=0)
+        with open('sheet_id.yaml', 'w') as yaml_file:
+            yaml.safe_dump(sheet_id_config(self.sheet_ids), yaml_file)
+
+    def client(self) -> smartsheet.Smartsheet:
+        return plannable(super().client())
+
+    def test_new_calendar_rows_keep_their_order_when_the_plan_is_sent(self):
+        make_plan('plan.json', {'intake'})
+        calendar_id = self.sheet_ids['intake destination']
+        with open('plan.json') as plan_file:
+            adds = [operation['body'] for operation in json.load(plan_file)['operations']
+                    if operation['method'] == 'POST' and operation['path'] == f'/sheets/{calendar_id}/rows']
+        self.assertGreater(len(adds), 1)
+
+        post = self.smart.Passthrough.post
+
+        def slow_first_chunk(path: str, payload):
+            if payload.serialize()[0] == adds[0][0]:
+                time.sleep(0.2)  # so the chunks after it would land first if they were sent with it
+            return post(path, payload)
+
+        with mock.patch.object(self.smart.Passthrough, 'post', slow_first_chunk):
+            execute_plan('plan.json')
+        sheet = self.server.api.sheet(calendar_id)
+        name_column = sheet['columns'][0]['id']
+        self.assertEqual([row['cells'][name_column]['value'] for row in sheet['rows']],
+                         [row['cells'][0]['value'] for chunk in adds for row in chunk])
+
+
+if __name__ == '__main__':
+    unittest.main()
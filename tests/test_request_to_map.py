@@ -0,0 +1,116 @@
+import unittest
+
+import smartsheet
+
+from request_to_map.request_to_map_calendar import (ColumnTranslation, build_map_row, copied_row, placement_row,
+                                                    set_row_location)
+
+
+def columns(*specs: tuple) -> list:
+    # specs are (ID, TITLE, TYPE)
+    return [smartsheet.models.Column({'id': column_id, 'title': title, 'type': column_type})
+            for column_id, title, column_type in specs]
+
+
+REQUEST_COLUMNS = columns((1, 'Event Name', 'TEXT_NUMBER'),
+                          (2, 'TechX Status', 'PICKLIST'),
+                          (3, 'Event Start Date', 'DATE'),
+                          (4, 'Services', 'MULTI_PICKLIST'),
+                          (5, 'Notes', 'TEXT_NUMBER'),
+                          (6, 'Budget', 'TEXT_NUMBER'),  # not on the map sheet
+                          (7, 'Location', 'TEXT_NUMBER'))  # renamed to Venue on the map sheet
+
+MAP_COLUMNS = columns((11, 'Event Name', 'TEXT_NUMBER'),
+                      (12, 'TechX Status', 'PICKLIST'),
+                      (13, 'Event Start Date', 'DATE'),
+                      (14, 'Services', 'MULTI_PICKLIST'),
+                      (15, 'Notes', 'DATE'),  # same title, different type
+                      (17, 'Venue', 'TEXT_NUMBER'),
+                      (18, 'TechX Service Request', 'CHECKBOX'))
+
+MAP_COLUMN_MAPPING = {column.title: column.id for column in MAP_COLUMNS}
+
+
+def request_row() -> smartsheet.models.Row:
+    return smartsheet.models.Row({'id': 101, 'cells': [
+        {'columnId': 1, 'value': 'Roadshow'},
+        {'columnId': 2, 'value': 'Yellow'},
+        {'columnId': 3, 'value': '2024-03-05'},
+        {'columnId': 4, 'objectValue': {'objectType': 'MULTI_PICKLIST', 'values': ['AV', 'Demo']}},
+        {'columnId': 5},
+        {'columnId': 6, 'value': 5000},
+        {'columnId': 7, 'value': 'San Jose'},
+    ]})
+
+
+def cell_contents(row: smartsheet.models.Row) -> dict:
+    # {COLUMN ID: VALUE, or the values of a multi-picklist}
+    return {cell.column_id: list(values) if (values := getattr(cell.object_value, 'values', None)) is not None
+            else cell.value for cell in row.cells}
+
+
+class ColumnTranslationTest(unittest.TestCase):
+    def test_columns_are_matched_by_title(self):
+        translation = ColumnTranslation(REQUEST_COLUMNS, MAP_COLUMNS)
+        self.assertEqual({request_id: column.id for request_id, column in translation.map_columns.items()},
+                         {1: 11, 2: 12, 3: 13, 4: 14, 5: 15})
+        self.assertEqual(translation.map_column_ids, [11, 12, 13, 14, 15, 17, 18])
+
+    def test_only_columns_of_the_same_type_are_copied_on_the_server(self):
+        translation = ColumnTranslation(REQUEST_COLUMNS, MAP_COLUMNS)
+        self.assertEqual(translation.copied_on_server, {11, 12, 13, 14})
+        self.assertFalse(translation.copies_cleanly)
+
+    def test_copies_cleanly_when_every_request_column_is_on_the_map_sheet(self):
+        request_columns = columns((1, 'Event Name', 'TEXT_NUMBER'), (4, 'Services', 'MULTI_PICKLIST'),
+                                  (8, 'TechX Service Request', 'CHECKBOX'))
+        translation = ColumnTranslation(request_columns, MAP_COLUMNS)
+        self.assertTrue(translation.copies_cleanly)
+        self.assertEqual(translation.copied_on_server, {11, 14})  # TechX Service Request is always checked
+
+
+class BuildMapRowTest(unittest.TestCase):
+    def test_cells_are_sent_to_the_map_columns_with_the_same_title(self):
+        new_row = build_map_row(request_row(), ColumnTranslation(REQUEST_COLUMNS, MAP_COLUMNS), MAP_COLUMN_MAPPING)
+        self.assertEqual(cell_contents(new_row), {11: 'Roadshow', 12: 'Yellow', 13: '2024-03-05', 14: ['AV', 'Demo'],
+                                                  15: ' ', 18: True})
+        self.assertTrue(all(cell.strict is False for cell in new_row.cells if cell.column_id != 18))
+
+    def test_a_multi_picklist_read_as_text_is_sent_as_text(self):
+        row = request_row()
+        row.cells[3] = smartsheet.models.Cell({'columnId': 4, 'value': 'AV, Demo'})
+        new_row = build_map_row(row, ColumnTranslation(REQUEST_COLUMNS, MAP_COLUMNS), MAP_COLUMN_MAPPING)
+        self.assertEqual(new_row.cells[3].to_dict()['objectValue'], 'AV, Demo')
+
+
+class CopiedRowTest(unittest.TestCase):
+    def setUp(self):
+        self.translation = ColumnTranslation(REQUEST_COLUMNS, MAP_COLUMNS)
+        self.new_row = build_map_row(request_row(), self.translation, MAP_COLUMN_MAPPING)
+        set_row_location(self.new_row, 1000, 2000)
+        self.new_row.id = 3000  # the id of the copy, see copy_to_map
+
+    def test_the_placement_only_sends_what_the_server_did_not_copy(self):
+        placement = placement_row(self.new_row, self.translation)
+        self.assertEqual((placement.id, placement.sibling_id, placement.above), (3000, 2000, True))
+        self.assertIsNone(placement.to_bottom)
+        self.assertEqual(cell_contents(placement), {15: ' ', 18: True})
+
+    def test_the_copied_row_has_the_copied_and_the_placed_cells(self):
+        placement = placement_row(self.new_row, self.translation)
+        copied = copied_row(request_row(), placement, self.translation)
+        self.assertEqual((copied.id, copied.sibling_id, copied.above), (3000, 2000, True))
+        self.assertEqual([cell.column_id for cell in copied.cells], self.translation.map_column_ids)
+        self.assertEqual(cell_contents(copied), {11: 'Roadshow', 12: 'Yellow', 13: '2024-03-05',
+                                                 14: ['AV', 'Demo'], 15: ' ', 17: None, 18: True})
+
+    def test_a_row_at_the_bottom_of_its_quarter(self):
+        new_row = build_map_row(request_row(), self.translation, MAP_COLUMN_MAPPING)
+        set_row_location(new_row, 1000, None)
+        new_row.id = 3000
+        copied = copied_row(request_row(), placement_row(new_row, self.translation), self.translation)
+        self.assertEqual((copied.parent_id, copied.to_bottom, copied.sibling_id), (1000, True, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from scheduler import COSMETIC, READ, Scheduler, priority, schedule
+
+
+class ClockCondition(threading.Condition):
+    # the fake clock only moves when a test advances it, which notifies the waiting threads
+    def wait(self, timeout: float = None) -> bool:
+        return super().wait(1)
+
+
+class FakeClockTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch('scheduler.time', SimpleNamespace(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scheduler(self, requests_per_minute: int = 60, burst: int = 1, max_retries: int = 2) -> Scheduler:
+        scheduler = Scheduler(requests_per_minute, burst, max_retries)
+        scheduler.condition = ClockCondition()
+        return scheduler
+
+    def advance(self, scheduler: Scheduler, seconds: float) -> None:
+        with scheduler.condition:
+            self.now += seconds
+            scheduler.condition.notify_all()
+
+    def wait_for(self, scheduler: Scheduler, condition) -> None:
+        # polls condition() (with the scheduler locked, so the threads it waits on are in wait()) for up to 5s
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with scheduler.condition:
+                if condition():
+                    return
+            time.sleep(0.001)
+        self.fail("timed out")
+
+    def client(self, scheduler: Scheduler, statuses: list, headers: dict = None) -> SimpleNamespace:
+        # a client whose session answers with each of statuses in turn; records when each request was sent, and how
+        self.sent, self.sent_methods = [], []
+        responses = iter(statuses)
+
+        def send(request, **kwargs):
+            self.sent_methods.append(request.method)
+            self.sent.append(self.now)
+            return mock.Mock(status_code=next(responses), headers=headers or {})
+        return schedule(SimpleNamespace(_session=SimpleNamespace(send=send)), scheduler)
+
+    def start(self, target, *args) -> threading.Thread:
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+
+class BucketTest(FakeClockTest):
+    def test_a_burst_goes_out_at_once_and_the_bucket_refills_at_the_rate(self):
+        scheduler = self.scheduler(requests_per_minute=120, burst=3)
+        self.assertEqual([scheduler.acquire(READ) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(scheduler.tokens, 0)
+
+        self.now = 1.0
+        scheduler.refill(self.now)
+        self.assertEqual(scheduler.tokens, 2)  # two requests per second
+        self.now = 60.0
+        scheduler.refill(self.now)
+        self.assertEqual(scheduler.tokens, 3)  # never more than the burst
+
+    def test_an_empty_bucket_waits_for_its_next_token(self):
+        scheduler = self.scheduler(requests_per_minute=60, burst=1)
+        scheduler.acquire(READ)
+        sent = []
+        self.start(lambda: sent.append(scheduler.acquire(READ)))
+        self.wait_for(scheduler, lambda: scheduler.waiting)
+        self.advance(scheduler, 0.5)
+        self.wait_for(scheduler, lambda: scheduler.updated == 0.5)  # it looked again, and kept waiting
+        self.assertEqual(sent, [])
+        self.advance(scheduler, 0.5)
+        self.wait_for(scheduler, lambda: sent)
+        self.assertEqual(sent, [1.0])
+
+
+class PriorityTest(FakeClockTest):
+    def test_a_write_goes_before_a_cosmetic_write_that_was_waiting_first(self):
+        scheduler = self.scheduler(burst=1)
+        smart = self.client(scheduler, [200] * 3)
+        smart._session.send(SimpleNamespace(method='GET'))  # empties the bucket
+
+        def send_cosmetic() -> None:
+            with priority(COSMETIC):
+                smart._session.send(SimpleNamespace(method='PUT'))
+
+        self.start(send_cosmetic)
+        self.wait_for(scheduler, lambda: len(scheduler.waiting) == 1)
+        self.start(smart._session.send, SimpleNamespace(method='POST'))  # a WRITE, having no priority()
+        self.wait_for(scheduler, lambda: len(scheduler.waiting) == 2)
+
+        self.advance(scheduler, 1)
+        self.wait_for(scheduler, lambda: len(self.sent) == 2)
+        self.advance(scheduler, 1)
+        self.wait_for(scheduler, lambda: len(self.sent) == 3)
+        self.assertEqual(list(zip(self.sent_methods, self.sent)), [('GET', 0.0), ('POST', 1.0), ('PUT', 2.0)])
+
+    def test_requests_of_the_same_priority_go_in_arrival_order(self):
+        scheduler = self.scheduler(burst=1)
+        scheduler.acquire(READ)
+        order = []
+
+        def send(name: str) -> None:
+            scheduler.acquire(COSMETIC)
+            order.append(name)
+
+        for waiting, name in enumerate(('first', 'second'), start=1):
+            self.start(send, name)
+            self.wait_for(scheduler, lambda: len(scheduler.waiting) == waiting)
+        for sent in (1, 2):
+            self.advance(scheduler, 1)
+            self.wait_for(scheduler, lambda: len(order) == sent)
+        self.assertEqual(order, ['first', 'second'])
+
+
+class RateLimitedTest(FakeClockTest):
+    def test_retry_after_delays_the_resend(self):
+        scheduler = self.scheduler(requests_per_minute=60, burst=5)
+        smart = self.client(scheduler, [429, 200], {'Retry-After': '7'})
+        responses = []
+        self.start(lambda: responses.append(smart._session.send(SimpleNamespace(method='GET'))))
+        self.wait_for(scheduler, lambda: scheduler.waiting)
+        self.assertEqual(self.sent, [0.0])
+        self.assertEqual(scheduler.paused_until, 7.0)
+        self.assertEqual(scheduler.rate, 0.5)  # halved
+
+        self.advance(scheduler, 6.5)
+        self.wait_for(scheduler, lambda: scheduler.updated == 6.5)
+        self.assertEqual(self.sent, [0.0])
+        self.advance(scheduler, 0.5)
+        self.wait_for(scheduler, lambda: responses)
+        self.assertEqual(self.sent, [0.0, 7.0])
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(scheduler.rate, 0.5 + 1 / 20)  # on its way back to the limit
+
+    def test_the_sdk_sees_the_429_after_max_retries(self):
+        scheduler = self.scheduler(burst=5, max_retries=1)
+        smart = self.client(scheduler, [429, 429], {'Retry-After': '2'})
+        responses = []
+        self.start(lambda: responses.append(smart._session.send(SimpleNamespace(method='PUT'))))
+        self.wait_for(scheduler, lambda: scheduler.waiting)
+        self.advance(scheduler, 2)
+        self.wait_for(scheduler, lambda: responses)
+        self.assertEqual(self.sent, [0.0, 2.0])
+        self.assertEqual(responses[0].status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from datetime import date
+
+import smartsheet
+
+from request_to_map.sheet_tree import SheetTree
+
+COLUMNS = {'Event Name': 1, 'Event Start Date': 2}
+
+
+def row(row_id: int, name: str, start: str = None, **location) -> dict:
+    # location is the row's parentId, siblingId, above and toBottom, as an API response or a planned row has them
+    cells = [{'columnId': 1, 'value': name}]
+    if start is not None:
+        cells.append({'columnId': 2, 'value': start})
+    return {'id': row_id, 'cells': cells, **location}
+
+
+def rows(*specs: dict) -> list:
+    return [smartsheet.models.Row(spec) for spec in specs]
+
+
+class SheetTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = SheetTree(smartsheet.models.Sheet({'id': 1, 'rows': [
+            row(10, 'FY24'),
+            row(11, 'Q1', parentId=10),
+            row(21, 'Roadshow', '2023-08-05', parentId=11),
+            row(22, 'Hackathon', '2023-09-01', parentId=11, siblingId=21),
+            row(12, 'Q2 (Nov-Jan)', parentId=10, siblingId=11),
+            row(13, 'Q3', parentId=10, siblingId=12),
+            row(14, 'Q4', parentId=10, siblingId=13),
+            row(30, 'Notes'),
+        ]}), COLUMNS)
+
+    def test_fiscal_year_and_quarter_rows(self):
+        self.assertEqual(self.tree.fiscal_years(), ['FY24'])
+        self.assertEqual(self.tree.fy_row(24).id, 10)
+        self.assertIsNone(self.tree.fy_row(25))
+        self.assertEqual(self.tree.quarter_row(24, 2).id, 12)
+        self.assertIsNone(self.tree.quarter_row(25, 1))
+
+    def test_sibling_after(self):
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 1)), 21)
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 5)), 22)  # after the events of the same day
+        self.assertIsNone(self.tree.sibling_after(11, date(2023, 10, 1)))
+        self.assertIsNone(self.tree.sibling_after(12, date(2023, 11, 1)))  # no events yet
+
+    def test_added_rows_move_sibling_after(self):
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 10)), 22)  # builds the sorted index
+
+        # as add_rows answers: siblingId is the row now directly above the new one
+        self.tree.add(rows(row(23, 'Impact', '2023-08-20', parentId=11, siblingId=21)))
+        self.assertEqual([child.id for child in self.tree.child_rows(11)], [21, 23, 22])
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 10)), 23)
+
+        # as planned: placed above its sibling, with no parentId of its own
+        self.tree.add(rows(row(-1, 'Briefing', '2023-08-15', siblingId=23, above=True)))
+        self.assertEqual([child.id for child in self.tree.child_rows(11)], [21, -1, 23, 22])
+        self.assertEqual(self.tree.rows[-1].parent_id, 11)
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 10)), -1)
+
+        # as planned, at the bottom of the quarter
+        self.tree.add(rows(row(-2, 'Offsite', '2023-10-01', parentId=11, toBottom=True)))
+        self.assertEqual(self.tree.child_rows(11)[-1].id, -2)
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 9, 15)), -2)
+        self.assertIsNone(self.tree.sibling_after(11, date(2023, 10, 1)))
+
+    def test_a_row_moved_into_its_quarter(self):
+        # a copied row lands at the top level, then is placed in its quarter
+        self.tree.add(rows(row(25, 'Impact', '2023-08-20', toBottom=True)))
+        self.assertEqual([child.id for child in self.tree.child_rows(None)], [10, 30, 25])
+        self.tree.add(rows(row(25, 'Impact', '2023-08-20', siblingId=22, above=True)))
+        self.assertEqual([child.id for child in self.tree.child_rows(None)], [10, 30])
+        self.assertEqual([child.id for child in self.tree.child_rows(11)], [21, 25, 22])
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 10)), 25)
+
+        # and moved again, to another quarter
+        self.assertIsNone(self.tree.sibling_after(12, date(2023, 11, 1)))  # builds the sorted index
+        self.tree.add(rows(row(25, 'Impact', '2023-11-20', parentId=12, toBottom=True)))
+        self.assertEqual([child.id for child in self.tree.child_rows(11)], [21, 22])
+        self.assertEqual(self.tree.sibling_after(11, date(2023, 8, 10)), 22)
+        self.assertEqual(self.tree.sibling_after(12, date(2023, 11, 1)), 25)
+
+    def test_the_first_row_of_a_quarter(self):
+        # add_rows answers without a siblingId when there's nothing above the new row
+        self.tree.add(rows(row(24, 'Kickoff', '2023-11-01', parentId=12)))
+        self.assertTrue(self.tree.has_children(12))
+        self.assertIsNone(self.tree.sibling_after(12, date(2023, 11, 1)))
+        self.assertEqual(self.tree.sibling_after(12, date(2023, 10, 30)), 24)
+
+    def test_a_new_fiscal_year(self):
+        self.tree.add(rows(row(40, 'FY25', siblingId=30)))
+        self.tree.add(rows(*(row(41 + quarter, f'Q{quarter + 1}', parentId=40, toBottom=True)
+                             for quarter in range(4))))
+        self.assertEqual(self.tree.fiscal_years(), ['FY24', 'FY25'])
+        self.assertEqual([child.id for child in self.tree.child_rows(None)], [10, 30, 40])
+        self.assertEqual(self.tree.quarter_row(25, 3).id, 43)
+        self.assertIsNone(self.tree.sibling_after(43, date(2025, 2, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
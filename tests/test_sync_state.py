@@ -0,0 +1,199 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import smartsheet
+
+import sheet_fetch
+import sync_state
+from settings import get_settings
+from sheet_fetch import SheetChangedError, clear_columns
+from sync_state import column_signature, incremental_events, merge_rows, same_processor
+
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)  # when every sync in IncrementalEventsTest happens
+LONG_AGO = '2020-01-01T00:00:00Z'
+
+
+def row(row_id: int, row_number: int, name: str) -> SimpleNamespace:
+    # the parts of a rowsModifiedSince row that merge_rows reads, plus a cell value for process_row
+    return SimpleNamespace(id=row_id, row_number=row_number, name=name)
+
+
+def process_row(modified_row: SimpleNamespace) -> list:
+    return [(modified_row.name, '2024-01-01', None)]
+
+
+def stored(*names: str) -> list:
+    # [(ROW ID, [EVENTS])] for rows 1, 2, 3... holding the given event names
+    return [(row_id, [(name, '2024-01-01', None)]) for row_id, name in enumerate(names, start=1)]
+
+
+def column(column_id: int, title: str, column_type: str = 'TEXT_NUMBER', hidden: bool = False) -> SimpleNamespace:
+    return SimpleNamespace(id=column_id, title=title, type=column_type, hidden=hidden)
+
+
+class MergeRowsTest(unittest.TestCase):
+    def test_nothing_modified(self):
+        self.assertEqual(merge_rows(stored('a', 'b'), [], 2, process_row), stored('a', 'b'))
+
+    def test_modified_rows_are_reprocessed_in_place(self):
+        merged = merge_rows(stored('a', 'b', 'c'), [row(2, 2, 'B')], 3, process_row)
+        self.assertEqual(merged, stored('a', 'B', 'c'))
+
+    def test_new_rows_fill_their_row_numbers(self):
+        merged = merge_rows(stored('a', 'b'), [row(7, 2, 'new'), row(8, 4, 'last')], 4, process_row)
+        self.assertEqual([row_id for row_id, _ in merged], [1, 7, 2, 8])
+        self.assertEqual([events[0][0] for _, events in merged], ['a', 'new', 'b', 'last'])
+
+    def test_moved_rows_keep_the_others_in_order(self):
+        # a row that was moved comes back as modified, at its new row number
+        merged = merge_rows(stored('a', 'b', 'c', 'd'), [row(1, 3, 'a')], 4, process_row)
+        self.assertEqual([row_id for row_id, _ in merged], [2, 3, 1, 4])
+
+    def test_deleted_rows_need_a_full_fetch(self):
+        self.assertIsNone(merge_rows(stored('a', 'b', 'c'), [], 2, process_row))
+        self.assertIsNone(merge_rows(stored('a', 'b', 'c'), [row(2, 1, 'B'), row(9, 2, 'new')], 3, process_row))
+
+    def test_only_modified_rows_are_processed(self):
+        processed = []
+        merge_rows(stored('a', 'b', 'c'), [row(3, 3, 'C')], 3, lambda modified: processed.append(modified.id) or [])
+        self.assertEqual(processed, [3])
+
+
+class SignatureTest(unittest.TestCase):
+    columns = [column(1, 'Event Name'), column(2, 'Event Start Date', 'DATE')]
+
+    def test_same_columns_same_signature(self):
+        self.assertEqual(column_signature(self.columns), column_signature(list(self.columns)))
+
+    def test_column_changes_change_the_signature(self):
+        signature = column_signature(self.columns)
+        for changed in ([column(1, 'Event Name'), column(2, 'Event Start Date', 'TEXT_NUMBER')],
+                        [column(1, 'Event Name'), column(2, 'Event Start Date', 'DATE', hidden=True)],
+                        [column(1, 'Event'), column(2, 'Event Start Date', 'DATE')],
+                        self.columns[:1]):
+            self.assertNotEqual(column_signature(changed), signature)
+
+    def test_replacement_rules_change_the_signature(self):
+        signature = column_signature(self.columns)
+        with mock.patch.dict(get_settings(), {'event_name_replacements': [('Cisco Live', 'CiscoLIVE')]}):
+            self.assertNotEqual(column_signature(self.columns), signature)
+            self.assertFalse(same_processor(signature))
+        self.assertTrue(same_processor(signature))
+
+    def test_signatures_from_before_the_rules_were_stored_dont_match(self):
+        self.assertFalse(same_processor('[[1, "Event Name", "TEXT_NUMBER", false]]'))
+
+
+class StubSheets:
+    """The Sheets API of a client for one sheet with an Event Name column
+    Records the calls made to it. A page of a get_sheet fetch past the
+    first one bumps the version while changes_mid_fetch is above 0, as
+    if the sheet had been edited between the two page requests.
+    """
+
+    def __init__(self, *names: str):
+        self.version = 1
+        self.columns = [smartsheet.models.Column({'id': 1, 'title': 'Event Name', 'type': 'TEXT_NUMBER'})]
+        self.rows = [SimpleNamespace(id=row_id, name=name, modified_at=LONG_AGO)
+                     for row_id, name in enumerate(names, start=101)]
+        self.changes_mid_fetch = 0
+        self.calls = []
+
+    def edit(self, index: int, name: str, modified_at: str) -> None:
+        self.rows[index].name, self.rows[index].modified_at = name, modified_at
+        self.version += 1
+
+    def delete(self, index: int) -> None:
+        del self.rows[index]
+        self.version += 1
+
+    def get_sheet_version(self, sheet_id: int) -> SimpleNamespace:
+        self.calls.append('get_sheet_version')
+        return SimpleNamespace(version=self.version)
+
+    def get_columns(self, sheet_id: int, include_all: bool = False) -> SimpleNamespace:
+        self.calls.append('get_columns')
+        return SimpleNamespace(data=self.columns)
+
+    def get_sheet(self, sheet_id: int, column_ids: list = None, rows_modified_since: str = None,
+                  page_size: int = None, page: int = 1) -> SimpleNamespace:
+        self.calls.append(('get_sheet', rows_modified_since, page))
+        if page > 1 and self.changes_mid_fetch:
+            self.changes_mid_fetch -= 1
+            self.version += 1
+        rows = [row(stored.id, number, stored.name) for number, stored in enumerate(self.rows, start=1)
+                if rows_modified_since is None or stored.modified_at >= rows_modified_since]
+        if page_size:
+            rows = rows[(page - 1) * page_size:page * page_size]
+        return SimpleNamespace(version=self.version, total_row_count=len(self.rows), columns=self.columns, rows=rows)
+
+
+def row_processor(columns: list):
+    return process_row
+
+
+class IncrementalEventsTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        clear_columns()
+        self.addCleanup(clear_columns)
+        for patcher in (mock.patch.object(sync_state, 'SYNC_STATE_FILE', os.path.join(workdir.name, 'sync.db')),
+                        mock.patch.object(sheet_fetch, 'SCHEMA_CACHE_FILE', os.path.join(workdir.name, 'schema.db')),
+                        mock.patch.object(sync_state, 'datetime', mock.Mock(now=mock.Mock(return_value=NOW))),
+                        mock.patch.dict(get_settings(), {'incremental_sync': True, 'schema_cache': False,
+                                                         'fetch_page_size': 2})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sheets = StubSheets('a', 'b', 'c')
+        self.smart = SimpleNamespace(Sheets=self.sheets)
+
+    def events(self) -> list:
+        self.sheets.calls.clear()
+        return [event.name for event in incremental_events(self.smart, 'test', 1, row_processor)]
+
+    def test_first_sync_fetches_every_page(self):
+        self.assertEqual(self.events(), ['a', 'b', 'c'])
+        self.assertEqual(self.sheets.calls, ['get_sheet_version', 'get_columns',
+                                             ('get_sheet', None, 1), ('get_sheet', None, 2)])
+
+    def test_unchanged_version_fetches_no_rows(self):
+        self.events()
+        clear_columns()
+        self.assertEqual(self.events(), ['a', 'b', 'c'])
+        self.assertEqual(self.sheets.calls, ['get_sheet_version'])
+
+    def test_modified_rows_are_fetched_since_the_last_sync_less_the_clock_skew(self):
+        self.events()
+        # modified on the server's clock before the last sync's, but after it less CLOCK_SKEW
+        self.sheets.edit(1, 'B', '2024-05-01T11:58:00Z')
+        self.assertEqual(self.events(), ['a', 'B', 'c'])
+        self.assertEqual(self.sheets.calls, ['get_sheet_version', ('get_sheet', '2024-05-01T11:55:00Z', 1)])
+        self.assertEqual(sync_state.load_state('test', 1)[0], self.sheets.version)
+
+    def test_deleted_rows_fall_back_to_a_full_fetch(self):
+        self.events()
+        self.sheets.delete(1)
+        self.assertEqual(self.events(), ['a', 'c'])
+        self.assertEqual(self.sheets.calls, ['get_sheet_version', ('get_sheet', '2024-05-01T11:55:00Z', 1),
+                                             ('get_sheet', None, 1)])  # the two rows left fit in one page
+
+    def test_a_sheet_changed_mid_fetch_is_fetched_again(self):
+        self.sheets.changes_mid_fetch = sync_state.FETCH_ATTEMPTS - 1
+        self.assertEqual(self.events(), ['a', 'b', 'c'])
+        self.assertEqual(self.sheets.calls.count(('get_sheet', None, 1)), sync_state.FETCH_ATTEMPTS)
+        self.assertEqual(sync_state.load_state('test', 1)[0], self.sheets.version)
+
+    def test_a_sheet_that_keeps_changing_mid_fetch_gives_up(self):
+        self.sheets.changes_mid_fetch = sync_state.FETCH_ATTEMPTS
+        with self.assertRaises(SheetChangedError):
+            self.events()
+        self.assertEqual(self.sheets.calls.count(('get_sheet', None, 1)), sync_state.FETCH_ATTEMPTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
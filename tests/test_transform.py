@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+import smartsheet
+
+from bench.fake_smartsheet import FakeSmartsheet
+from bench.synthetic import generate_sheets
+from intake_calendar import intake_columns, intake_row_processor
+from map_calendar import map_columns, map_row_processor
+from transform import transform_pool, transform_rows
+from utils import assign_colors
+
+CHUNK_ROWS = 70
+PROCESSES = 2
+
+
+def sdk_rows(api, sheet_id: int, column_selector) -> tuple:
+    # returns (columns, rows) as a fetch of the pipeline's columns would give them
+    columns = [smartsheet.models.Column(column) for column in api.get_columns(sheet_id, {})['data']]
+    wanted = ','.join(str(column.id) for column in column_selector(columns))
+    sheet = smartsheet.models.Sheet(api.get_sheet(sheet_id, {'columnIds': wanted}))
+    return list(sheet.columns), list(sheet.rows)
+
+
+class TransformRowsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api = FakeSmartsheet()
+        cls.sheet_ids = generate_sheets(cls.api, map=300, intake=300, request=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        transform_pool(PROCESSES).shutdown()
+        transform_pool.cache_clear()
+
+    def assert_same_on_the_pool(self, sheet_id: int, column_selector, row_processor) -> None:
+        columns, rows = sdk_rows(self.api, sheet_id, column_selector)
+        self.assertNotEqual(len(rows) % CHUNK_ROWS, 0)  # so there's a partial last chunk
+        process_row = row_processor(columns)
+        serial = transform_rows(process_row, rows, processes=0)
+        pooled = transform_rows(process_row, rows, processes=PROCESSES, chunk_rows=CHUNK_ROWS)
+        self.assertEqual(pooled, serial)
+        self.assertEqual(assign_colors(events for _, events in pooled), assign_colors(events for _, events in serial))
+        self.assertTrue(any(events for _, events in serial))
+
+    def test_map_rows(self):
+        self.assert_same_on_the_pool(self.sheet_ids['map source'], map_columns, map_row_processor)
+
+    def test_intake_rows(self):
+        self.assert_same_on_the_pool(self.sheet_ids['intake source'], intake_columns, intake_row_processor)
+
+    def test_rows_that_fit_in_one_chunk_stay_here(self):
+        columns, rows = sdk_rows(self.api, self.sheet_ids['intake source'], intake_columns)
+        process_row = intake_row_processor(columns)
+        with mock.patch('transform.transform_pool') as pool:
+            self.assertEqual(transform_rows(process_row, rows[:CHUNK_ROWS - 1], PROCESSES, CHUNK_ROWS),
+                             transform_rows(process_row, rows[:CHUNK_ROWS - 1], processes=0))
+        pool.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
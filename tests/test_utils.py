@@ -0,0 +1,150 @@
+import time
+import unittest
+from itertools import product
+from types import SimpleNamespace
+from unittest import mock
+
+import smartsheet
+
+from settings import DEFAULTS, get_settings
+from utils import MAX_ROWS_PER_REQUEST, CalendarEvent, event_name_rewriter, plan_sync, send_event_rows
+
+COLUMNS = [{'id': 11, 'title': 'Event Name'}, {'id': 12, 'title': 'Date'}, {'id': 13, 'title': 'End Date'}]
+
+
+def calendar_sheet(rows: list) -> smartsheet.models.Sheet:
+    # rows is [(ROW ID, CalendarEvent)], as they would come back from get_sheet(include=['format'])
+    return smartsheet.models.Sheet({
+        'id': 1,
+        'columns': COLUMNS,
+        'rows': [{'id': row_id,
+                  'format': f',,,,,,,,,{event.color},{event.color},,,,,,',
+                  'cells': [{'columnId': column['id'], 'value': value}
+                            for column, value in zip(COLUMNS, (event.name, event.date, event.end_date))
+                            if value is not None]}
+                 for row_id, event in rows]})
+
+
+class PlanSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.launch = CalendarEvent('Launch', '2024-01-10', '2024-01-12', 5)
+        self.review = CalendarEvent('Review', '2024-02-01', None, 7)
+        self.summit = CalendarEvent('Summit', '2024-03-05', '2024-03-08', 9)
+
+    def test_identical_rows_are_left_alone(self):
+        sheet = calendar_sheet([(1, self.launch), (2, self.review)])
+        self.assertEqual(plan_sync(sheet, [self.review, self.launch]), ([], {}, []))
+
+    def test_only_adds(self):
+        to_add, to_update, to_delete = plan_sync(calendar_sheet([]), [self.launch, self.review])
+        self.assertEqual((to_add, to_update, to_delete), ([self.launch, self.review], {}, []))
+
+    def test_only_deletes(self):
+        sheet = calendar_sheet([(1, self.launch), (2, self.review)])
+        self.assertEqual(plan_sync(sheet, []), ([], {}, [1, 2]))
+
+    def test_stale_rows_are_updated_with_missing_events(self):
+        sheet = calendar_sheet([(1, self.launch), (2, self.review)])
+        self.assertEqual(plan_sync(sheet, [self.launch, self.summit]), ([], {2: self.summit}, []))
+
+    def test_leftovers_are_added_or_deleted(self):
+        sheet = calendar_sheet([(1, self.launch), (2, self.review), (3, self.summit)])
+        self.assertEqual(plan_sync(sheet, [CalendarEvent('Offsite', '2024-04-01', None, 5)]),
+                         ([], {1: CalendarEvent('Offsite', '2024-04-01', None, 5)}, [2, 3]))
+        self.assertEqual(plan_sync(calendar_sheet([(1, self.launch)]), [self.review, self.summit]),
+                         ([self.summit], {1: self.review}, []))
+
+    def test_a_color_change_is_an_update(self):
+        recolored = CalendarEvent(self.launch.name, self.launch.date, self.launch.end_date, 8)
+        self.assertEqual(plan_sync(calendar_sheet([(1, self.launch)]), [recolored]), ([], {1: recolored}, []))
+
+    def test_duplicate_rows_are_counted(self):
+        sheet = calendar_sheet([(1, self.launch), (2, self.launch), (3, self.launch)])
+        self.assertEqual(plan_sync(sheet, [self.launch, self.launch]), ([], {}, [3]))
+        self.assertEqual(plan_sync(calendar_sheet([(1, self.launch)]), [self.launch, self.launch, self.launch]),
+                         ([self.launch, self.launch], {}, []))
+
+    def test_unwritable_events_are_ignored(self):
+        unnamed = CalendarEvent('', '2024-01-10', None, 5)
+        undated = CalendarEvent('Launch', None, None, 5)
+        sheet = calendar_sheet([(1, self.launch)])
+        self.assertEqual(plan_sync(sheet, [self.launch, unnamed, undated]), ([], {}, []))
+
+
+class SendEventRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.sheet = SimpleNamespace(id=1, columns=[SimpleNamespace(id=column['id']) for column in COLUMNS])
+        self.events = [CalendarEvent(f'Event {number}', '2024-01-10', None, 5)
+                       for number in range(2 * MAX_ROWS_PER_REQUEST + 1)]
+        self.sent = []  # ('start' or 'end', the name of the chunk's first row) as each request starts and ends
+
+    def send(self, path: str, payload) -> None:
+        first = payload.serialize()[0]['cells'][0]['value']
+        self.sent.append(('start', first))
+        time.sleep(0.05 if first == 'Event 0' else 0)  # the first chunk is the slowest
+        self.sent.append(('end', first))
+
+    def test_new_rows_are_added_in_order(self):
+        smart = SimpleNamespace(Passthrough=SimpleNamespace(post=self.send))
+        send_event_rows(smart, 'post', self.sheet, [(None, event) for event in self.events])
+        firsts = [f'Event {number}' for number in range(0, len(self.events), MAX_ROWS_PER_REQUEST)]
+        self.assertEqual(self.sent, [(step, first) for first in firsts for step in ('start', 'end')])
+
+    def test_updates_are_sent_together(self):
+        smart = SimpleNamespace(Passthrough=SimpleNamespace(put=self.send))
+        send_event_rows(smart, 'put', self.sheet, list(enumerate(self.events, start=1)))
+        self.assertEqual(len(self.sent), 6)
+        self.assertEqual(self.sent[-1], ('end', 'Event 0'))  # still going while the others were sent
+
+
+def replace_one_by_one(replacements: list, event: str) -> str:
+    # how event names were rewritten before event_name_rewriter
+    for original, new in replacements:
+        event = event.replace(original, new)
+    return event
+
+
+class EventNameRewriterTest(unittest.TestCase):
+    def setUp(self):
+        get_settings.cache_clear()
+        event_name_rewriter.cache_clear()
+        self.addCleanup(event_name_rewriter.cache_clear)
+        self.addCleanup(get_settings.cache_clear)
+
+    def rewriter(self, replacements: list):
+        event_name_rewriter.cache_clear()
+        with mock.patch.dict(get_settings(), {'event_name_replacements': replacements}):
+            return event_name_rewriter()
+
+    def test_the_default_replacements_match_replacing_one_by_one(self):
+        replacements = DEFAULTS['event_name_replacements']
+        rewrite = self.rewriter(replacements)
+        pieces = [original for original, _ in replacements] + [' ', 'Live', 'Roadshow ', '2024']
+        for count in (1, 2, 3):
+            for name in map(''.join, product(pieces, repeat=count)):
+                self.assertEqual(rewrite(name), replace_one_by_one(replacements, name), name)
+
+    def test_overlapping_originals(self):
+        replacements = [('Cisco Live', 'CL'), ('Cisco ', ''), ('Dates', ''), ('Date', ''), ('Date', 'D')]
+        rewrite = self.rewriter(replacements)
+        for name in ('Cisco Live Dates', 'Cisco Cisco Live', 'Date Dates Datess', 'Cisco Lives'):
+            self.assertEqual(rewrite(name), replace_one_by_one(replacements, name), name)
+        self.assertEqual(rewrite('Cisco Live Dates'), 'CL ')
+
+    def test_replaced_text_is_not_scanned_again(self):
+        chained = [('Cisco Live', 'CL'), ('CL', 'Cisco Live EMEA')]
+        self.assertEqual(self.rewriter(chained)('Cisco Live'), 'CL')
+        self.assertEqual(replace_one_by_one(chained, 'Cisco Live'), 'Cisco Live EMEA')
+
+        replacements = DEFAULTS['event_name_replacements']
+        self.assertEqual(self.rewriter(replacements)('DateCisco (s)'), '(s)')
+        self.assertEqual(replace_one_by_one(replacements, 'DateCisco (s)'), '')
+
+    def test_the_leftmost_match_wins(self):
+        replacements = [('Live', 'L'), ('Cisco Live', 'CL')]
+        self.assertEqual(self.rewriter(replacements)('Cisco Live'), 'CL')
+        self.assertEqual(replace_one_by_one(replacements, 'Cisco Live'), 'Cisco L')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Turning source rows into events, optionally on a pool of worker processes
+
+A RowTransform is a row processor split in two: reading the values it
+needs out of each SDK row, which stays in this process, and turning
+those plain values into events, which is picklable. Shipping SDK rows
+to another process costs far more than processing them, so only the
+values cross over.
+
+With the transform_processes setting above 0, transform_rows hands
+chunks of transform_chunk_rows rows' values to a pool of that many
+processes while the rest of the sheet is still being read. Results come
+back in sheet order, so colors (assigned afterwards from the ordered
+events) are the same as with the serial path. Sheets that fit in one
+chunk are always processed here.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+from instrumentation import pipeline_logger
+from settings import get_settings
+
+
+class RowTransform:
+    def __init__(self, values, events):
+        self.values = values  # SDK row -> tuple of plain values
+        self.events = events  # tuple of plain values -> [(name, start, end)]; must be picklable
+
+    def __call__(self, row) -> list:
+        return self.events(self.values(row))
+
+
+@lru_cache(maxsize=None)
+def transform_pool(processes: int) -> ProcessPoolExecutor:
+    # spawned rather than forked: the pipelines' threads may be holding locks (logging, the connection pool)
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def transform_chunk(events, chunk: list) -> list:
+    return [events(values) for values in chunk]
+
+
+def transform_rows(process_row, rows, processes: int = None, chunk_rows: int = None) -> list:
+    """Runs process_row over rows (any iterable, e.g. SheetPages)
+    processes and chunk_rows default to the transform_processes and
+    transform_chunk_rows settings. Row processors that aren't a
+    RowTransform always run here.
+    Returns [(ROW ID, EVENTS)] in row order.
+    """
+    settings = get_settings()
+    processes = settings['transform_processes'] if processes is None else processes
+    chunk_rows = chunk_rows or settings['transform_chunk_rows']
+    if not processes or not isinstance(process_row, RowTransform):
+        return [(row.id, process_row(row)) for row in rows]
+
+    rows = iter(rows)
+    row_ids, pending = [], []
+    while chunk := list(islice(rows, chunk_rows)):
+        if not pending and len(chunk) < chunk_rows:  # one chunk is all there is; not worth a trip to the pool
+            return [(row.id, process_row(row)) for row in chunk]
+        row_ids.extend(row.id for row in chunk)
+        pending.append(transform_pool(processes).submit(
+            transform_chunk, process_row.events, [process_row.values(row) for row in chunk]))
+    pipeline_logger().debug(f"transformed {len(row_ids)} rows in {len(pending)} chunks on {processes} processes")
+    return list(zip(row_ids, (events for future in pending for events in future.result())))
@@ -1,8 +1,13 @@
-import logging
+import re
+from collections import Counter
+from functools import lru_cache, partial
+from itertools import cycle
 
 import smartsheet
 
-logger = logging.getLogger('main')
+from async_api import run_concurrently, run_in_order
+from instrumentation import pipeline_logger
+from settings import get_settings
 
 COLORS = [
     "none",
@@ -50,88 +55,252 @@ COLORS = [
 ]
 COLOR_INDEX = list(range(len(COLORS))[4:])
 
+MAX_ROWS_PER_REQUEST = 500  # rows per add_rows/update_rows call, keeps each payload well under the API's size limit
+
+
+class CalendarEvent:
+    """One calendar row: an event's name, start and end dates, and its background color
+    Unpacks like a (name, date, end_date, color) tuple. Two events are
+    equal if they would make the same calendar row (see event_key).
+    """
+    __slots__ = ('name', 'date', 'end_date', 'color')
+
+    def __init__(self, name: str, date: str, end_date: str, color: int):
+        self.name = name
+        self.date = date
+        self.end_date = end_date
+        self.color = color
+
+    def __iter__(self):
+        return iter((self.name, self.date, self.end_date, self.color))
+
+    def __repr__(self) -> str:
+        return f"CalendarEvent({self.name!r}, {self.date!r}, {self.end_date!r}, {self.color!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CalendarEvent) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def key(self) -> tuple:
+        return event_key(self.name, self.date, self.end_date, self.color)
+
+    def is_writable(self) -> bool:
+        # events without a name or a start date are never written to a calendar
+        return bool(self.name and self.date)
+
+    def row_json(self, column_ids: list, row_id: int = None) -> dict:
+        # the event as an add_rows (or, with a row_id, update_rows) row, in the same JSON the SDK would send
+        name_col, date_col, end_date_col = column_ids
+        row = {'toBottom': True} if row_id is None else {'id': row_id}
+        row['format'] = f",,,,,,,,,{self.color},{self.color},,,,,,"
+        row['cells'] = [{'columnId': name_col, 'value': self.name},
+                        {'columnId': date_col, 'strict': False, 'value': self.date},
+                        {'columnId': end_date_col, 'strict': False, 'value': self.end_date}]
+        for cell in row['cells']:
+            if cell['value'] is None:
+                del cell['value']
+        return row
+
+
+class RowsPayload(smartsheet.models.JSONObject):
+    # a Passthrough payload of plain row dicts; the SDK's own JSONObject only holds a dict or a JSON string
+    def __init__(self, rows: list):
+        super().__init__()
+        self.rows = rows
+
+    def serialize(self) -> list:
+        return self.rows
+
+
+def assign_colors(row_events) -> list:
+    # takes each row's [(name, start, end)] events, in sheet order, and gives every row that has events its own color
+    color_cycle = cycle(COLOR_INDEX)
+    new_cells = []
+    for events in row_events:
+        if events:
+            color = next(color_cycle)
+            new_cells.extend(CalendarEvent(name, start, end, color) for name, start, end in events)
+    return new_cells
+
+
+@lru_cache(maxsize=None)
+def event_name_rewriter():
+    """Compiles the event_name_replacements setting into one regex
+    The (original, new) pairs become a single alternation, so a name is
+    rewritten in one scan; at each position the pairs are tried in the
+    order they're listed, so longer originals should come first. Unlike
+    applying the pairs one after another with str.replace, replaced text
+    is never scanned again: ('A', 'B') then ('B', 'C') turns 'A' into 'B',
+    and text joined up by a removal ('DateCisco (s)' without 'Cisco ')
+    isn't matched as 'Date(s)'. A match further left also wins over a
+    pair listed earlier. For the default pairs the results only differ
+    in the second case.
+    Returns a memoized function from a name to its rewritten name.
+    """
+    replacements = {}
+    for original, new in get_settings()['event_name_replacements']:
+        replacements.setdefault(original, new)
+    pattern = re.compile('|'.join(map(re.escape, replacements)))
+
+    @lru_cache(maxsize=4096)  # the same names and column titles come up over and over
+    def rewrite(event: str) -> str:
+        new_event = pattern.sub(lambda found: replacements[found.group()], event) if replacements else event
+        if new_event != event:
+            pipeline_logger().debug('    replaced %s with: %s', event, new_event)
+        return new_event
+
+    return rewrite
+
 
 def replace_event_names(event: str) -> str:
-    replacements = [
-        ("Cisco Live", "CL"),
-        ("Cisco ", ""),
-        ("Partner Summit", "PS"),
-        ("Date(s)", ""),
-        ("Date (s)", ""),
-        ("Dates", ""),
-        ("Date", ""),
-    ]
-    for original, new in replacements:
-        if original in event:
-            new_event = event.replace(original, new)
-            logger.debug(
-                f'    found "{original}" in {event}, replaced with "{new}"; result is: {new_event}'
-            )
-            event = new_event
-    return event
-
-
-def clear_rows(smart: smartsheet.Smartsheet, sheet: smartsheet.models.Sheet) -> None:
-    if rows := [row.id for row in sheet.rows]:
-        num_rows = len(rows)
-        logger.debug(f"clearing {num_rows} rows")
-        if num_rows > 100:  # paginate
-            logger.debug("more than 100 rows; clearing 100 at a time")
-            for paginated_rows in [rows[i:i + 100] for i in range(0, num_rows, 100)]:
-                smart.Sheets.delete_rows(sheet_id=sheet.id, ids=paginated_rows)
-                logger.info(f"cleared {len(paginated_rows)} rows of {num_rows} total rows")
-        else:
-            smart.Sheets.delete_rows(sheet_id=sheet.id, ids=rows)
-            logger.info(f"cleared {len(rows)} rows")
-    else:
-        logger.warning("no rows cleared")
+    return event_name_rewriter()(event)
+
+
+def chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def delete_rows(smart: smartsheet.Smartsheet, sheet: smartsheet.models.Sheet, row_ids: list) -> None:
+    # the 100-row pages are deleted concurrently (see async_api)
+    logger = pipeline_logger()
+    num_rows = len(row_ids)
+    if num_rows > 100:  # paginate
+        logger.debug("more than 100 rows; deleting 100 at a time")
+    run_concurrently([partial(smart.Sheets.delete_rows, sheet_id=sheet.id, ids=paginated_rows)
+                      for paginated_rows in chunks(row_ids, 100)])
+    logger.info(f"deleted {num_rows} rows")
 
 
 def write_rows(smart: smartsheet.Smartsheet, sheet: smartsheet.models.Sheet, rows: list) -> None:
-    new_rows = []
-    name_col, date_col, end_date_col = [col.id for col in sheet.columns[:3]]
-    for name, date, end_date, color in rows:
-        if name and date:
-            new_row = smartsheet.models.Row()
-            new_row.to_bottom = True
-            new_row.format = f",,,,,,,,,{color},{color},,,,,,"
-
-            new_cell1 = smartsheet.models.Cell()
-            new_cell1.value = name
-            new_cell1.column_id = name_col
-
-            new_cell2 = smartsheet.models.Cell()
-            new_cell2.strict = False
-            new_cell2.value = date
-            new_cell2.column_id = date_col
-
-            new_cell3 = smartsheet.models.Cell()
-            new_cell3.strict = False
-            new_cell3.value = end_date
-            new_cell3.column_id = end_date_col
-
-            new_row.cells = [new_cell1, new_cell2, new_cell3]
-            new_rows.append(new_row)
+    # rows is a list of CalendarEvents, each added to the bottom of the sheet
+    logger = pipeline_logger()
+    new_rows = [(None, event) for event in rows if event.is_writable()]
     if new_rows:
         logger.debug(f"writing {len(new_rows)} rows")
-        smart.Sheets.add_rows(sheet.id, new_rows)
+        send_event_rows(smart, 'post', sheet, new_rows)
         logger.info(f"wrote {len(new_rows)} rows")
     else:
         logger.warning("no rows written")
 
 
+def update_rows(smart: smartsheet.Smartsheet, sheet: smartsheet.models.Sheet, rows: dict) -> None:
+    # rows is {ROW ID: CalendarEvent}; each existing row is overwritten in place
+    send_event_rows(smart, 'put', sheet, list(rows.items()))
+    if rows:
+        pipeline_logger().info(f"updated {len(rows)} rows")
+
+
+def send_event_rows(smart: smartsheet.Smartsheet, method: str, sheet: smartsheet.models.Sheet, rows: list) -> None:
+    """Sends [(ROW ID or None, CalendarEvent)] to the sheet's rows endpoint
+    The rows go through Passthrough as plain JSON instead of SDK models,
+    in MAX_ROWS_PER_REQUEST chunks; each chunk's JSON is only built when
+    it is about to be sent, so only the chunks being sent are ever in
+    memory. Updates are sent concurrently. New rows go to the bottom of
+    the sheet, so their chunks are sent one after another, to land in
+    the order they're listed.
+    """
+    column_ids = [col.id for col in sheet.columns[:3]]
+    send = getattr(smart.Passthrough, method)
+
+    def send_chunk(chunk: list) -> None:
+        send(f'/sheets/{sheet.id}/rows', RowsPayload([event.row_json(column_ids, row_id) for row_id, event in chunk]))
+
+    calls = [partial(send_chunk, chunk) for chunk in chunks(rows, MAX_ROWS_PER_REQUEST)]
+    if method == 'post':
+        run_in_order(calls)
+    else:
+        run_concurrently(calls)
+
+
 def get_cell_by_column_name(
     row: smartsheet.models.Row, column_name: str, col_map: dict
 ) -> smartsheet.models.Cell:
     return row.get_column(col_map[column_name])  # {NAME: ID}
 
 
-def column_name_to_id_map(columns: list) -> dict:
-    # returns a title:id dict of all columns in sheet
-    return {column.title: column.id for column in columns}
+class RowExtractor:
+    """Reads a fixed list of columns out of each row in one pass
+    The column titles are resolved against the sheet's columns once, to
+    each column's position and id. Rows from the same fetch list their
+    cells in column order, so each cell is read straight from that
+    position; if the cell there belongs to another column (a row fetched
+    with a different set of columns), it is looked up by id instead.
+    """
+
+    def __init__(self, columns: list, titles: list):
+        by_title = {column.title: (position, column.id) for position, column in enumerate(columns)}
+        self.columns = [by_title[title] for title in titles]  # [(POSITION, ID)]
+
+    def cells(self, row: smartsheet.models.Row) -> list:
+        # returns the row's cells for the extractor's columns, in the order their titles were given
+        cells = row.cells
+        found = []
+        for position, column_id in self.columns:
+            cell = cells[position] if position < len(cells) else None
+            if cell is None or cell.column_id != column_id:
+                cell = row.get_column(column_id)
+            found.append(cell)
+        return found
+
+    def values(self, row: smartsheet.models.Row) -> tuple:
+        return tuple(cell.value for cell in self.cells(row))
+
+
+def event_key(name: str, date: str, end_date: str, color) -> tuple:
+    return name, date or "", end_date or "", str(color)
+
+
+def row_event_key(row: smartsheet.models.Row, columns: list) -> tuple:
+    name, date, end_date = [row.get_column(col.id) for col in columns]
+    fields = (row.format or "").split(",")
+    return event_key(name and name.value, date and date.value, end_date and end_date.value,
+                     fields[9] if len(fields) > 9 else "")
+
+
+def plan_sync(cal_sheet: smartsheet.models.Sheet, new_cells: list) -> tuple:
+    """Works out the smallest set of changes that turns cal_sheet into new_cells
+    Rows are matched on (name, start, end, color); matching rows are left
+    alone. Leftover existing rows are reused for leftover new events
+    (an update in place), and whatever is left over after that is
+    deleted or added.
+    Returns (rows to add, {row id: event} to update, row ids to delete).
+    """
+    columns = cal_sheet.columns[:3]
+    wanted = Counter(event.key() for event in new_cells if event.is_writable())
+
+    stale = []
+    for row in cal_sheet.rows:
+        key = row_event_key(row, columns)
+        if wanted[key] > 0:
+            wanted[key] -= 1
+        else:
+            stale.append(row.id)
+
+    missing = []
+    for event in new_cells:
+        key = event.key()
+        if event.is_writable() and wanted[key] > 0:
+            wanted[key] -= 1
+            missing.append(event)
+
+    to_update = dict(zip(stale, missing))
+    return missing[len(to_update):], to_update, stale[len(to_update):]
 
 
-def clear_and_write_sheet(smart: smartsheet.Smartsheet, cal_sheet_id: int, new_cells: list) -> None:
-    cal_sheet = smart.Sheets.get_sheet(cal_sheet_id)
-    clear_rows(smart, cal_sheet)
-    write_rows(smart, cal_sheet, new_cells)
+def sync_sheet(smart: smartsheet.Smartsheet, cal_sheet_id: int, new_cells: list) -> None:
+    # only sends the rows that changed, so the calendar is never empty mid-run. rows updated in place keep
+    # their position and new ones are added at the bottom in event order, so only a calendar written from
+    # scratch is in event order throughout. adds and updates touch different rows, so they are sent together;
+    # stale rows go once both are done
+    cal_sheet = smart.Sheets.get_sheet(cal_sheet_id, include=["format"])
+    to_add, to_update, to_delete = plan_sync(cal_sheet, new_cells)
+    pipeline_logger().info(f"{len(cal_sheet.rows) - len(to_update) - len(to_delete)} rows unchanged, "
+                           f"{len(to_add)} to add, {len(to_update)} to update, {len(to_delete)} to delete")
+    writes = [partial(update_rows, smart, cal_sheet, to_update)]
+    if to_add:
+        writes.append(partial(write_rows, smart, cal_sheet, to_add))
+    run_concurrently(writes)
+    if to_delete:
+        delete_rows(smart, cal_sheet, to_delete)